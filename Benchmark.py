@@ -0,0 +1,275 @@
+"""Non-interactive loopback benchmark.
+
+Runs the server and a client through a QuicLinkEmulator for every combination of stream
+count, chunk size and file size, and writes throughput, latency percentiles and CPU cost
+as JSON. Example:
+
+    python Benchmark.py --streams 1,4,16 --chunk-sizes 1000,4000 --file-sizes 1048576 \\
+        --loss 0.01 --delay 0.005 --jitter 0.001 --output results.json
+
+The server compresses the streams of clients that offer zlib, --compression zlib makes the
+client offer it. Random data doesn't compress, --data text serves lowercase letters that do.
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import math
+import os
+import platform
+import random
+import signal
+import string
+import subprocess
+import sys
+import time
+from Events import StreamDataReceived, ConnectionClosed
+from QuicAsync import AsyncQUICProtocol
+from QuicEndpoint import QUICServerEndpoint
+from QuicLinkEmulator import QuicLinkEmulator, LinkProfile
+from QuicFileSource import QuicFileSource
+from QuicSessionTicket import QuicTicketCache
+from Server import serve_file
+
+
+def percentiles(samples: list) -> dict:
+    """Nearest-rank p50/p90/p99 and max of samples, None when there are none."""
+    if not samples:
+        return None
+    ordered = sorted(samples)
+
+    def rank(percent):
+        # The smallest sample with at least percent of the samples at or below it. percent * n / 100 is
+        # exact when it is whole, 0.9 * 70 is not and would round up to the next rank
+        return ordered[max(math.ceil(percent * len(ordered) / 100) - 1, 0)]
+
+    return {'p50': rank(50), 'p90': rank(90), 'p99': rank(99), 'max': ordered[-1]}
+
+
+TEXT_TABLE = bytes(ord(string.ascii_lowercase[byte % 26]) for byte in range(256))  # Maps random bytes to letters
+
+
+def make_file_data(file_size: int, seed: int, data: str = 'random') -> bytes:
+    """The served file, the same bytes for the same seed in every process."""
+    file_data = random.Random(seed).randbytes(file_size)
+    return file_data.translate(TEXT_TABLE) if data == 'text' else file_data
+
+
+async def start_server(file_data: bytes, chunk_size: int, congestion_control: str, scheduler: str):
+    source = QuicFileSource.from_bytes(file_data)
+    endpoint = QUICServerEndpoint(lambda connection: serve_file(connection, source, chunk_size, compress=True),
+                                  congestion_control=congestion_control, scheduler=scheduler)
+    await endpoint.listen('127.0.0.1', 0)
+    return endpoint, endpoint.transport.get_extra_info('sockname')
+
+
+async def serve_forever(port: int, file_size: int, chunk_size: int, seed: int, congestion_control: str,
+                        scheduler: str, data: str):
+    """Entry point of the server subprocess: report the bound port on stdout, then serve until killed."""
+    source = QuicFileSource.from_bytes(make_file_data(file_size, seed, data))
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        endpoint = QUICServerEndpoint(lambda connection: serve_file(connection, source, chunk_size, compress=True),
+                                      congestion_control=congestion_control, scheduler=scheduler)
+        await endpoint.listen('127.0.0.1', port)
+    print(endpoint.transport.get_extra_info('sockname')[1], flush=True)
+    await asyncio.get_running_loop().create_future()
+
+
+def spawn_server(config: dict, chunk_size: int, file_size: int):
+    """Start a server subprocess and return (process, address)."""
+    process = subprocess.Popen(
+        [sys.executable, os.path.abspath(__file__), '--serve', '--port', '0', '--file-sizes', str(file_size),
+         '--chunk-sizes', str(chunk_size), '--seed', str(config['seed']),
+         '--congestion-control', config['congestion_control'], '--scheduler', config['scheduler'],
+         '--data', config['data']],
+        stdout=subprocess.PIPE, text=True)
+    port = int(process.stdout.readline())
+    return process, ('127.0.0.1', port)
+
+
+def stop_server(process) -> float:
+    """Kill a server subprocess and return the CPU seconds it used."""
+    process.send_signal(signal.SIGTERM)
+    _, _, usage = os.wait4(process.pid, 0)
+    process.returncode = -signal.SIGTERM  # Reaped by wait4, keep Popen from waiting again
+    process.stdout.close()
+    return usage.ru_utime + usage.ru_stime
+
+
+async def fetch_ticket(address, ticket_cache: QuicTicketCache, congestion_control: str):
+    """Connect once without requesting anything, so the measured connection can resume with 0-RTT."""
+    client = AsyncQUICProtocol(is_client=True, congestion_control=congestion_control)
+    await client.connect(*address, ticket_cache)
+    await client.close()
+
+
+async def download(address, num_streams: int, congestion_control: str, ticket_cache: QuicTicketCache = None,
+                   codecs: tuple = ('store',)) -> dict:
+    """Request num_streams streams from address and time every data event.
+
+    With a ticket in ticket_cache the request goes in the first datagram, codecs are offered with the request.
+    """
+    client = AsyncQUICProtocol(is_client=True, congestion_control=congestion_control)
+    client.codecs = codecs
+    start = time.perf_counter()
+    await client.connect(*address, ticket_cache, num_streams)
+    handshake_done = time.perf_counter()
+
+    first_event = await client.recv()
+    connect_to_first_byte = time.perf_counter() - start
+
+    bytes_per_stream = {}
+    first_byte = {}
+    completion = {}
+    gaps = []
+    last_event_time = handshake_done
+    event = first_event
+    while True:
+        now = time.perf_counter()
+        if isinstance(event, StreamDataReceived):
+            gaps.append(now - last_event_time)
+            last_event_time = now
+            bytes_per_stream[event.stream_id] = bytes_per_stream.get(event.stream_id, 0) + len(event.data)
+            first_byte.setdefault(event.stream_id, now - handshake_done)
+            if event.end_of_stream:
+                completion[event.stream_id] = now - handshake_done
+                if len(completion) == num_streams:
+                    break
+        elif isinstance(event, ConnectionClosed):
+            break  # Counted as incomplete
+        event = await client.recv()
+
+    end = time.perf_counter()
+    await client.close()
+    return {
+        'bytes': sum(bytes_per_stream.values()),
+        'duration': end - handshake_done,
+        'handshake_seconds': handshake_done - start,
+        'early_data_accepted': client.early_data_accepted,
+        'connect_to_first_byte': connect_to_first_byte,  # From the connect() call, covers the handshake too
+        'time_to_first_byte': percentiles(list(first_byte.values())),
+        'stream_completion': percentiles(list(completion.values())),
+        'event_gap': percentiles(gaps),
+    }
+
+
+async def run_once(config: dict, num_streams: int, chunk_size: int, file_size: int, file_data: bytes) -> dict:
+    """One measurement: fresh server, fresh emulated link, one client."""
+    result = {'streams': num_streams, 'chunk_size': chunk_size, 'file_size': file_size}
+    process = endpoint = None
+    cpu_start = time.process_time()
+    if config['subprocess']:
+        process, server_address = spawn_server(config, chunk_size, file_size)
+    else:
+        endpoint, server_address = await start_server(file_data, chunk_size, config['congestion_control'],
+                                                      config['scheduler'])
+
+    link = LinkProfile(config['delay'], config['jitter'], config['loss'], config['reorder'], config['bandwidth'])
+    emulator = QuicLinkEmulator(server_address, uplink=link, downlink=link, seed=config['seed'])
+    proxy_address = await emulator.start()
+
+    try:
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            ticket_cache = None
+            if config['zero_rtt']:
+                ticket_cache = QuicTicketCache()
+                await asyncio.wait_for(fetch_ticket(proxy_address, ticket_cache, config['congestion_control']),
+                                       config['timeout'])
+            codecs = ('store', 'zlib') if config['compression'] == 'zlib' else ('store',)
+            result.update(await asyncio.wait_for(download(proxy_address, num_streams, config['congestion_control'],
+                                                          ticket_cache, codecs), config['timeout']))
+    except asyncio.TimeoutError:
+        result['error'] = 'timeout'
+    finally:
+        cpu_seconds = time.process_time() - cpu_start
+        result['link'] = emulator.get_stats()
+        emulator.close()
+        if process is not None:
+            result['server_cpu_seconds'] = stop_server(process)
+            result['client_cpu_seconds'] = cpu_seconds
+            cpu_seconds += result['server_cpu_seconds']
+        else:
+            await endpoint.close()
+
+    expected = num_streams * file_size
+    result['complete'] = result.get('bytes') == expected
+    result['cpu_seconds'] = cpu_seconds  # Client, server and link emulator together
+    if result.get('bytes'):
+        result['throughput_bytes_per_second'] = result['bytes'] / result['duration']
+        result['cpu_ns_per_byte'] = cpu_seconds * 1e9 / result['bytes']
+    return result
+
+
+async def run_sweep(config: dict) -> list:
+    results = []
+    for file_size in config['file_sizes']:
+        file_data = make_file_data(file_size, config['seed'], config['data'])
+        for num_streams in config['streams']:
+            for chunk_size in config['chunk_sizes']:
+                for repeat in range(config['repeat']):
+                    result = await run_once(config, num_streams, chunk_size, file_size, file_data)
+                    result['repeat'] = repeat
+                    results.append(result)
+                    print(f"streams={num_streams} chunk={chunk_size} file={file_size} repeat={repeat}: "
+                          f"{result.get('throughput_bytes_per_second', 0) / 1e6:.2f} MB/s"
+                          f"{'' if result['complete'] else ' INCOMPLETE'}", file=sys.stderr)
+    return results
+
+
+def parse_int_list(value: str) -> list:
+    return [int(item) for item in value.split(',')]
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Loopback benchmark over an emulated lossy link.")
+    parser.add_argument('--streams', type=parse_int_list, default=[1, 4], help="Comma separated stream counts")
+    parser.add_argument('--chunk-sizes', type=parse_int_list, default=[1500], help="Comma separated chunk sizes")
+    parser.add_argument('--file-sizes', type=parse_int_list, default=[1024 * 1024],
+                        help="Comma separated file sizes in bytes")
+    parser.add_argument('--repeat', type=int, default=1)
+    parser.add_argument('--delay', type=float, default=0.0, help="One-way delay in seconds")
+    parser.add_argument('--jitter', type=float, default=0.0, help="Extra uniform delay in seconds")
+    parser.add_argument('--loss', type=float, default=0.0, help="Drop probability per datagram")
+    parser.add_argument('--reorder', type=float, default=0.0, help="Reorder probability per datagram")
+    parser.add_argument('--bandwidth', type=float, default=None, help="Link rate in bytes per second")
+    parser.add_argument('--congestion-control', default='newreno')
+    parser.add_argument('--scheduler', default='round_robin')
+    parser.add_argument('--zero-rtt', action='store_true',
+                        help="Resume with a ticket from a previous connection and request in the first datagram")
+    parser.add_argument('--compression', choices=('store', 'zlib'), default='store',
+                        help="Codec the client offers for the streams")
+    parser.add_argument('--data', choices=('random', 'text'), default='random', help="Content of the served file")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--timeout', type=float, default=120.0, help="Seconds before a run is given up")
+    parser.add_argument('--subprocess', action='store_true', help="Run the server in its own process")
+    parser.add_argument('--output', default='benchmark.json')
+    parser.add_argument('--serve', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--port', type=int, default=0, help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.serve:
+        asyncio.run(serve_forever(args.port, args.file_sizes[0], args.chunk_sizes[0], args.seed,
+                                  args.congestion_control, args.scheduler, args.data))
+        return
+
+    config = {key: value for key, value in vars(args).items() if key not in ('serve', 'port', 'output')}
+    started = time.time()
+    results = asyncio.run(run_sweep(config))
+    report = {
+        'started': time.strftime('%Y-%m-%dT%H:%M:%S%z', time.localtime(started)),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'config': config,
+        'results': results,
+    }
+    with open(args.output, 'w') as file:
+        json.dump(report, file, indent=2)
+    print(f"Wrote {len(results)} results to {args.output}", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
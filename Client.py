@@ -1,65 +1,151 @@
 from Quic import QUICProtocol
-from Events import *
+from QuicAsync import AsyncQUICProtocol
+from QuicTrace import QuicTracer, QuicTraceFlusher
+from QuicSessionTicket import QuicTicketCache
+import asyncio
+import os
+import sys
 import time
+from QuicDownloadSink import QuicDownloadSink
+
+
+def print_stream_stats(stream_stats):
+    """Print the per stream and overall statistics of a finished download."""
+    # Calculate statistics for each stream
+    for stream_id, stats in stream_stats.items():
+        end_time = stats.get('end_time', time.time())
+        duration = end_time - stats['start_time']
+        data_rate = stats['bytes_received'] / duration if duration > 0 else 0
+        frame_rate = stats['frames_received'] / duration if duration > 0 else 0
+        print(f"\nStream #{stream_id}:")
+        print(f"\tBytes received: {stats['bytes_received']}")
+        print(f"\tFrames received: {stats['frames_received']}")
+        print(f"\tData rate: {data_rate:.2f} bytes/second")
+        print(f"\tFrame rate: {frame_rate:.2f} frames/second")
+
+    # Calculate overall statistics
+    total_bytes_received = sum(stats['bytes_received'] for stats in stream_stats.values())
+    total_frames_received = sum(stats['frames_received'] for stats in stream_stats.values())
+    total_duration = max(
+        stats.get('end_time', time.time()) - stats['start_time'] for stats in stream_stats.values())
+    average_data_rate = total_bytes_received / total_duration if total_duration > 0 else 0
+    average_frame_rate = total_frames_received / total_duration if total_duration > 0 else 0
+
+    print("\nOverall statistics:")
+    print(f"\tTotal bytes received: {total_bytes_received}")
+    print(f"\tTotal frames received: {total_frames_received}")
+    print(f"\tAverage data rate: {average_data_rate:.2f} bytes/second")
+    print(f"\tAverage frame rate: {average_frame_rate:.2f} frames/second")
+
+
+def open_sinks(client, stream_stats, output_dir):
+    """Write every stream into output_dir/stream-<id>, resuming files an earlier run left unfinished."""
+    sinks = {}
+    os.makedirs(output_dir, exist_ok=True)
+    for stream_id in stream_stats:
+        sinks[stream_id] = QuicDownloadSink(os.path.join(output_dir, f"stream-{stream_id}"))
+        client.set_stream_sink(stream_id, sinks[stream_id])
+    return sinks
+
+
+def close_sinks(sinks, stream_stats):
+    """Close the files and fill in the statistics the sinks kept."""
+    for stream_id, sink in sinks.items():
+        stream_stats[stream_id]['bytes_received'] = sink.bytes_written
+        stream_stats[stream_id]['frames_received'] = sink.writes
+        if sink.finish_time is not None:
+            stream_stats[stream_id]['end_time'] = sink.finish_time
+        sink.close()
 
 
 #
-def run_client(host='127.0.0.1', port=4433):
+def run_client(host='127.0.0.1', port=4433, qlog_path=None, output_dir=None, ticket_path=None, compress=False):
     num_streams = int(input("Enter the number of streams: "))
 
-    client = QUICProtocol(is_client=True)
-    client.connect(host, port)
+    flusher = QuicTraceFlusher() if qlog_path else None
+    tracer = flusher.add(QuicTracer('client', qlog_path)) if flusher is not None else None
 
-    client.send_stream_request(num_streams)
+    client = QUICProtocol(is_client=True, tracer=tracer)
+    if compress:
+        client.codecs = ('store', 'zlib')  # The server decides which streams it compresses
 
     # Dictionary to hold statistics for each stream
     stream_stats = {stream_id: {'bytes_received': 0, 'frames_received': 0, 'start_time': time.time()} for stream_id in
                     range(1, num_streams + 1)}
 
-    while True:
+    def on_stream_data(stats, data, end_of_stream):
+        stats['bytes_received'] += len(data)
+        stats['frames_received'] += 1
+        if end_of_stream:
+            stats['end_time'] = time.time()
+
+    # Count the data of every stream as it arrives, nothing is queued for later, or write it to disk
+    sinks = open_sinks(client, stream_stats, output_dir) if output_dir else {}
+    for stream_id, stats in stream_stats.items():
+        if stream_id not in sinks:
+            client.set_stream_callback(stream_id, lambda data, end_of_stream, stats=stats:
+                                       on_stream_data(stats, data, end_of_stream))
+
+    # With a ticket from an earlier connection the request goes in the first datagram, so the streams
+    # are set up before connecting
+    client.connect(host, port, QuicTicketCache(ticket_path) if ticket_path else None, num_streams)
+
+    while len(client.fin_streams) < num_streams and not client.peer_closed:
         client.recv()  # Process incoming packets
 
-        while not client.events.empty():
-            event = client.events.get()
-            if isinstance(event, StreamDataReceived):
-                stream_id = event.stream_id
-                stream_stats[stream_id]['bytes_received'] += len(event.data)
-                stream_stats[stream_id]['frames_received'] += 1
-
-                if event.end_of_stream:
-                    stream_stats[stream_id]['end_time'] = time.time()
-
-        if len(client.fin_streams) >= num_streams:
-            # Calculate statistics for each stream
-            for stream_id, stats in stream_stats.items():
-                end_time = stats.get('end_time', time.time())
-                duration = end_time - stats['start_time']
-                data_rate = stats['bytes_received'] / duration if duration > 0 else 0
-                frame_rate = stats['frames_received'] / duration if duration > 0 else 0
-                print(f"\nStream #{stream_id}:")
-                print(f"\tBytes received: {stats['bytes_received']}")
-                print(f"\tFrames received: {stats['frames_received']}")
-                print(f"\tData rate: {data_rate:.2f} bytes/second")
-                print(f"\tFrame rate: {frame_rate:.2f} frames/second")
-
-            # Calculate overall statistics
-            total_bytes_received = sum(stats['bytes_received'] for stats in stream_stats.values())
-            total_frames_received = sum(stats['frames_received'] for stats in stream_stats.values())
-            total_duration = max(
-                stats.get('end_time', time.time()) - stats['start_time'] for stats in stream_stats.values())
-            average_data_rate = total_bytes_received / total_duration if total_duration > 0 else 0
-            average_frame_rate = total_frames_received / total_duration if total_duration > 0 else 0
-
-            print("\nOverall statistics:")
-            print(f"\tTotal bytes received: {total_bytes_received}")
-            print(f"\tTotal frames received: {total_frames_received}")
-            print(f"\tAverage data rate: {average_data_rate:.2f} bytes/second")
-            print(f"\tAverage frame rate: {average_frame_rate:.2f} frames/second")
-
-            break  # Exit if all streams are finished
+    close_sinks(sinks, stream_stats)
+    print_stream_stats(stream_stats)
 
     client.close()
+    if flusher is not None:
+        flusher.stop()
+
+
+async def run_client_async(host='127.0.0.1', port=4433, num_streams=None, qlog_path=None, output_dir=None,
+                           ticket_path=None, compress=False):
+    if num_streams is None:
+        num_streams = int(input("Enter the number of streams: "))
+
+    flusher = QuicTraceFlusher() if qlog_path else None
+    tracer = flusher.add(QuicTracer('client', qlog_path)) if flusher is not None else None
+
+    client = AsyncQUICProtocol(is_client=True, tracer=tracer)
+    if compress:
+        client.codecs = ('store', 'zlib')
+
+    stream_stats = {stream_id: {'bytes_received': 0, 'frames_received': 0, 'start_time': time.time()} for stream_id in
+                    range(1, num_streams + 1)}
+
+    async def read_stream(reader, stats):
+        async for chunk in reader:
+            stats['bytes_received'] += len(chunk)
+            stats['frames_received'] += 1
+        stats['end_time'] = time.time()
+
+    # One reader per stream, a stream that is read slowly only holds back itself, or write them to disk
+    sinks = open_sinks(client, stream_stats, output_dir) if output_dir else {}
+    readers = [read_stream(client.get_reader(stream_id), stats) for stream_id, stats in stream_stats.items()
+               if stream_id not in sinks]
+    await client.connect(host, port, QuicTicketCache(ticket_path) if ticket_path else None, num_streams)
+    await asyncio.gather(*readers)
+    while len(client.fin_streams) < num_streams and not client.peer_closed:
+        client.progress.clear()
+        await client.progress.wait()
+
+    close_sinks(sinks, stream_stats)
+    print_stream_stats(stream_stats)
+    await client.close()
+    if flusher is not None:
+        flusher.stop()
 
 
 if __name__ == '__main__':
-    run_client()
+    qlog_path = sys.argv[sys.argv.index('--qlog') + 1] if '--qlog' in sys.argv else None
+    output_dir = sys.argv[sys.argv.index('--output') + 1] if '--output' in sys.argv else None
+    ticket_path = sys.argv[sys.argv.index('--tickets') + 1] if '--tickets' in sys.argv else None
+    compress = '--compression' in sys.argv
+    if '--async' in sys.argv:
+        asyncio.run(run_client_async(qlog_path=qlog_path, output_dir=output_dir, ticket_path=ticket_path,
+                                     compress=compress))
+    else:
+        run_client(qlog_path=qlog_path, output_dir=output_dir, ticket_path=ticket_path, compress=compress)
@@ -3,15 +3,21 @@ class Event:
     pass
 
 class StreamDataReceived(Event):
-    def __init__(self, stream_id, data, end_of_stream):
+    def __init__(self, stream_id, data, end_of_stream, wire_size=None):
         self.stream_id = stream_id
         self.data = data
         self.end_of_stream = end_of_stream
+        self.wire_size = wire_size  # Bytes the data took on the wire if the stream is compressed
 
 class ACKReceived(Event):
     def __init__(self, packet_number):
         self.packet_number = packet_number
 
+class ConnectionClosed(Event):
+    """The peer closed the connection or it expired, no more events will follow."""
+    pass
+
 class StreamRequestEvent(Event):
-    def __init__(self, num_streams):
+    def __init__(self, num_streams, codecs=('store',)):
         self.num_streams = num_streams
+        self.codecs = codecs  # Stream codecs the client can decode
@@ -1,9 +1,20 @@
 import socket
 import random
-from QuicPacket import QUICPacket
-from QuicPacket import StreamFrame
+import time
+from QuicPacket import QUICPacket, MAX_CONNECTION_ID
+from QuicPacket import StreamFrame, AckFrame, MaxDataFrame, MaxStreamDataFrame, SessionTicketFrame, PaddingFrame
+from QuicAck import QuicAckTracker
 from QuicStream import *
-from queue import Queue
+from QuicFlowControl import *
+from QuicRecovery import QuicLossRecovery
+from QuicCongestion import CONGESTION_CONTROLLERS, TokenBucketPacer
+from QuicIO import create_datagram_io
+from QuicPacketizer import QuicPacketizer
+from QuicScheduler import SCHEDULERS, DEFAULT_URGENCY, DEFAULT_WEIGHT
+from QuicCompression import QuicStreamCompressor, QuicStreamDecompressor, DEFAULT_COMPRESSION_LEVEL
+from QuicCompression import encode_codecs, decode_codecs
+from collections import deque
+from queue import SimpleQueue
 from Events import *
 
 
@@ -14,18 +25,50 @@ class QUICProtocol:
     START_CONNECTION_FLAG = 0b001000
     FIN_FLAG = 0b010000
     FIN_ACK_FLAG = 0b100000
+    AMPLIFICATION_FACTOR = 3  # Bytes sent to an address not validated yet, per byte received from it
 
-    def __init__(self, is_client: bool):
+    reader_class = QuicStreamReader  # Created by get_reader()
+
+    def __init__(self, is_client: bool, window_size: int = 32, congestion_control: str = 'newreno',
+                 max_datagram_size: int = 1200, scheduler: str = 'round_robin', tracer=None):
         self.is_client = is_client
-        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.socket = self.create_socket()
+        # Batched socket I/O
+        self.io = create_datagram_io(self.socket, on_send_error=self.on_socket_error) if self.socket else None
+        self.received_datagrams = deque()  # Datagrams read in the last batch and not handled yet
         self.address = None  # This will be set later based on client/server role
         self.connection_id = None  # Connection ID to be set upon connection
-        self.stream_frame_queue = Queue()
+        # Stream frames waiting to be packed into packets, the scheduler picks the stream for each packet
+        self.packetizer = QuicPacketizer(max_datagram_size, SCHEDULERS[scheduler]())
+        self.max_send_backlog = 64 * 1024  # Queued bytes send() leaves for the scheduler before it blocks
         self.streams = {}  # Tracks streams by their ID
-        self.events = Queue()  # Queue for stream data recieved events
+        self.events = SimpleQueue()  # Stream requests, and the data of streams without a reader
+        self.readers = {}  # Stream ID -> QuicStreamReader, its data bypasses the events queue
+        self.sinks = {}  # Stream ID -> QuicDownloadSink, its data is written to disk as it arrives
         self.packet_number = 0  # Initialize packet number
         self.packets_to_ack = {}  # Packets to ack
+        self.acks = QuicAckTracker()  # Received packet numbers and the delayed ACK timer
+        self.window_size = window_size  # Max number of unacknowledged packets in flight
+        self.recovery = QuicLossRecovery()  # RTT estimation and loss detection for packets_to_ack
+        self.congestion = CONGESTION_CONTROLLERS[congestion_control](max_datagram_size)  # Congestion window
+        self.pacer = TokenBucketPacer()  # Spreads the congestion window over the RTT
+        self.send_credit = QuicSendCredit(INITIAL_CONNECTION_WINDOW)  # Connection level credit from the peer
+        self.receive_window = QuicReceiveWindow(INITIAL_CONNECTION_WINDOW, MAX_CONNECTION_WINDOW)
+        self.max_data_pending = False  # receive_window was raised and the peer hasn't been told yet
+        self.max_stream_data_pending = set()  # Streams whose raised window the peer hasn't been told yet
+        self.peer_closed = False  # Set once the peer sent its FIN
         self.fin_streams = set()  # Tracks streams that have finished sending
+        self.send_buffer = bytearray(65535)  # Reusable encode buffer for outgoing packets
+        self.send_view = memoryview(self.send_buffer)
+        self.tracer = tracer  # QuicTracer collecting metrics and qlog events, None to skip tracing
+        self.early_data_accepted = False  # The stream request of the client's first datagram was served (0-RTT)
+        self.amplification_credit = None  # Bytes left to send before the peer's address is validated, None once it is
+        self.codecs = ('store',)  # Stream codecs a client offers in its stream request, see QuicCompression
+        self.peer_codecs = ('store',)  # Stream codecs the client's stream request offered
+        self.stream_request_received = False  # Resent requests are acknowledged again but served once
+
+    def create_socket(self):
+        return socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
 
     def bind(self, host: str, port: int):
         """Bind the socket to a specific address and port if acting as a server."""
@@ -33,90 +76,245 @@ class QUICProtocol:
             raise ValueError("Clients cannot bind to a specific address and port.")
         self.socket.bind((host, port))
 
-    def connect(self, host: str, port: int):
-        """Set the address for the server if acting as a client and store the connection ID."""
+    def connect(self, host: str, port: int, ticket_cache=None, num_streams: int = None):
+        """Set the address for the server if acting as a client and store the connection ID.
+
+        With num_streams, the streams are requested as well: in the first datagram (0-RTT) when
+        ticket_cache, a QuicTicketCache, holds a ticket of the server, else once the handshake is
+        done. Tickets the server hands out are stored in ticket_cache.
+        """
         if not self.is_client:
             raise ValueError("Servers cannot connect to a specific address and port.")
         self.address = (host, port)
 
-        # Send the start connection packet with START_CONNECTION_FLAG
+        # Send the start connection packet with START_CONNECTION_FLAG, again after every probe timeout
+        start_packet = self.build_start_packet(ticket_cache, num_streams)
+        for _ in range(self.recovery.MAX_PTO_COUNT):
+            self.send_packet(start_packet)
+            response_packet = self.wait_for_start_response(self.recovery.get_pto())
+            if response_packet is not None:
+                break
+            self.recovery.pto_count += 1  # Back off, the server or the path may just be slow
+        else:
+            print("Failed to establish connection: no response from the server.")
+            return
+        self.recovery.pto_count = 0
+
+        # Update the connection ID
+        self.on_start_response(response_packet, ticket_cache)
+        self.on_connected(response_packet, num_streams)
+
+    def wait_for_start_response(self, timeout: float):
+        """Return the server's START packet, or None if it doesn't arrive within timeout seconds.
+
+        Data sent behind an accepted early request may overtake it and is dropped, the server retransmits it.
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            self.socket.settimeout(remaining)
+            try:
+                data, addr = self.next_datagram()
+            except socket.timeout:
+                return None
+            finally:
+                self.socket.settimeout(None)
+            try:
+                packet = QUICPacket.deserialize(data)
+            except Exception as e:
+                if self.tracer is not None:
+                    self.tracer.packet_dropped('invalid_packet', error=str(e))
+                continue
+            if addr == self.address and packet.flags & self.START_CONNECTION_FLAG:
+                return packet
+
+    @classmethod
+    def legacy_rejection(cls, packet: QUICPacket):
+        """The answer to a packet of the fixed-width format: a FIN in that format for a START, else None.
+
+        Clients of that format take any answer to their START other than a START as a failed
+        connection, so they give up instead of waiting. Nothing else is answered, so two
+        peers cannot keep rejecting each other.
+        """
+        if packet.flags != cls.START_CONNECTION_FLAG:
+            return None
+        return QUICPacket(cls.FIN_FLAG, packet.connection_id, packet.packet_number, []).serialize_legacy()
+
+    def build_start_packet(self, ticket_cache, num_streams: int) -> QUICPacket:
+        """The client's first packet, carrying the stream request too when the server gave us a ticket."""
         start_packet = QUICPacket(
             flags=self.START_CONNECTION_FLAG,
             connection_id=0,  # No connection ID yet
             packet_number=self.packet_number,
             frames=[]
         )
-        self.socket.sendto(start_packet.serialize(), self.address)
+        ticket = ticket_cache.take(self.address) if ticket_cache is not None and num_streams is not None else None
+        if ticket is not None:
+            start_packet.flags |= self.STREAM_REQUEST_FLAG
+            start_packet.frames = [SessionTicketFrame(0, ticket), self.stream_request_frame(num_streams)]
+            # A full size datagram lets the server send that much more before our address is validated
+            size = self.congestion.max_datagram_size - start_packet.encoded_size()
+            if size >= 2:
+                start_packet.frames.append(PaddingFrame.filling(size))
+            print(f"Requested {num_streams} streams/files from the server in the first datagram.")
+        return start_packet
 
-        # Receive the server's response
-        data, addr = self.socket.recvfrom(65535)
-        response_packet = QUICPacket.deserialize(data)
+    def on_start_response(self, packet: QUICPacket, ticket_cache):
+        """Take the connection ID and the tickets of the server's START, and whether it served the early request."""
+        self.connection_id = packet.connection_id
+        self.early_data_accepted = bool(packet.flags & self.STREAM_REQUEST_FLAG)
+        if self.early_data_accepted:
+            print("The server accepted the stream request of the first datagram.")
+        if ticket_cache is not None:
+            for frame in packet.frames:
+                if isinstance(frame, SessionTicketFrame):
+                    ticket_cache.store(self.address, frame.ticket, frame.lifetime)
 
-        # Check if it's a start connection packet and update the connection ID
-        if response_packet.flags == self.START_CONNECTION_FLAG:
-            self.connection_id = response_packet.connection_id
-            print(f"Connection established with ID: {self.connection_id}")
+    def on_connected(self, response_packet: QUICPacket, num_streams: int):
+        """Acknowledge the server's START and request the streams, unless the first datagram did."""
+        print(f"Connection established with ID: {self.connection_id}")
 
-            # Send an ACK back to the server with the updated connection ID
-            self.send_ack(response_packet.packet_number)
-            print("Acknowledgment sent to the server.")
-        else:
-            print("Failed to establish connection: unexpected response.")
+        # Send an ACK back to the server with the updated connection ID
+        self.send_ack(response_packet.packet_number)
+        print("Acknowledgment sent to the server.")
+
+        if num_streams is not None and not self.early_data_accepted:
+            self.send_stream_request(num_streams)
 
     def accept_connection(self):
         """Accept a connection request and send a connection ID to the client."""
-        data, addr = self.socket.recvfrom(65535)
-        packet = QUICPacket.deserialize(data)
+        while True:
+            data, addr = self.next_datagram()
+            try:
+                packet = QUICPacket.deserialize(data)
+                break
+            except Exception as e:
+                if self.tracer is not None:
+                    self.tracer.packet_dropped('invalid_packet', error=str(e))
 
-        if packet.flags == self.START_CONNECTION_FLAG:
+        if packet.legacy:
+            print(f"Client {addr} uses the legacy fixed-width packet format, which is no longer served.")
+            rejection = self.legacy_rejection(packet)
+            if rejection is not None:
+                self.io.queue(rejection, addr)
+                self.flush()
+        elif packet.flags & self.START_CONNECTION_FLAG:
 
-            self.connection_id = random.randint(1, 1 << 32)
+            self.connection_id = random.randint(1, MAX_CONNECTION_ID)
             print(f"Generated connection ID: {self.connection_id}")
             self.address = addr
 
-            # Send a start connection packet with the connection ID
+            # Send a start connection packet with the connection ID, it takes a packet number of its own
+            self.packet_number += 1
             start_packet = QUICPacket(
                 flags=self.START_CONNECTION_FLAG,
                 connection_id=self.connection_id,
-                packet_number=self.packet_number + 1,
+                packet_number=self.packet_number,
                 frames=[]
             )
-            self.socket.sendto(start_packet.serialize(), self.address)
-            print("Connection ID sent to the client.")
 
-            # Wait for the client's ACK
-            data, addr = self.socket.recvfrom(65535)
-            client_ack_packet = QUICPacket.deserialize(data)
-
-            # Check if the received packet is an ACK with the correct connection ID
-            if client_ack_packet.flags == self.ACK_FLAG and client_ack_packet.connection_id == self.connection_id:
+            # Resend it until the client answers: a resent START (dropped here, it has no connection ID)
+            # or a timeout means it was lost. Any packet with the connection ID completes the handshake,
+            # even if the client's ACK was lost
+            for _ in range(self.recovery.MAX_PTO_COUNT):
+                self.send_packet(start_packet)
+                print("Connection ID sent to the client.")
+                packet = self.recv_datagram_within(self.recovery.get_pto())
+                if packet is None:
+                    continue
                 print(f"Client acknowledged the connection with ID: {self.connection_id}")
-            else:
-                print("Failed to receive valid acknowledgment from the client.")
+                if not self.is_handshake_ack(packet):
+                    self.handle_packet(packet)
+                return
+
+            print("Failed to receive valid acknowledgment from the client.")
         else:
             print("Received unexpected packet during connection process.")
 
+    def send_packet(self, packet: QUICPacket) -> int:
+        """Encode a packet into the reusable send buffer, queue it for the next batched send and return its size."""
+        end = packet.serialize_into(self.send_buffer, 0, self.recovery.largest_acked)
+        self.io.queue(self.send_view[:end], self.address)
+        if self.amplification_credit is not None:
+            self.amplification_credit -= end
+        if self.tracer is not None:
+            self.tracer.packet_sent(packet, end, self.packetizer.queued_bytes)
+        return end
+
+    def flush(self):
+        """Send every queued packet."""
+        self.io.flush()
+
+    def on_socket_error(self, error: OSError):
+        """The socket refused a send or a receive, the datagram is lost like one the network dropped."""
+        if self.tracer is not None:
+            self.tracer.packet_dropped('socket_error', error=str(error))
+
+    def next_datagram(self):
+        """Return the next received (data, addr), flushing queued packets before a read that may block."""
+        if not self.received_datagrams:
+            if self.socket.gettimeout() != 0.0:
+                self.flush()
+            self.received_datagrams.extend(self.io.recv())
+        return self.received_datagrams.popleft()
+
     def send_stream_request(self, num_streams: int):
-        """Client sends a request to the server for the desired number of streams/files."""
-        request_packet = QUICPacket(
-            flags=self.STREAM_REQUEST_FLAG,
-            connection_id=self.connection_id,
-            packet_number=self.packet_number,
-            frames=[StreamFrame(stream_id=0, offset=0, length=4, stream_data=num_streams.to_bytes(4, 'big'),
-                                flags=StreamFrame.FIN_DATA_FRAME)]
-        )
-        self.packet_number += 1
-        self.socket.sendto(request_packet.serialize(), self.address)
+        """Client sends a request to the server for the desired number of streams/files.
+
+        The request is tracked like data, the loss detection sends it again until the server acknowledges it.
+        """
+        self.send_tracked_packet([self.stream_request_frame(num_streams)], self.STREAM_REQUEST_FLAG)
         print(f"Requested {num_streams} streams/files from the server.")
 
-    def handle_stream_request(self, packet: QUICPacket):
-        """Server handles the client's stream/file request."""
+    def stream_request_frame(self, num_streams: int) -> StreamFrame:
+        """The number of streams, followed by a bit mask of the offered codecs when more than 'store' is."""
+        data = num_streams.to_bytes(4, 'big')
+        if self.codecs != ('store',):
+            data += bytes([encode_codecs(self.codecs)])
+        return StreamFrame(stream_id=0, offset=0, length=len(data), stream_data=data,
+                           flags=StreamFrame.FIN_DATA_FRAME)
 
-        stream_frame = packet.frames[0]
-        num_streams = int.from_bytes(stream_frame.stream_data, 'big')
+    def handle_stream_request(self, packet: QUICPacket) -> bool:
+        """Server handles the client's stream/file request, returns False if the packet holds none."""
+        stream_frame = next((frame for frame in packet.frames if isinstance(frame, StreamFrame)), None)
+        if stream_frame is None or len(stream_frame.stream_data) < 4:
+            if self.tracer is not None:
+                self.tracer.packet_dropped('invalid_stream_request', packet_number=packet.packet_number)
+            return False
+
+        self.stream_request_received = True
+        num_streams = int.from_bytes(stream_frame.stream_data[:4], 'big')
+        if len(stream_frame.stream_data) > 4:
+            self.peer_codecs = decode_codecs(stream_frame.stream_data[4])
         print(f"Received request for {num_streams} streams/files from the client.")
 
-        self.events.put(StreamRequestEvent(num_streams))
+        self.events.put_nowait(StreamRequestEvent(num_streams, self.peer_codecs))
+        return True
+
+    def set_stream_compression(self, stream_id: int, level: int = DEFAULT_COMPRESSION_LEVEL) -> bool:
+        """Compress what is sent on stream_id with zlib, if the peer offered it. Returns whether it does.
+
+        Call it before the stream's first send(). Compression turns itself off where it doesn't pay off.
+        """
+        if 'zlib' not in self.peer_codecs:
+            return False
+        if stream_id not in self.streams:
+            self.streams[stream_id] = QUICStream(stream_id)
+        self.streams[stream_id].sender.compressor = QuicStreamCompressor(level)
+        return True
+
+    def encode_stream_data(self, stream_id: int, data, end_of_stream: bool):
+        """Return data as it is sent: compressed on a compressed stream."""
+        stream = self.streams.get(stream_id)
+        if stream is None or stream.sender.compressor is None:
+            return data
+        # What is in flight is delivered once per RTT, the window alone overstates links it doesn't fill.
+        # A coarse clock can measure an RTT of 0, then the rate is not known
+        rtt = self.recovery.smoothed_rtt
+        delivery_rate = self.congestion.bytes_in_flight / rtt if rtt > 0 else None
+        return stream.sender.compressor.compress(data, end_of_stream, delivery_rate)
 
     def send_stream_data(self, stream_id: int, data: bytes, end_of_stream: bool):
         """Creates a StreamFrame and adds it to the queue of streamframes to send."""
@@ -127,64 +325,372 @@ class QUICProtocol:
         # Access the stream sender through the stream
         stream = self.streams[stream_id]
         stream_frame = stream.sender.send_data(data, end_of_stream)
+        self.send_credit.on_data_sent(len(data))
 
-        self.stream_frame_queue.put(stream_frame)
+        self.packetizer.push(stream_frame)
+        if self.tracer is not None:
+            self.tracer.stream_data_sent(stream_id, len(data), end_of_stream)
 
         if end_of_stream:
-            print(f"Stream {stream_id} has finished sending.")
             stream.close()
             self.fin_streams.add(stream_id)
 
     def send_datagram(self):
-        """Send all frames in the queue."""
+        """Send one packet filled with queued frames, up to the max datagram size.
+
+        A pending ACK rides along in front of the stream frames instead of in its own packet.
+        """
+        if self.packetizer:
+            self.send_tracked_packet(self.packetizer.next_frames(self.control_frames(self.packetizer.capacity)))
+
+    def send_tracked_packet(self, frames: list, flags: int = STREAM_DATA_FLAG):
+        """Send an ack-eliciting packet and track it until it is acknowledged or declared lost.
+
+        It is tracked whether or not the socket takes it, a datagram the socket refuses is lost
+        like one the network drops and its frames are sent again.
+        """
+        # Increment the packet number for each packet sent
+        self.packet_number += 1
+        packet = QUICPacket(
+            flags=flags,
+            connection_id=self.connection_id,
+            packet_number=self.packet_number,
+            frames=frames
+        )
+        self.packets_to_ack[self.packet_number] = packet
+        size = self.send_packet(packet)
+        now = time.monotonic()
+        self.recovery.on_packet_sent(self.packet_number, size, now)
+        self.congestion.on_packet_sent(size)
+        self.pacer.on_packet_sent(size, now)
+
+    def control_frames(self, space: int) -> list:
+        """Build the pending ACK and flow control frames that go in front of the next packet.
+
+        They take at most space bytes, the flow control updates that don't fit stay pending
+        for the next packet.
+        """
         frames = []
-        while not self.stream_frame_queue.empty():
-            frames.append(self.stream_frame_queue.get())
+        if self.acks.has_pending():
+            frames.append(self.acks.build_frame(time.monotonic()))
+            space -= frames[-1].encoded_size()
+        if self.max_data_pending:
+            frame = MaxDataFrame(self.receive_window.max_data)
+            if frame.encoded_size() <= space:
+                frames.append(frame)
+                space -= frame.encoded_size()
+                self.max_data_pending = False
+        for stream_id in list(self.max_stream_data_pending):
+            frame = MaxStreamDataFrame(stream_id, self.streams[stream_id].receiver.window.max_data)
+            if frame.encoded_size() > space:
+                break
+            frames.append(frame)
+            space -= frame.encoded_size()
+            self.max_stream_data_pending.discard(stream_id)
+        return frames
 
-        if frames:
-            # Increment the packet number for each packet sent
-            self.packet_number += 1
-            packet = QUICPacket(
-                flags=self.STREAM_DATA_FLAG,
-                connection_id=self.connection_id,
-                packet_number=self.packet_number,
-                frames=frames
-            )
-            try:
-                self.socket.sendto(packet.serialize(), self.address)
-                self.packets_to_ack[self.packet_number] = packet
-            except socket.error as e:
-                print(f"Socket error: {e}")
+    def send_flow_control_updates(self):
+        """Send raised flow control limits right away, the peer may be blocked on them."""
+        while self.max_data_pending or self.max_stream_data_pending:
+            self.send_tracked_packet(self.control_frames(self.packetizer.capacity))
 
     def send_ack(self, packet_number: int):
-        """Send an acknowledgment packet for the received packet."""
+        """Send an acknowledgment packet for a single packet, used by the handshake."""
         ack_packet = QUICPacket(
             flags=self.ACK_FLAG,
             connection_id=self.connection_id,
             packet_number=packet_number,
             frames=[]
         )
-        self.socket.sendto(ack_packet.serialize(), self.address)
+        self.send_packet(ack_packet)
+
+    def send_ack_frame(self):
+        """Send an ACK frame covering every received packet, in a packet of its own."""
+        self.packet_number += 1
+        ack_packet = QUICPacket(
+            flags=self.ACK_FLAG,
+            connection_id=self.connection_id,
+            packet_number=self.packet_number,
+            frames=[self.acks.build_frame(time.monotonic())]
+        )
+        self.send_packet(ack_packet)
+
+    def run(self, steps):
+        """Block through the waits of steps.
+
+        What sending and closing do does not depend on the transport, so it is written once as
+        generators (the *_steps methods) that yield where they wait for the peer: None to wait
+        for the next packet or timer, or the seconds until the pacer lets the next packet go.
+        Here the socket is read meanwhile, AsyncQUICProtocol.run() awaits the loop instead.
+        """
+        for timeout in steps:
+            self.recv(timeout=timeout)
 
     def send(self, stream_id: int, data: bytes, end_of_stream: bool):
         """Encapsulates send_stream_data and send_datagram."""
+        self.run(self.send_steps(stream_id, data, end_of_stream))
+
+    def send_steps(self, stream_id: int, data: bytes, end_of_stream: bool):
         # Check if the stream is closed
         if stream_id in self.fin_streams:
-            print(f"Cannot send data: Stream {stream_id} is already closed.")
+            if self.tracer is not None:
+                self.tracer.metrics.increment('sends_after_fin')  # Data sent after the end of its stream is dropped
             return
+        data = self.encode_stream_data(stream_id, data, end_of_stream)
+
+        # Queue what the peer's flow control limits allow and wait for more credit for the rest
+        size = min(len(data), self.get_send_credit(stream_id))
+        while size < len(data) and not self.peer_closed:
+            if size:
+                self.send_stream_data(stream_id, data[:size], False)
+                data = data[size:]
+            yield from self.wait_for_credit_steps(stream_id)
+            size = min(len(data), self.get_send_credit(stream_id))
 
         self.send_stream_data(stream_id, data, end_of_stream)
 
-        # Calculate 60% of not closed streams
-        not_closed_streams = len(self.streams) - len(self.fin_streams)
-        threshold = 0.6 * not_closed_streams
+        # Send full packets while the windows are open and block only once the backlog is full,
+        # a partial one only goes out when no more data is coming soon
+        while self.packetizer.has_full_packet():
+            if self.packetizer.queued_bytes > self.max_send_backlog:
+                yield from self.wait_for_send_window_steps()
+            elif not self.can_send_now():
+                self.poll()  # Only once the windows close, ACKs that already arrived may reopen them
+                if not self.can_send_now():
+                    break  # Leave it queued, ACKs clock it out in scheduler order
+            self.send_datagram()
+
+        if self.packetizer and self.should_send_partial():
+            yield from self.send_pending_steps()
+
+    def get_reader(self, stream_id: int) -> QuicStreamReader:
+        """Return the reader of a stream, from then on its data goes to the reader instead of events.
+
+        Call it before the stream's data arrives, data that was already queued as events stays there.
+        """
+        reader = self.readers.get(stream_id)
+        if reader is None:
+            if stream_id not in self.streams:
+                self.streams[stream_id] = QUICStream(stream_id)
+            reader = self.readers[stream_id] = self.reader_class(self, stream_id)
+        return reader
+
+    def set_stream_callback(self, stream_id: int, callback):
+        """Call callback(data, end_of_stream) with the data of a stream as it arrives, see get_reader()."""
+        self.get_reader(stream_id).callback = callback
 
-        # If the number of frames is 60% of the number of not closed streams, send the datagram
-        if self.stream_frame_queue.qsize() >= threshold:
+    def set_stream_sink(self, stream_id: int, sink):
+        """Write the data of a stream into sink, a QuicDownloadSink, at the offsets it arrives with.
+
+        The stream is finished once the sink is complete. Call it before the stream's data arrives.
+        """
+        if stream_id not in self.streams:
+            self.streams[stream_id] = QUICStream(stream_id)
+        self.sinks[stream_id] = sink
+
+    def set_stream_priority(self, stream_id: int, urgency: int = DEFAULT_URGENCY, weight: int = DEFAULT_WEIGHT):
+        """Set the urgency (strict priority scheduler) and weight (weighted fair scheduler) of a stream."""
+        self.packetizer.scheduler.set_priority(stream_id, urgency, weight)
+
+    def get_send_credit(self, stream_id: int) -> int:
+        """Bytes that can be queued on stream_id under both the stream and the connection limit."""
+        stream = self.streams.get(stream_id)
+        stream_credit = stream.sender.credit.available() if stream is not None else INITIAL_STREAM_WINDOW
+        return min(stream_credit, self.send_credit.available())
+
+    def wait_for_credit_steps(self, stream_id: int):
+        """Send everything queued, then wait until the peer raises a flow control limit of stream_id."""
+        yield from self.send_pending_steps()
+        while not self.peer_closed and self.get_send_credit(stream_id) == 0:
+            yield None
+
+    def should_send_partial(self) -> bool:
+        """Send a partially filled packet when every stream has finished or nothing is in flight."""
+        return len(self.streams) == len(self.fin_streams) or not self.packets_to_ack
+
+    def send_pending(self):
+        """Send every queued frame."""
+        self.run(self.send_pending_steps())
+
+    def send_pending_steps(self):
+        while self.packetizer:
+            yield from self.wait_for_send_window_steps()
             self.send_datagram()
 
-            # Wait for ack on the packet
-            self.recv()
+    def can_send_now(self) -> bool:
+        """True if the in-flight window, the congestion window and the pacer allow a packet right now."""
+        return (len(self.packets_to_ack) < self.window_size and self.congestion.can_send() and
+                not self.amplification_limited() and
+                self.pacer.time_until_send(self.congestion.max_datagram_size, time.monotonic()) <= 0)
+
+    def limit_amplification(self, received: int):
+        """Count a datagram of received bytes from a peer whose address is not validated yet (RFC 9000 8.1).
+
+        Until on_address_validated(), at most AMPLIFICATION_FACTOR times what it sent goes back
+        to the address, so a spoofed early request can't make the server flood someone else.
+        """
+        self.amplification_credit = (self.amplification_credit or 0) + self.AMPLIFICATION_FACTOR * received
+
+    def amplification_limited(self) -> bool:
+        return self.amplification_credit is not None and self.amplification_credit < self.congestion.max_datagram_size
+
+    def on_address_validated(self):
+        """The peer answered with our connection ID, it receives at its address."""
+        self.amplification_credit = None
+
+    def wait_for_send_window_steps(self):
+        """Wait until the in-flight window, the congestion window and the pacer allow another packet."""
+        # Release window space for ACKs that already arrived, without blocking, once the windows close
+        if not self.can_send_now():
+            self.poll()
+
+        # Only wait for ACKs once the window is full
+        while not self.peer_closed and (len(self.packets_to_ack) >= self.window_size or
+                                        not self.congestion.can_send() or self.amplification_limited()):
+            yield None
+
+        delay = self.pacer.time_until_send(self.congestion.max_datagram_size, time.monotonic())
+        while delay > 0:
+            yield delay
+            delay = self.pacer.time_until_send(self.congestion.max_datagram_size, time.monotonic())
+
+    def poll(self):
+        """Process every datagram already waiting on the socket without blocking."""
+        self.socket.settimeout(0.0)
+        try:
+            while True:
+                packet = self.recv_datagram()
+                if packet is not None:
+                    self.handle_packet(packet)
+        except BlockingIOError:
+            pass
+        finally:
+            self.socket.settimeout(None)
+
+        self.handle_timers()
+
+    def wait_for_acks(self):
+        """Block until every queued frame was sent and every packet in flight has been acknowledged."""
+        self.run(self.wait_for_acks_steps())
+
+    def wait_for_acks_steps(self):
+        yield from self.send_pending_steps()
+        while self.packets_to_ack or self.packetizer.retransmissions:
+            if self.recovery.pto_count > self.recovery.MAX_PTO_COUNT:
+                print("Peer stopped acknowledging, dropping unacknowledged packets.")
+                self.discard_in_flight()
+                return
+            yield None
+
+    def discard_in_flight(self):
+        """Forget every unacknowledged packet, the peer will not acknowledge them anymore."""
+        self.packets_to_ack.clear()
+        self.packetizer.drop_retransmissions()
+        self.recovery.clear()
+        self.congestion.reset_in_flight()
+
+    def on_ack_received(self, ranges: list, ack_delay: float = 0.0):
+        """Release packets in the acknowledged (first, last) ranges and retransmit the ones declared lost."""
+        now = time.monotonic()
+        acked, lost = self.recovery.on_ack_received(ranges, now, ack_delay)
+        for sent_packet in acked:
+            self.packets_to_ack.pop(sent_packet.packet_number, None)
+
+        self.congestion.on_packets_acked(acked, now)
+        self.congestion.on_packets_lost(lost, now)
+        self.pacer.update_rate(self.congestion.congestion_window, self.recovery.smoothed_rtt)
+        if self.tracer is not None and acked:
+            self.tracer.packets_acked(len(acked))
+            self.tracer.metrics_updated(self.recovery, self.congestion)
+        self.retransmit(lost, 'ack_received')
+
+        # Refill the windows from the backlog
+        while self.packetizer.has_full_packet() and self.can_send_now():
+            self.send_datagram()
+
+        # Nothing left in flight: a partial packet held back for more data can go now
+        if not self.packets_to_ack and self.packetizer:
+            self.send_datagram()
+
+    def get_timer_deadline(self):
+        """Return when the loss detection or the delayed ACK timer fires next, or None."""
+        deadline = self.recovery.get_timeout()
+        if self.acks.ack_deadline is not None and (deadline is None or self.acks.ack_deadline < deadline):
+            deadline = self.acks.ack_deadline
+        if self.retransmissions_paced():
+            now = time.monotonic()
+            release = now + max(self.pacer.time_until_send(self.congestion.max_datagram_size, now), 0)
+            if deadline is None or release < deadline:
+                deadline = release
+        return deadline
+
+    def handle_timers(self):
+        """Run whichever of the loss detection and delayed ACK timers expired."""
+        now = time.monotonic()
+        if self.acks.ack_deadline is not None and self.acks.ack_deadline <= now:
+            self.send_ack_frame()
+
+        timeout = self.recovery.get_timeout()
+        if timeout is not None and timeout <= now:
+            self.on_loss_detection_timeout()
+        self.send_retransmissions()
+
+    def on_loss_detection_timeout(self):
+        """Loss detection timer fired: retransmit lost data or send a probe."""
+        now = time.monotonic()
+        lost, probes = self.recovery.on_timeout(now)
+        self.congestion.on_packets_lost(lost, now)
+        self.congestion.on_packets_discarded(probes)  # A probe timeout is not a congestion signal
+        if self.tracer is not None:
+            self.tracer.metrics.increment('probe_timeouts')
+        self.retransmit(lost + probes, 'pto_expired')
+        if probes and self.packetizer.retransmissions:
+            self.send_datagram()  # A probe goes out whatever the windows say (RFC 9002 7.5)
+
+    def retransmit(self, lost_packets: list, trigger: str = None):
+        """Re-frame the stream data of lost packets into new packets, trigger names the loss detection for tracing."""
+        if not lost_packets:
+            return
+
+        resend = 0
+        for sent_packet in lost_packets:
+            packet = self.packets_to_ack.pop(sent_packet.packet_number, None)
+            if packet is None:
+                continue
+            if packet.flags & self.STREAM_REQUEST_FLAG:
+                # The request's frame is not stream data, it goes again in a request packet of its own
+                self.send_tracked_packet(packet.frames, self.STREAM_REQUEST_FLAG)
+                if self.tracer is not None:
+                    self.tracer.packet_lost(sent_packet.packet_number, trigger)
+                continue
+            stream_frames = [frame for frame in packet.frames if isinstance(frame, StreamFrame)]
+            self.packetizer.push_front(stream_frames)
+            resend += 1
+            if self.tracer is not None:
+                self.tracer.packet_lost(sent_packet.packet_number, trigger)
+                self.tracer.data_retransmitted(sum(len(frame.stream_data) for frame in stream_frames))
+
+            # Flow control updates are sent again with the current limits
+            for frame in packet.frames:
+                if isinstance(frame, MaxDataFrame):
+                    self.max_data_pending = True
+                elif isinstance(frame, MaxStreamDataFrame):
+                    self.max_stream_data_pending.add(frame.stream_id)
+
+        # The lost frames are at the front of the queue, the windows and the pacer clock them out like new data
+        if resend:
+            self.send_retransmissions()
+        self.send_flow_control_updates()
+
+    def send_retransmissions(self):
+        """Send queued retransmissions while the windows and the pacer allow, get_timer_deadline() waits for the pacer."""
+        while self.packetizer.retransmissions and self.can_send_now():
+            self.send_datagram()
+
+    def retransmissions_paced(self) -> bool:
+        """True if retransmissions are queued and only the pacer holds them back, no ACK has to arrive first."""
+        return (bool(self.packetizer.retransmissions) and len(self.packets_to_ack) < self.window_size and
+                self.congestion.can_send() and not self.amplification_limited())
 
     def recv_stream_data(self, frame: StreamFrame):
         """Process the received stream data and handle end-of-stream."""
@@ -193,67 +699,318 @@ class QUICProtocol:
             self.streams[frame.stream_id] = QUICStream(frame.stream_id)
 
         stream = self.streams[frame.stream_id]
+        if frame.flags & StreamFrame.ZLIB_FRAME and stream.receiver.decoder is None:
+            stream.receiver.decoder = QuicStreamDecompressor()
+
+        # Drop data past the flow control limits, a well behaved peer never sends it
+        end = frame.offset + len(frame.stream_data)
+        new_bytes = max(end - stream.receiver.window.received, 0)
+        if not (stream.receiver.window.allows(end) and
+                self.receive_window.allows(self.receive_window.received + new_bytes)):
+            if self.tracer is not None:
+                self.tracer.packet_dropped('flow_control', stream_id=frame.stream_id, offset=frame.offset)
+            return
+        stream.receiver.window.on_data_received(end)
+        self.receive_window.on_data_received(self.receive_window.received + new_bytes)
+
+        sink = self.sinks.get(frame.stream_id)
+        if sink is not None:
+            self.deliver_to_sink(stream, sink, frame, new_bytes)
+            return
+
+        reader = self.readers.get(frame.stream_id)
+        if reader is not None:
+            self.deliver_to_reader(stream, reader, frame)
+            return
+
         event = stream.receiver.receive_stream_frame(frame)
-        self.events.put(event)
+        if event is None:
+            return  # Out of order data buffered until the gap is filled, or decoded once the last event is read
+        self.queue_stream_event(stream, event)
+
+    def queue_stream_event(self, stream: QUICStream, event: StreamDataReceived):
+        self.events.put_nowait(event)
+        if self.tracer is not None:
+            self.tracer.stream_data_received(event.stream_id, len(event.data), event.end_of_stream,
+                                             self.events.qsize())
 
         if event.end_of_stream:
-            print(f"Stream {event.stream_id} has received the end of data.")
             stream.close()
             self.fin_streams.add(event.stream_id)
 
+    def deliver_to_reader(self, stream: QUICStream, reader: QuicStreamReader, frame: StreamFrame):
+        """Hand the newly contiguous data of a stream to its reader."""
+        released, end_of_stream = stream.receiver.receive_chunks(frame)
+        if not released and not end_of_stream:
+            return  # Out of order data, buffered until the gap is filled
+
+        # Only the stream window waits for the reader, so a slow reader holds back its own stream.
+        # The connection credit comes back as soon as the data is handed over.
+        size = sum(len(chunk) for chunk in released)
+        if self.receive_window.on_data_consumed(size, time.monotonic(), self.recovery.smoothed_rtt):
+            self.max_data_pending = True
+        reader.decoder = stream.receiver.decoder
+
+        if end_of_stream:
+            stream.close()
+            self.fin_streams.add(frame.stream_id)
+        reader.feed(released, end_of_stream)
+        if self.tracer is not None:
+            self.tracer.stream_data_received(frame.stream_id, size, end_of_stream, len(reader.chunks))
+        self.send_flow_control_updates()
+
+    def deliver_to_sink(self, stream: QUICStream, sink, frame: StreamFrame, new_bytes: int):
+        """Write a frame to the stream's sink in place, without reassembling the stream in memory."""
+        decoder = stream.receiver.decoder
+        if decoder is None:
+            written = sink.write(frame.offset, frame.stream_data)
+            if frame.flags & StreamFrame.FIN_DATA_FRAME:
+                sink.set_final_size(frame.offset + len(frame.stream_data))
+
+            # The file is the buffer: the peer gets credit for how far the stream got, also for data a
+            # resumed download already had
+            if new_bytes:
+                self.on_stream_data_consumed(frame.stream_id, new_bytes, credit_connection=True)
+        else:
+            # A compressed stream decodes only in order, the decoded data goes at offsets of its own.
+            # The sink takes every chunk before the next is decoded.
+            released, end_of_stream = stream.receiver.receive_chunks(frame)
+            decoder.feed(released)
+            written = 0
+            while decoder.has_pending():
+                offset = decoder.decoded_bytes
+                data = decoder.decode()
+                if data:
+                    written += sink.write(offset, data)
+            if end_of_stream:
+                sink.set_final_size(decoder.decoded_bytes)
+            size = sum(len(chunk) for chunk in released)
+            if size:
+                self.on_stream_data_consumed(frame.stream_id, size, credit_connection=True)
+
+        complete = sink.is_complete()
+        if self.tracer is not None:
+            self.tracer.stream_data_received(frame.stream_id, written, complete, 0)
+        if complete:
+            sink.finish()
+            stream.close()
+            self.fin_streams.add(frame.stream_id)
+
+    def wake_readers(self):
+        """Wake readers waiting for data that will not come, the peer closed the connection."""
+        for reader in self.readers.values():
+            reader.wake()
+
+    def next_event(self):
+        """Return the next event, receiving packets until one is available, ConnectionClosed once the peer closed."""
+        while self.events.empty():
+            if self.peer_closed:
+                return ConnectionClosed()
+            self.recv()
+        event = self.events.get_nowait()
+        self.on_event_consumed(event)
+        return event
+
+    def on_event_consumed(self, event):
+        """The application consumed an event, give the bytes of a data event back to the peer as credit."""
+        if isinstance(event, StreamDataReceived):
+            size = len(event.data) if event.wire_size is None else event.wire_size
+            self.on_stream_data_consumed(event.stream_id, size, credit_connection=True)
+            stream = self.streams.get(event.stream_id)
+            if event.wire_size is not None and stream is not None:
+                # The next chunk of a compressed stream is decoded only now
+                next_event = stream.receiver.next_decoded_event()
+                if next_event is not None:
+                    self.queue_stream_event(stream, next_event)
+
+    def on_stream_data_consumed(self, stream_id: int, size: int, credit_connection: bool = False):
+        """The application consumed size bytes of a stream, give them back to the peer as credit.
+
+        The connection credit of data read through a reader was already returned on delivery.
+        """
+        now = time.monotonic()
+        rtt = self.recovery.smoothed_rtt
+        stream = self.streams.get(stream_id)
+        if stream is not None and stream.receiver.fin_offset is None:
+            window = stream.receiver.window
+            if window.on_data_consumed(size, now, rtt):
+                self.max_stream_data_pending.add(stream_id)
+                self.receive_window.ensure_window(int(window.window * CONNECTION_WINDOW_RATIO))
+        if credit_connection and self.receive_window.on_data_consumed(size, now, rtt):
+            self.max_data_pending = True
+        self.send_flow_control_updates()
+
     def recv_datagram(self):
         """Receive a datagram and deserialize it."""
         try:
-            data, addr = self.socket.recvfrom(65535)  # Buffer size of 65535 bytes
+            data, addr = self.next_datagram()
 
             if addr != self.address:
-                print(f"Received data from unexpected address {addr}.")
+                if self.tracer is not None:
+                    self.tracer.packet_dropped('unexpected_address', address=str(addr))
                 return None
 
             # Deserialize the packet
             packet = QUICPacket.deserialize(data)
+            if packet.legacy:
+                if self.tracer is not None:
+                    self.tracer.packet_dropped('unsupported_version', address=str(addr))
+                return None
             if packet.connection_id != self.connection_id:
-                print(f"Received packet with mismatched connection ID: {packet.connection_id}")
+                if self.tracer is not None:
+                    self.tracer.packet_dropped('unknown_connection_id', connection_id=packet.connection_id)
                 return None
 
             return packet
 
+        except (BlockingIOError, socket.timeout):
+            raise  # Nothing to read, let the caller handle its timer
         except socket.error as e:
-            print(f"Socket error: {e}")
+            self.on_socket_error(e)
             return None
         except Exception as e:
-            print(f"Error in recv_datagram: {e}")
+            if self.tracer is not None:
+                self.tracer.packet_dropped('invalid_packet', error=str(e))
             return None
 
-    def recv(self):
-        """Encapsulates recv_datagram and recv_stream_data."""
-        packet = self.recv_datagram()
+    def recv(self, timeout: float = None):
+        """Encapsulates recv_datagram and recv_stream_data, waiting at most timeout seconds."""
+        # Wake up when the loss detection or the delayed ACK timer fires
+        deadline = self.get_timer_deadline()
+        if deadline is not None:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                self.handle_timers()
+                return
+            timeout = remaining if timeout is None else min(timeout, remaining)
+        self.socket.settimeout(timeout)
+
+        try:
+            packet = self.recv_datagram()
+        except socket.timeout:
+            self.handle_timers()
+            return
+        finally:
+            self.socket.settimeout(None)
+
         if packet is None:
             return
 
+        self.handle_packet(packet)
+
+    def handle_packet(self, packet: QUICPacket):
+        """Dispatch a received packet of the established connection."""
+        if self.tracer is not None:
+            self.tracer.packet_received(packet, self.acks.largest_received)
+        packet.expand_packet_number(self.acks.largest_received)
+
+        if packet.flags & self.START_CONNECTION_FLAG:
+            return  # A repeated handshake packet, its ACK was lost
+
         elif packet.flags & self.FIN_FLAG:
             self.recv_fin()
             return
 
         elif packet.flags & self.STREAM_REQUEST_FLAG:
-            self.handle_stream_request(packet)
+            if not self.stream_request_received and not self.handle_stream_request(packet):
+                return  # Not acknowledged, a well behaved client sends its request again
+            if self.acks.on_packet_received(packet.packet_number, time.monotonic()):
+                self.send_ack_frame()
             return
 
-        elif packet.packet_number in self.packets_to_ack:
-            print(f"Recived ack for packet {packet.packet_number}")
-            self.packets_to_ack.pop(packet.packet_number)
+        elif self.is_handshake_ack(packet):
+            # Single packet ACK of the handshake and close exchanges
+            self.on_ack_received([(packet.packet_number, packet.packet_number)])
             return
 
+        ack_eliciting = False
         for frame in packet.frames:
-            if isinstance(frame, StreamFrame):
+            if isinstance(frame, AckFrame):
+                self.on_ack_received(frame.ranges, frame.ack_delay)
+            elif isinstance(frame, MaxDataFrame):
+                ack_eliciting = True
+                self.send_credit.on_max_data(frame.maximum)
+            elif isinstance(frame, MaxStreamDataFrame):
+                ack_eliciting = True
+                stream = self.streams.get(frame.stream_id)
+                if stream is not None:
+                    stream.sender.credit.on_max_data(frame.maximum)
+            elif isinstance(frame, StreamFrame):
+                ack_eliciting = True
                 if frame.stream_id not in self.fin_streams:
                     self.recv_stream_data(frame)
-                else:
-                    print(f"Cannot recieve data: Stream {frame.stream_id} is already closed.")
-        self.send_ack(packet.packet_number)
+                elif self.tracer is not None:
+                    self.tracer.packet_dropped('duplicate', stream_id=frame.stream_id, offset=frame.offset)
+
+        # Acknowledge every ack_frequency packets, on reordering, or when the delayed ACK timer fires
+        if self.acks.on_packet_received(packet.packet_number, time.monotonic(), ack_eliciting):
+            self.send_ack_frame()
+
+    def is_handshake_ack(self, packet: QUICPacket) -> bool:
+        """True for the single packet ACK of the handshake and close exchanges, its packet number is the acked one."""
+        return packet.flags & self.ACK_FLAG and not packet.frames
+
+    def recv_datagram_within(self, timeout: float):
+        """Receive a datagram, returning None if nothing arrives before the timeout."""
+        self.socket.settimeout(timeout)
+        try:
+            return self.recv_datagram()
+        except socket.timeout:
+            return None
+        finally:
+            self.socket.settimeout(None)
+
+    def wait_for_flags(self, flags: int, timeout: float):
+        """Return the first packet carrying any of flags, or None if none arrives within timeout seconds.
+
+        Other packets, such as late data, are dropped without ending the wait. ACK_FLAG only matches
+        the single packet ACK of the handshake and close exchanges, not a packet of ACK frames.
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            packet = self.recv_datagram_within(remaining)
+            if packet is None or not packet.flags & flags:
+                continue
+            if packet.flags & flags == self.ACK_FLAG and not self.is_handshake_ack(packet):
+                continue  # ACK frames of late data
+            return packet
 
     def close(self):
+        """Close the connection, then finish its trace."""
+        self.close_connection()
+        if self.tracer is not None:
+            self.tracer.close()
+
+    def close_connection(self):
         """Sends a FIN packet to close the stream or connection."""
+        self.run(self.close_steps())
+
+        if self.peer_closed:
+            print("Peer already closed the connection.")
+            return
+
+        # Resend the FIN every probe timeout until the FIN_ACK arrives, the peer may have lost it
+        for _ in range(self.recovery.MAX_PTO_COUNT):
+            self.send_fin()
+            packet = self.wait_for_flags(self.FIN_ACK_FLAG | self.FIN_FLAG, self.recovery.get_pto())
+            if packet is not None and self.on_fin_answer(packet):
+                self.flush()
+                return
+
+        self.flush()
+        print("No FIN_ACK from the peer, closing anyway.")
+
+    def close_steps(self):
+        """Wait until everything sent was acknowledged, before the FIN."""
+        if self.acks.has_pending():
+            self.send_ack_frame()  # Don't leave the peer waiting for the delayed ACK
+        yield from self.wait_for_acks_steps()
+
+    def send_fin(self):
+        """Send a FIN packet, close resends it until the peer answers."""
         fin_packet = QUICPacket(
             flags=self.FIN_FLAG,
             connection_id=self.connection_id,
@@ -261,29 +1018,36 @@ class QUICProtocol:
             frames=[]  # No stream frames needed for FIN
         )
         self.packet_number += 1
-        self.socket.sendto(fin_packet.serialize(), self.address)
+        self.send_packet(fin_packet)
 
         print("Sent FIN packet")
 
-        packet = self.recv_datagram()
-
+    def on_fin_answer(self, packet: QUICPacket) -> bool:
+        """Handle a packet received after our FIN, returns True if it ended the close exchange."""
         if packet.flags & self.FIN_ACK_FLAG:
-            # Send ACK to confirm receipt of FIN_ACK
-            ack_packet = QUICPacket(
-                flags=self.ACK_FLAG,
-                connection_id=self.connection_id,
-                packet_number=self.packet_number,
-                frames=[]
-            )
-            self.packet_number += 1
-            self.socket.sendto(ack_packet.serialize(), self.address)
-            print(f"Sent ACK for FIN_ACK. Connection closed.")
+            self.acknowledge_fin_ack()
+            return True
 
-    def recv_fin(self):
-        """Handles a FIN packet and sends a FIN_ACK."""
-        print(f"Received FIN for connection {self.connection_id}.")
+        if packet.flags & self.FIN_FLAG:
+            # Both sides are closing at the same time
+            self.recv_fin()
+            return True
+        return False
+
+    def acknowledge_fin_ack(self):
+        """Send ACK to confirm receipt of the peer's FIN_ACK, it resends the FIN_ACK until then."""
+        ack_packet = QUICPacket(
+            flags=self.ACK_FLAG,
+            connection_id=self.connection_id,
+            packet_number=self.packet_number,
+            frames=[]
+        )
+        self.packet_number += 1
+        self.send_packet(ack_packet)
+        print(f"Sent ACK for FIN_ACK. Connection closed.")
 
-        # Send FIN_ACK to acknowledge the FIN
+    def send_fin_ack(self):
+        """Send FIN_ACK to acknowledge the FIN."""
         fin_ack_packet = QUICPacket(
             flags=self.FIN_ACK_FLAG,
             connection_id=self.connection_id,
@@ -291,10 +1055,30 @@ class QUICProtocol:
             frames=[]
         )
         self.packet_number += 1
-        self.socket.sendto(fin_ack_packet.serialize(), self.address)
+        self.send_packet(fin_ack_packet)
 
         print(f"Sent FIN_ACK for connection {self.connection_id}.")
 
-        ack_packet = self.recv_datagram()
-        if ack_packet.flags & self.ACK_FLAG:
-            print("Received acknowledgment for FIN_ACK. Connection closed successfully.")
+    def recv_fin(self):
+        """Handles a FIN packet and sends a FIN_ACK."""
+        print(f"Received FIN for connection {self.connection_id}.")
+
+        # The peer will not acknowledge anything else
+        self.peer_closed = True
+        self.discard_in_flight()
+
+        # Resend the FIN_ACK every probe timeout until the peer acknowledges it, the peer may have lost it
+        timeouts = 0
+        while timeouts < self.recovery.MAX_PTO_COUNT:
+            self.send_fin_ack()
+            packet = self.wait_for_flags(self.FIN_FLAG | self.FIN_ACK_FLAG | self.ACK_FLAG, self.recovery.get_pto())
+            if packet is None:
+                timeouts += 1  # The peer may be gone already or lost the FIN_ACK
+            elif packet.flags & self.FIN_ACK_FLAG:
+                # Both sides closed at the same time: the FIN_ACK answers our FIN and stands for
+                # the ACK of ours, the peer waits for the ACK of its own the same way
+                self.acknowledge_fin_ack()
+                self.flush()
+                return
+            elif not packet.flags & self.FIN_FLAG:
+                return  # The ACK of the FIN_ACK, a resent FIN means the FIN_ACK was lost
@@ -0,0 +1,80 @@
+import bisect
+from QuicPacket import AckFrame
+
+
+class QuicAckTracker:
+    """Receiver side ACK state: received packet number ranges and the delayed ACK policy.
+
+    An ACK is due right away every ack_frequency ack-eliciting packets or when a packet
+    arrives out of order, otherwise it waits at most max_ack_delay so it can be bundled
+    with the next ones or ride on outgoing data.
+    """
+
+    MAX_RANGES = 32  # Older ranges are forgotten, the sender has long declared them acked or lost
+
+    def __init__(self, ack_frequency: int = 2, max_ack_delay: float = 0.025):
+        self.ack_frequency = ack_frequency
+        self.max_ack_delay = max_ack_delay
+        self.ranges = []  # [first, last] received packet numbers, ascending and not touching
+        self.largest_received_time = None
+        self.unacked_count = 0  # Ack-eliciting packets received since the last ACK frame
+        self.ack_deadline = None  # When the pending ACK must go out at the latest
+
+    @property
+    def largest_received(self) -> int:
+        return self.ranges[-1][1] if self.ranges else -1
+
+    def has_pending(self) -> bool:
+        return self.unacked_count > 0
+
+    def on_packet_received(self, packet_number: int, now: float, ack_eliciting: bool = True) -> bool:
+        """Record a received packet, returns True if an ACK should be sent immediately.
+
+        Packets that only carry ACKs are acknowledged along with others but never on their own.
+        """
+        in_order = self.insert(packet_number, now)
+        if not ack_eliciting:
+            return False
+        self.unacked_count += 1
+        if self.ack_deadline is None:
+            self.ack_deadline = now + self.max_ack_delay
+        return not in_order or self.unacked_count >= self.ack_frequency
+
+    def insert(self, packet_number: int, now: float) -> bool:
+        """Add packet_number to the ranges, returns False if it arrived out of order."""
+        if not self.ranges:
+            self.ranges.append([packet_number, packet_number])
+            self.largest_received_time = now
+            return True
+
+        if packet_number == self.ranges[-1][1] + 1:
+            self.ranges[-1][1] = packet_number  # Common case: the next packet in order
+            self.largest_received_time = now
+            return True
+
+        index = bisect.bisect_left(self.ranges, [packet_number, packet_number])
+        if index > 0 and self.ranges[index - 1][1] >= packet_number - 1:
+            index -= 1
+            self.ranges[index][1] = max(self.ranges[index][1], packet_number)
+        elif index < len(self.ranges) and self.ranges[index][0] <= packet_number + 1:
+            self.ranges[index][0] = min(self.ranges[index][0], packet_number)
+        else:
+            self.ranges.insert(index, [packet_number, packet_number])
+
+        # Merge with the following range if the gap closed
+        if index + 1 < len(self.ranges) and self.ranges[index + 1][0] <= self.ranges[index][1] + 1:
+            self.ranges[index][1] = max(self.ranges[index][1], self.ranges.pop(index + 1)[1])
+
+        if len(self.ranges) > self.MAX_RANGES:
+            del self.ranges[0]
+
+        if packet_number >= self.ranges[-1][1]:
+            self.largest_received_time = now
+        return False
+
+    def build_frame(self, now: float) -> AckFrame:
+        """Create the ACK frame for everything received so far and reset the delayed ACK state."""
+        self.unacked_count = 0
+        self.ack_deadline = None
+        ack_delay = now - self.largest_received_time if self.largest_received_time is not None else 0.0
+        return AckFrame([(first, last) for first, last in reversed(self.ranges)], ack_delay)
@@ -0,0 +1,365 @@
+import asyncio
+import random
+import socket
+import time
+from Quic import QUICProtocol
+from QuicIO import create_datagram_io
+from QuicPacket import QUICPacket, MAX_CONNECTION_ID
+from QuicStream import QuicStreamReader
+from Events import ConnectionClosed
+
+
+def open_datagram_socket(host: str, port: int) -> socket.socket:
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setblocking(False)
+    sock.bind((host, port))
+    return sock
+
+
+def create_loop_datagram_io(sock: socket.socket, loop, on_send_error=None):
+    """Batched sends on a socket the loop reads, flushed once the callbacks that queued them return.
+
+    Sends go out through QuicIO instead of the transport, so they are batched into GSO
+    sends like those of QUICProtocol. The loop reads the socket itself, without GRO.
+    """
+    io = create_datagram_io(sock, on_send_error=on_send_error, gro=False)
+    io.on_queued = lambda: loop.call_soon(io.flush)
+    return io
+
+
+class QuicDatagramAdapter(asyncio.DatagramProtocol):
+    """Forwards datagrams from the asyncio transport to the connection."""
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def connection_made(self, transport):
+        self.connection.transport = transport
+
+    def datagram_received(self, data, addr):
+        self.connection.datagram_received(data, addr)
+
+    def error_received(self, exc):
+        self.connection.on_socket_error(exc)
+
+
+class AsyncQuicStreamReader(QuicStreamReader):
+    """QuicStreamReader whose reads wait on the event loop, iterate it with async for."""
+
+    def __init__(self, connection, stream_id: int, callback=None):
+        super().__init__(connection, stream_id, callback)
+        self.readable = asyncio.Event()  # Set when data or the end of the stream arrives
+
+    def wake(self):
+        self.readable.set()
+
+    def consumed(self, size: int):
+        super().consumed(size)
+        if size:
+            self.connection.arm_timer()  # A flow control update may have been sent
+
+    async def wait_readable(self):
+        while not self.chunks and not self.end_of_stream and not self.connection.peer_closed:
+            self.readable.clear()
+            await self.readable.wait()
+
+    async def read(self, size: int = -1) -> bytes:
+        """Read up to size bytes, waiting until at least one is available. Returns b"" at EOF."""
+        if size < 0:
+            parts = []
+            await self.wait_readable()
+            while self.chunks:
+                parts.append(self.read_nowait())
+                await self.wait_readable()
+            return b"".join(parts)
+        await self.wait_readable()
+        return self.read_nowait(size)
+
+    async def readinto(self, buffer) -> int:
+        await self.wait_readable()
+        return self.readinto_nowait(buffer)
+
+    def __iter__(self):
+        raise TypeError("Use async for to iterate an AsyncQuicStreamReader.")
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        await self.wait_readable()
+        if not self.chunks:
+            raise StopAsyncIteration
+        return self.next_chunk()
+
+
+class AsyncQUICProtocol(QUICProtocol):
+    """QUICProtocol driven by an asyncio event loop instead of blocking socket calls.
+
+    Packet, stream, recovery and congestion logic is inherited, only the I/O and the
+    timers move to the loop: datagrams are handled as they arrive and the loss detection
+    timer is a loop callback.
+    """
+
+    reader_class = AsyncQuicStreamReader
+
+    def __init__(self, is_client: bool, window_size: int = 32, congestion_control: str = 'newreno',
+                 max_datagram_size: int = 1200, scheduler: str = 'round_robin', tracer=None):
+        super().__init__(is_client, window_size, congestion_control, max_datagram_size, scheduler, tracer)
+        self.transport = None  # Set by QuicDatagramAdapter once the endpoint is created
+        self.loop = None
+        self.events = asyncio.Queue()  # Same events as QUICProtocol.events, awaited by recv()
+        self.timer = None  # Loss detection and delayed ACK timer handle
+        self.progress = asyncio.Event()  # Set whenever an ACK, a timer or a flow control update may have freed space
+        self.waiter = None  # (flags, future, on_packet, connection_id) for the handshake and close exchanges
+        self.endpoint = None  # Shared server endpoint, None when the connection owns its transport
+        self.last_activity = time.monotonic()  # Used by the endpoint to expire idle connections
+        self.released = False  # The timer is stopped and the transport given back
+
+    def create_socket(self):
+        return None  # The event loop owns the socket
+
+    async def bind(self, host: str, port: int):
+        """Create the server endpoint on the running loop."""
+        if self.is_client:
+            raise ValueError("Clients cannot bind to a specific address and port.")
+        await self.open_endpoint(host, port)
+
+    async def open_endpoint(self, host: str, port: int):
+        """Bind a socket to (host, port), the loop reads it and send_packet() batches into it."""
+        self.loop = asyncio.get_running_loop()
+        sock = open_datagram_socket(host, port)
+        await self.loop.create_datagram_endpoint(lambda: QuicDatagramAdapter(self), sock=sock)
+        self.io = create_loop_datagram_io(sock, self.loop, self.on_socket_error)
+
+    async def connect(self, host: str, port: int, ticket_cache=None, num_streams: int = None):
+        """Run the client side of the handshake, resending START until the server answers.
+
+        num_streams and ticket_cache request streams in the first datagram, see QUICProtocol.connect().
+        """
+        if not self.is_client:
+            raise ValueError("Servers cannot connect to a specific address and port.")
+        self.address = (host, port)
+        await self.open_endpoint('0.0.0.0', 0)
+
+        start_packet = self.build_start_packet(ticket_cache, num_streams)
+        for _ in range(self.recovery.MAX_PTO_COUNT):
+            self.send_packet(start_packet)
+            # Take the connection ID right away, data behind an accepted early request follows it closely
+            result = await self.wait_for_packet(self.START_CONNECTION_FLAG, self.recovery.get_pto(),
+                                                lambda packet: self.on_start_response(packet, ticket_cache))
+            if result is None:
+                self.recovery.pto_count += 1  # Back off, the server or the path may just be slow
+                continue
+            self.recovery.pto_count = 0
+
+            self.on_connected(result[0], num_streams)
+            self.arm_timer()  # A stream request is resent by the loss detection until the server acknowledges it
+            return
+
+        print("Failed to establish connection: no response from the server.")
+
+    async def accept_connection(self):
+        """Wait for a client START packet and hand out a connection ID."""
+        packet, addr = await self.wait_for_packet(self.START_CONNECTION_FLAG)
+
+        self.connection_id = random.randint(1, MAX_CONNECTION_ID)
+        print(f"Generated connection ID: {self.connection_id}")
+        self.address = addr
+
+        self.packet_number += 1  # The START takes a packet number of its own
+        start_packet = QUICPacket(
+            flags=self.START_CONNECTION_FLAG,
+            connection_id=self.connection_id,
+            packet_number=self.packet_number,
+            frames=[]
+        )
+        for _ in range(self.recovery.MAX_PTO_COUNT):
+            self.send_packet(start_packet)
+            print("Connection ID sent to the client.")
+
+            # The stream request completes the handshake too when the client's ACK was lost. A resent
+            # START, with or without an early request, has no connection ID yet and doesn't
+            result = await self.wait_for_packet(self.ACK_FLAG | self.STREAM_REQUEST_FLAG, self.recovery.get_pto(),
+                                                self.on_handshake_completed, self.connection_id)
+            if result is not None:
+                print(f"Client acknowledged the connection with ID: {self.connection_id}")
+                return
+
+        print("Failed to receive valid acknowledgment from the client.")
+
+    def on_handshake_completed(self, packet: QUICPacket):
+        """Handle the packet that completed the handshake, unless it is only the ACK of the START."""
+        if not self.is_handshake_ack(packet):
+            self.handle_packet(packet)
+            self.arm_timer()
+
+    async def wait_for_packet(self, flags: int, timeout: float = None, on_packet=None, connection_id: int = None):
+        """Wait for a packet carrying any of flags, returns (packet, addr) or None on timeout.
+
+        on_packet(packet) runs as soon as it arrives, before the packets read right behind it.
+        With connection_id, only a packet of that connection ends the wait.
+        """
+        future = self.loop.create_future()
+        self.waiter = (flags, future, on_packet, connection_id)
+        try:
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            return None
+        finally:
+            self.waiter = None
+
+    def send_packet(self, packet: QUICPacket) -> int:
+        if self.released:
+            return 0  # The transport may be closed already, the peer is not listening anymore
+        return super().send_packet(packet)
+
+    def datagram_received(self, data: bytes, addr):
+        try:
+            packet = QUICPacket.deserialize(data)
+        except Exception as e:
+            if self.tracer is not None:
+                self.tracer.packet_dropped('invalid_packet', error=str(e))
+            return
+
+        if packet.legacy:
+            if self.tracer is not None:
+                self.tracer.packet_dropped('unsupported_version', address=str(addr))
+            rejection = self.legacy_rejection(packet)
+            if rejection is not None:
+                self.io.queue(rejection, addr)
+            return
+        self.packet_received(packet, addr)
+
+    def packet_received(self, packet: QUICPacket, addr):
+        """Handle one packet from the loop, then rearm the timer and wake blocked senders."""
+        self.last_activity = time.monotonic()
+
+        if self.waiter is not None and packet.flags & self.waiter[0]:
+            future = self.waiter[1]
+            if (not future.done() and (self.address is None or addr == self.address) and
+                    (self.waiter[3] is None or packet.connection_id == self.waiter[3])):
+                if self.waiter[2] is not None:
+                    self.waiter[2](packet)
+                future.set_result((packet, addr))
+                return
+
+        if addr != self.address:
+            if self.tracer is not None:
+                self.tracer.packet_dropped('unexpected_address', address=str(addr))
+            return
+        if packet.connection_id != self.connection_id:
+            if self.tracer is not None:
+                self.tracer.packet_dropped('unknown_connection_id', connection_id=packet.connection_id)
+            return
+
+        self.handle_packet(packet)
+        self.arm_timer()
+        self.progress.set()
+
+    def arm_timer(self):
+        """(Re)schedule the loss detection and delayed ACK timer on the loop."""
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        if self.released:
+            return
+
+        deadline = self.get_timer_deadline()
+        if deadline is not None:
+            self.timer = self.loop.call_later(max(deadline - time.monotonic(), 0), self.on_timer)
+
+    def on_timer(self):
+        self.timer = None
+        self.handle_timers()
+        self.arm_timer()
+        self.progress.set()
+
+    def poll(self):
+        pass  # Datagrams are handled by the loop as they arrive
+
+    async def run(self, steps):
+        """Await the waits of steps on the loop, see QUICProtocol.run()."""
+        for timeout in steps:
+            self.arm_timer()  # The packets sent so far are tracked while it waits
+            if timeout is not None:
+                await asyncio.sleep(timeout)  # The pacer's delay, the loop handles datagrams meanwhile
+            else:
+                self.progress.clear()
+                await self.progress.wait()
+        self.arm_timer()
+
+    async def send(self, stream_id: int, data: bytes, end_of_stream: bool):
+        """Queue stream data and send a datagram once enough frames are pending, see QUICProtocol.send()."""
+        await self.run(self.send_steps(stream_id, data, end_of_stream))
+
+    async def send_pending(self):
+        await self.run(self.send_pending_steps())
+
+    async def recv(self):
+        """Return the next event of the connection, ConnectionClosed once the peer closed it or it expired."""
+        if self.peer_closed and self.events.empty():
+            return ConnectionClosed()
+        event = await self.events.get()
+        self.on_event_consumed(event)
+        self.arm_timer()
+        return event
+
+    async def wait_for_acks(self):
+        await self.run(self.wait_for_acks_steps())
+
+    def recv_fin(self):
+        """Answer a FIN without waiting, a resent FIN is answered again when the FIN_ACK was lost."""
+        print(f"Received FIN for connection {self.connection_id}.")
+        self.peer_closed = True
+        self.discard_in_flight()
+        self.wake_readers()
+        self.events.put_nowait(ConnectionClosed())  # Wakes a recv() waiting for a request that won't come
+
+        self.send_fin_ack()
+        self.progress.set()
+
+    async def close(self):
+        """Sends a FIN packet to close the connection and releases the transport."""
+        await self.run(self.close_steps())
+
+        if not self.peer_closed:
+            for _ in range(self.recovery.MAX_PTO_COUNT):
+                if self.released or self.peer_closed:
+                    break  # Abandoned or expired while waiting, or the peer's FIN arrived
+                self.send_fin()
+                result = await self.wait_for_packet(self.FIN_ACK_FLAG | self.FIN_FLAG, self.recovery.get_pto())
+                if result is not None and self.on_fin_answer(result[0]):
+                    break
+
+        self.release()
+
+    def release(self):
+        """Stop the timer, give the transport back and finish the trace."""
+        if self.released:
+            return
+        self.released = True
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        if self.tracer is not None:
+            self.tracer.close()
+
+        if self.endpoint is None:
+            self.io.flush()
+            self.transport.close()
+        else:
+            self.endpoint.remove_connection(self)
+
+    def expire(self):
+        """Drop the connection after the peer went silent."""
+        print(f"Connection {self.connection_id} expired after being idle.")
+        self.abandon()
+
+    def abandon(self):
+        """Drop the connection without telling the peer, waking anything still waiting on it."""
+        self.peer_closed = True
+        self.discard_in_flight()
+        self.wake_readers()
+        self.events.put_nowait(ConnectionClosed())
+        self.progress.set()
+        self.release()
@@ -0,0 +1,166 @@
+import time
+import zlib
+from collections import deque
+
+# Stream codecs, offered by the client in its stream request as a bit mask of their IDs. 'store' sends
+# the bytes as they are and is always understood, 'zlib' streams start with a zlib stream.
+CODECS = {'store': 0, 'zlib': 1}
+DEFAULT_COMPRESSION_LEVEL = 1  # Speed counts for more than the last few percent of ratio
+SAMPLE_BYTES = 64 * 1024  # Input bytes between two decisions whether compression is still worth it
+MIN_SAVING = 0.1  # Fraction of the input compression has to save to stay on
+MAX_DECODED_CHUNK = 64 * 1024  # Decoded bytes a receiver produces at a time, the next once they are consumed
+
+
+def encode_codecs(codecs) -> int:
+    mask = 0
+    for codec in codecs:
+        mask |= 1 << CODECS[codec]
+    return mask
+
+
+def decode_codecs(mask: int) -> tuple:
+    return tuple(codec for codec, codec_id in CODECS.items() if mask & (1 << codec_id))
+
+
+class QuicStreamCompressor:
+    """Compresses the data of one sent stream with a single zlib stream, until it stops paying off.
+
+    Every chunk is compressed with a sync flush, so what send() was given reaches the peer
+    without waiting for more. After every SAMPLE_BYTES of input the last sample is judged:
+    compression stays on only if it saved at least min_saving of the bytes and saves more
+    sending time than it costs, compressed_rate * saving > link_rate, with link_rate the
+    connection's delivery rate. Otherwise the zlib stream is finished and the rest of the
+    stream follows as is. The receiver sees where the zlib stream ends, so the stream
+    offsets need no marker and the compressor is never turned back on.
+    """
+
+    def __init__(self, level: int = DEFAULT_COMPRESSION_LEVEL, sample_bytes: int = SAMPLE_BYTES,
+                 min_saving: float = MIN_SAVING):
+        self.compressor = zlib.compressobj(level)
+        self.active = True
+        self.sample_bytes = sample_bytes
+        self.min_saving = min_saving
+        self.sample_in = 0
+        self.sample_out = 0
+        self.sample_seconds = 0.0
+        self.stats = {'bytes_in': 0, 'bytes_out': 0, 'seconds': 0.0, 'switched_off_at': None}
+
+    def compress(self, data, end_of_stream: bool, link_rate: float = None) -> bytes:
+        """Return the bytes to send for data, link_rate is the delivery rate in bytes per second if known."""
+        if not self.active:
+            self.stats['bytes_in'] += len(data)
+            self.stats['bytes_out'] += len(data)
+            return data
+
+        start = time.perf_counter()
+        out = self.compressor.compress(data)
+        out += self.compressor.flush(zlib.Z_FINISH if end_of_stream else zlib.Z_SYNC_FLUSH)
+        elapsed = time.perf_counter() - start
+        self.sample_in += len(data)
+        self.sample_out += len(out)
+        self.sample_seconds += elapsed
+        self.stats['bytes_in'] += len(data)
+        self.stats['seconds'] += elapsed
+
+        if end_of_stream:
+            self.active = False
+        elif self.sample_in >= self.sample_bytes:
+            if not self.worth_it(link_rate):
+                out += self.compressor.flush(zlib.Z_FINISH)  # The rest of the stream goes as is
+                self.active = False
+                self.stats['switched_off_at'] = self.stats['bytes_in']
+            self.sample_in = self.sample_out = 0
+            self.sample_seconds = 0.0
+        self.stats['bytes_out'] += len(out)
+        return out
+
+    def worth_it(self, link_rate: float) -> bool:
+        saving = 1 - self.sample_out / self.sample_in
+        if saving < self.min_saving:
+            return False
+        if link_rate is None or self.sample_seconds <= 0:
+            return True
+        return self.sample_in / self.sample_seconds * saving > link_rate
+
+    def get_stats(self) -> dict:
+        return dict(self.stats, active=self.active)
+
+
+class QuicStreamDecompressor:
+    """Decodes a received zlib stream in order, passing the bytes behind the end of the zlib stream through.
+
+    Received bytes are only fed in, and decode() turns at most max_chunk of them into
+    decoded bytes per call, zlib keeps the rest of the input as unconsumed_tail. A small
+    compressed frame can expand a thousandfold, so the receiver decodes the next chunk
+    only once the application consumed the last one. What is not decoded yet still holds
+    its flow control credit, which keeps the memory bound of the receive windows.
+
+    Flow control counts the bytes on the wire, so for data read through a QuicStreamReader
+    it remembers where every decoded chunk ended in both counts, and turns the decoded
+    bytes the application consumed back into the wire bytes to credit.
+    """
+
+    def __init__(self, max_chunk: int = MAX_DECODED_CHUNK):
+        self.decompressor = zlib.decompressobj()
+        self.max_chunk = max_chunk
+        self.pending = deque()  # Received bytes not decoded yet, in order
+        self.output_pending = False  # The last decode() stopped at its limit, zlib may hold more output
+        self.wire_bytes = 0  # Received bytes decoded so far
+        self.decoded_bytes = 0
+        self.boundaries = deque()  # (decoded end, wire end) of chunks handed to a reader, not consumed yet
+        self.consumed_decoded = 0
+        self.credited_wire = 0
+
+    def feed(self, chunks: list):
+        """Add the next in-order received chunks of the stream, decoded by later decode() calls."""
+        for chunk in chunks:
+            if chunk:
+                self.pending.append(chunk)
+
+    def has_pending(self) -> bool:
+        """True while fed bytes may still decode to more data."""
+        return bool(self.pending) or self.output_pending
+
+    def decode(self, max_length: int = None) -> bytes:
+        """Return up to max_length (max_chunk by default) decoded bytes of what was fed."""
+        limit = max_length or self.max_chunk
+        decompressor = self.decompressor
+        parts = []
+        produced = 0
+        while self.has_pending() and produced < limit:
+            data = self.pending.popleft() if self.pending else b""
+            if decompressor.eof:
+                out = data[:limit - produced]
+                rest = data[len(out):]
+            else:
+                out = decompressor.decompress(data, limit - produced)
+                self.output_pending = len(out) == limit - produced
+                rest = decompressor.unconsumed_tail
+                if decompressor.eof:
+                    rest = decompressor.unused_data  # Compression was switched off here, the rest passes through
+                    self.output_pending = False
+            if rest:
+                self.pending.appendleft(rest)
+            self.wire_bytes += len(data) - len(rest)
+            produced += len(out)
+            parts.append(out)
+        data = parts[0] if len(parts) == 1 else b"".join(parts)
+        self.decoded_bytes += len(data)
+        return bytes(data)
+
+    def decode_chunk(self) -> bytes:
+        """Decode the next chunk for a reader, remembering how many wire bytes it took."""
+        out = self.decode()
+        if out:
+            self.boundaries.append((self.decoded_bytes, self.wire_bytes))
+        return out  # An empty chunk is credited together with the next decoded one
+
+    def wire_consumed(self, size: int) -> int:
+        """The reader consumed size more decoded bytes, return how many wire bytes that frees."""
+        self.consumed_decoded += size
+        credited = self.credited_wire
+        boundaries = self.boundaries
+        while boundaries and boundaries[0][0] <= self.consumed_decoded:
+            credited = boundaries.popleft()[1]
+        size, self.credited_wire = credited - self.credited_wire, credited
+        return size
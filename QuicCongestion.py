@@ -0,0 +1,165 @@
+from abc import ABC, abstractmethod
+
+K_MAX_DATAGRAM_SIZE = 1200  # Bytes, used to size the windows
+K_LOSS_REDUCTION_FACTOR = 0.5
+
+K_CUBIC_C = 0.4
+K_CUBIC_BETA = 0.7
+
+
+class QuicCongestionController(ABC):
+    """Interface shared by the congestion control algorithms, tracks the window and bytes in flight."""
+
+    def __init__(self, max_datagram_size: int = K_MAX_DATAGRAM_SIZE):
+        self.max_datagram_size = max_datagram_size
+        self.congestion_window = 10 * max_datagram_size
+        self.minimum_window = 2 * max_datagram_size
+        self.ssthresh = float('inf')  # Slow start threshold
+        self.bytes_in_flight = 0
+        self.recovery_start_time = None  # Packets sent before this belong to the current recovery period
+
+    def can_send(self) -> bool:
+        """Always let one packet out when nothing is in flight, so large packets cannot stall."""
+        return self.bytes_in_flight == 0 or self.bytes_in_flight < self.congestion_window
+
+    def in_slow_start(self) -> bool:
+        return self.congestion_window < self.ssthresh
+
+    def in_recovery(self, time_sent: float) -> bool:
+        return self.recovery_start_time is not None and time_sent <= self.recovery_start_time
+
+    def on_packet_sent(self, size: int):
+        self.bytes_in_flight += size
+
+    def on_packets_acked(self, acked_packets: list, now: float):
+        for sent_packet in acked_packets:
+            self.bytes_in_flight -= sent_packet.size
+            if self.in_recovery(sent_packet.time_sent):
+                continue  # Do not grow the window during recovery
+            if self.in_slow_start():
+                self.congestion_window += sent_packet.size
+            else:
+                self.increase_window(sent_packet.size, now)
+
+    def on_packets_lost(self, lost_packets: list, now: float):
+        if not lost_packets:
+            return
+        for sent_packet in lost_packets:
+            self.bytes_in_flight -= sent_packet.size
+        self.on_congestion_event(max(sent_packet.time_sent for sent_packet in lost_packets), now)
+
+    def on_packets_discarded(self, packets: list):
+        """Remove packets from flight without treating them as a congestion signal."""
+        for sent_packet in packets:
+            self.bytes_in_flight -= sent_packet.size
+
+    def reset_in_flight(self):
+        self.bytes_in_flight = 0
+
+    def on_congestion_event(self, time_sent: float, now: float):
+        if self.in_recovery(time_sent):
+            return  # Only one reduction per round trip
+        self.recovery_start_time = now
+        self.reduce_window(now)
+
+    @abstractmethod
+    def increase_window(self, acked_size: int, now: float):
+        """Grow the window for acked_size bytes acknowledged in congestion avoidance."""
+
+    @abstractmethod
+    def reduce_window(self, now: float):
+        """Shrink the window at the start of a recovery period."""
+
+
+class NewRenoCongestionController(QuicCongestionController):
+    """RFC 9002 NewReno: additive increase, halve the window on loss."""
+
+    def increase_window(self, acked_size: int, now: float):
+        self.congestion_window += self.max_datagram_size * acked_size / self.congestion_window
+
+    def reduce_window(self, now: float):
+        self.ssthresh = max(self.congestion_window * K_LOSS_REDUCTION_FACTOR, self.minimum_window)
+        self.congestion_window = self.ssthresh
+
+
+class CubicCongestionController(QuicCongestionController):
+    """RFC 9438 CUBIC: the window follows a cubic curve around the size it had at the last loss."""
+
+    def __init__(self, max_datagram_size: int = K_MAX_DATAGRAM_SIZE):
+        super().__init__(max_datagram_size)
+        self.w_max = 0.0  # Window right before the last reduction
+        self.w_est = 0.0  # Reno-friendly estimate of the window
+        self.k = 0.0  # Time it takes the cubic curve to get back to w_max
+        self.epoch_start = None
+
+    def increase_window(self, acked_size: int, now: float):
+        if self.epoch_start is None:
+            # First congestion avoidance round without a previous loss
+            self.epoch_start = now
+            self.w_max = self.congestion_window
+            self.w_est = self.congestion_window
+            self.k = 0.0
+
+        t = now - self.epoch_start
+        target = self.w_max + K_CUBIC_C * (t - self.k) ** 3 * self.max_datagram_size
+
+        # Stay at least as aggressive as Reno would be
+        alpha = 3 * (1 - K_CUBIC_BETA) / (1 + K_CUBIC_BETA)
+        self.w_est += alpha * self.max_datagram_size * acked_size / self.congestion_window
+
+        if target > self.congestion_window:
+            increase = (target - self.congestion_window) / self.congestion_window * acked_size
+            self.congestion_window += min(increase, acked_size / 2)
+        if self.w_est > self.congestion_window:
+            self.congestion_window = self.w_est
+
+    def reduce_window(self, now: float):
+        # Fast convergence: release bandwidth sooner when the window keeps shrinking
+        if self.congestion_window < self.w_max:
+            self.w_max = self.congestion_window * (1 + K_CUBIC_BETA) / 2
+        else:
+            self.w_max = self.congestion_window
+
+        self.congestion_window = max(self.congestion_window * K_CUBIC_BETA, self.minimum_window)
+        self.ssthresh = self.congestion_window
+        self.w_est = self.congestion_window
+        self.k = (self.w_max * (1 - K_CUBIC_BETA) / (K_CUBIC_C * self.max_datagram_size)) ** (1 / 3)
+        self.epoch_start = now
+
+
+class TokenBucketPacer:
+    """Spreads packets over the RTT instead of sending the whole window in one burst."""
+
+    PACING_GAIN = 1.25  # Pace slightly faster than cwnd / RTT so the window can still fill
+
+    def __init__(self, burst: int = 10 * K_MAX_DATAGRAM_SIZE):
+        self.burst = burst  # Bucket capacity in bytes
+        self.tokens = burst
+        self.rate = None  # Bytes per second, None until the first update
+        self.last_refill = None
+
+    def update_rate(self, congestion_window: float, smoothed_rtt: float):
+        if smoothed_rtt > 0:
+            self.rate = self.PACING_GAIN * congestion_window / smoothed_rtt
+
+    def _refill(self, now: float):
+        if self.last_refill is not None and self.rate is not None:
+            self.tokens = min(self.burst, self.tokens + (now - self.last_refill) * self.rate)
+        self.last_refill = now
+
+    def time_until_send(self, size: int, now: float) -> float:
+        """Seconds to wait before a packet of size bytes may leave."""
+        self._refill(now)
+        if self.rate is None or self.tokens >= min(size, self.burst):
+            return 0.0
+        return (min(size, self.burst) - self.tokens) / self.rate
+
+    def on_packet_sent(self, size: int, now: float):
+        self._refill(now)
+        self.tokens -= size
+
+
+CONGESTION_CONTROLLERS = {
+    'newreno': NewRenoCongestionController,
+    'cubic': CubicCongestionController,
+}
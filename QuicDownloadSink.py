@@ -0,0 +1,184 @@
+import bisect
+import os
+import struct
+import time
+
+BLOCK_SIZE = 64 * 1024  # Granularity of the completion bitmap
+PREALLOCATE_STEP = 8 * 1024 * 1024  # The file is grown at least this much ahead of the data
+CHECKPOINT_BYTES = 64 * 1024 * 1024  # New bytes between two syncs of the data and the bitmap
+BITMAP_HEADER = struct.Struct('!4sIQ')  # magic, block size, final size (0 while unknown)
+BITMAP_MAGIC = b'QDLB'
+
+
+class QuicDownloadSink:
+    """Writes the data of one received stream straight into a file, at the offset of every frame.
+
+    Frames are written with os.pwrite as they arrive, out of order data lands in place
+    and nothing is buffered in memory. Blocks of BLOCK_SIZE bytes that are complete are
+    recorded in a bitmap file next to the download (path + '.blocks') after the data is
+    synced, so an interrupted download can be reopened: the recorded blocks are not
+    written again and missing_ranges() tells what is still needed. The bitmap is removed
+    once the whole stream is written.
+
+    Resuming only saves disk writes. The stream request carries no offsets, so the
+    server sends the whole stream again. Frames that fall in recorded blocks are
+    dropped on arrival, and they still count as flow control credit.
+    """
+
+    def __init__(self, path: str, block_size: int = BLOCK_SIZE):
+        self.path = path
+        self.bitmap_path = path + '.blocks'
+        self.block_size = block_size
+        self.final_size = None  # Known once the FIN frame arrives, or from the bitmap of a resumed download
+        self.starts = []  # Sorted starts of the merged [start, end) ranges written so far
+        self.ends = []
+        self.bytes_written = 0  # Distinct bytes of the stream on disk
+        self.writes = 0
+        self.unsynced_bytes = 0
+        self.allocated = 0  # File size reserved so far
+        self.finish_time = None
+        self.fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        self.allocated = os.fstat(self.fd).st_size
+        self.load_bitmap()
+
+    def load_bitmap(self):
+        """Mark the blocks recorded by a previous, interrupted download as written."""
+        try:
+            with open(self.bitmap_path, 'rb') as file:
+                data = file.read()
+        except FileNotFoundError:
+            return
+        magic, block_size, final_size = BITMAP_HEADER.unpack_from(data)
+        if magic != BITMAP_MAGIC or block_size != self.block_size:
+            return  # Unknown layout, download everything again
+        if final_size:
+            self.final_size = final_size
+        bitmap = data[BITMAP_HEADER.size:]
+        for block in range(len(bitmap) * 8):
+            if bitmap[block >> 3] & (0x80 >> (block & 7)):
+                start = block * self.block_size
+                end = start + self.block_size
+                if self.final_size is not None:
+                    end = min(end, self.final_size)
+                self.add_range(start, end)
+
+    def missing_ranges(self) -> list:
+        """The [start, end) ranges not written yet, the last one is open ended (None) while the size is unknown."""
+        missing = []
+        pos = 0
+        for start, end in zip(self.starts, self.ends):
+            if start > pos:
+                missing.append((pos, start))
+            pos = end
+        if self.final_size is None:
+            missing.append((pos, None))
+        elif pos < self.final_size:
+            missing.append((pos, self.final_size))
+        return missing
+
+    def is_complete(self) -> bool:
+        return self.final_size is not None and self.bytes_written >= self.final_size
+
+    def add_range(self, start: int, end: int) -> int:
+        """Record [start, end) as written and return how many of its bytes were not recorded before."""
+        index = bisect.bisect_right(self.starts, start) - 1
+        if index >= 0 and self.ends[index] >= start:
+            if self.ends[index] >= end:
+                return 0  # Already written
+            start = self.starts[index]
+        else:
+            index += 1
+
+        # Merge every range [start, end) touches
+        covered = 0
+        last = index
+        while last < len(self.starts) and self.starts[last] <= end:
+            covered += self.ends[last] - self.starts[last]
+            end = max(end, self.ends[last])
+            last += 1
+        self.starts[index:last] = [start]
+        self.ends[index:last] = [end]
+        new_bytes = end - start - covered
+        self.bytes_written += new_bytes
+        return new_bytes
+
+    def write(self, offset: int, data) -> int:
+        """Write data at offset unless every byte of it is on disk already, returns the number of new bytes."""
+        end = offset + len(data)
+        index = bisect.bisect_right(self.starts, offset) - 1
+        if index >= 0 and self.ends[index] >= end:
+            return 0  # A retransmission, or a block finished before the download was resumed
+
+        self.preallocate(end)
+        written = os.pwrite(self.fd, data, offset)
+        while written < len(data):
+            written += os.pwrite(self.fd, data[written:], offset + written)
+        self.writes += 1
+        new_bytes = self.add_range(offset, end)
+        self.unsynced_bytes += new_bytes
+        if self.unsynced_bytes >= CHECKPOINT_BYTES:
+            self.checkpoint()
+        return new_bytes
+
+    def preallocate(self, end: int):
+        """Reserve the file up to end, a step ahead, so the download doesn't grow it one write at a time."""
+        if end <= self.allocated:
+            return
+        size = max(end, self.allocated + PREALLOCATE_STEP)
+        if self.final_size is not None:
+            size = max(min(size, self.final_size), end)
+        if hasattr(os, 'posix_fallocate'):
+            try:
+                os.posix_fallocate(self.fd, self.allocated, size - self.allocated)
+            except OSError:
+                os.ftruncate(self.fd, size)  # The file system can't reserve blocks, only extend it
+        else:
+            os.ftruncate(self.fd, size)
+        self.allocated = size
+
+    def set_final_size(self, size: int):
+        """The FIN frame arrived: the stream ends at size."""
+        self.final_size = size
+        self.preallocate(size)
+
+    def complete_blocks(self) -> bytearray:
+        """Bitmap of the blocks whose every byte is written."""
+        size = self.final_size if self.final_size is not None else (self.ends[-1] if self.ends else 0)
+        num_blocks = (size + self.block_size - 1) // self.block_size
+        bitmap = bytearray((num_blocks + 7) // 8)
+        for start, end in zip(self.starts, self.ends):
+            first = (start + self.block_size - 1) // self.block_size
+            last = end // self.block_size  # Blocks [first, last) are covered
+            if end == self.final_size:
+                last = num_blocks  # A short last block is complete at the end of the stream
+            for block in range(first, last):
+                bitmap[block >> 3] |= 0x80 >> (block & 7)
+        return bitmap
+
+    def checkpoint(self):
+        """Sync the data, then record the complete blocks, so the bitmap never claims data that is not on disk."""
+        os.fsync(self.fd)
+        self.unsynced_bytes = 0
+        temporary_path = self.bitmap_path + '.tmp'
+        with open(temporary_path, 'wb') as file:
+            file.write(BITMAP_HEADER.pack(BITMAP_MAGIC, self.block_size, self.final_size or 0))
+            file.write(self.complete_blocks())
+        os.replace(temporary_path, self.bitmap_path)
+
+    def finish(self):
+        """The whole stream is written: trim the preallocation and drop the bitmap."""
+        os.ftruncate(self.fd, self.final_size)
+        os.fsync(self.fd)
+        self.allocated = self.final_size
+        self.finish_time = time.time()
+        if os.path.exists(self.bitmap_path):
+            os.remove(self.bitmap_path)
+
+    def close(self):
+        """Close the file, recording the progress of an unfinished download."""
+        if self.fd is None:
+            return
+        if not self.is_complete() and self.bytes_written:
+            self.checkpoint()
+        os.close(self.fd)
+        self.fd = None
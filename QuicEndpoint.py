@@ -0,0 +1,211 @@
+import asyncio
+import random
+import time
+from QuicPacket import QUICPacket, MAX_CONNECTION_ID, SessionTicketFrame
+from QuicAsync import AsyncQUICProtocol, open_datagram_socket, create_loop_datagram_io
+from QuicSessionTicket import QuicTicketIssuer
+
+
+class QUICServerEndpoint(asyncio.DatagramProtocol):
+    """Server side of many connections sharing one UDP socket.
+
+    Datagrams are routed to their connection through a connection ID table, each
+    connection keeps its own streams, packet numbers and ACK state. Once a handshake
+    completes, handler(connection) is started as a task on the loop.
+
+    Every START is answered with a resumption ticket. A client that comes back with one
+    can put its stream request in its first datagram: if ticket_issuer accepts the ticket
+    the handler starts right away (0-RTT), sending no more than the amplification limit
+    until the client's first packet with its connection ID validates its address.
+
+    Clients of the fixed-width packet format from before varints are not served. Their
+    START is answered with a FIN in their own format, see QUICProtocol.legacy_rejection(),
+    and their other packets are counted and dropped.
+    """
+
+    def __init__(self, handler, idle_timeout: float = 30.0, window_size: int = 32,
+                 congestion_control: str = 'newreno', worker_index: int = None, max_datagram_size: int = 1200,
+                 scheduler: str = 'round_robin', tracer_factory=None, ticket_issuer: QuicTicketIssuer = None):
+        self.handler = handler  # Coroutine function run for every established connection
+        self.worker_index = worker_index  # Encoded into connection IDs when sharded across processes
+        self.idle_timeout = idle_timeout  # Seconds without a packet before a connection is dropped
+        self.window_size = window_size
+        self.congestion_control = congestion_control
+        self.max_datagram_size = max_datagram_size
+        self.scheduler = scheduler  # Stream scheduler policy of every connection
+        self.tracer_factory = tracer_factory  # tracer_factory(connection_id) -> QuicTracer, None to skip tracing
+        self.ticket_issuer = ticket_issuer if ticket_issuer is not None else QuicTicketIssuer()
+        self.transport = None
+        self.io = None  # Batched sends of every connection, see create_loop_datagram_io()
+        self.loop = None
+        self.connections = {}  # Connection ID -> AsyncQUICProtocol
+        self.handshakes = {}  # Client address -> connection waiting for the handshake ACK
+        self.expire_timer = None
+        self.handler_tasks = set()  # Running handler(connection) tasks, cancelled by close()
+        self.stats = {'connections_accepted': 0, 'connections_expired': 0, 'packets_received': 0,
+                      'packets_unknown_connection': 0, 'packets_legacy_format': 0, 'packets_invalid': 0,
+                      'socket_errors': 0, 'early_requests_accepted': 0, 'early_requests_rejected': 0}
+
+    async def listen(self, host: str = None, port: int = None, sock=None):
+        """Start receiving on (host, port), or on an already bound socket."""
+        self.loop = asyncio.get_running_loop()
+        if sock is None:
+            sock = open_datagram_socket(host, port)
+        await self.loop.create_datagram_endpoint(lambda: self, sock=sock)
+        self.io = create_loop_datagram_io(sock, self.loop, self.error_received)
+        self.schedule_expiry()
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def error_received(self, exc):
+        self.stats['socket_errors'] += 1
+
+    def new_connection_id(self) -> int:
+        """Pick an unused connection ID, the lowest byte holds worker_index + 1 when sharded."""
+        while True:
+            if self.worker_index is not None:
+                connection_id = (random.randint(1, MAX_CONNECTION_ID >> 8) << 8) | (self.worker_index + 1)
+            else:
+                connection_id = random.randint(1, MAX_CONNECTION_ID)
+            if connection_id not in self.connections:
+                return connection_id
+
+    def datagram_received(self, data: bytes, addr):
+        try:
+            packet = QUICPacket.deserialize(data)
+        except Exception:
+            self.stats['packets_invalid'] += 1
+            return
+
+        self.stats['packets_received'] += 1
+
+        if packet.legacy:
+            # Peers of the fixed-width format are recognized, but only varint packets are served
+            self.stats['packets_legacy_format'] += 1
+            rejection = AsyncQUICProtocol.legacy_rejection(packet)
+            if rejection is not None:
+                self.io.queue(rejection, addr)
+            return
+
+        if packet.flags & AsyncQUICProtocol.START_CONNECTION_FLAG and packet.connection_id == 0:
+            self.accept_connection(addr, packet, len(data))
+            return
+
+        connection = self.connections.get(packet.connection_id)
+        if connection is None:
+            self.stats['packets_unknown_connection'] += 1  # Often a straggler of a closed connection
+            return
+
+        # Any packet with the new connection ID completes the handshake, even if its ACK was lost
+        if self.handshakes.get(addr) is connection:
+            del self.handshakes[addr]
+            print(f"Client acknowledged the connection with ID: {connection.connection_id}")
+            if connection.early_data_accepted:
+                connection.on_address_validated()  # The handler is running already
+            else:
+                self.start_handler(connection)
+
+        connection.packet_received(packet, addr)
+
+    def accept_connection(self, addr, packet: QUICPacket, size: int):
+        """Answer a START packet of size bytes, a repeated START gets the same connection ID again."""
+        connection = self.handshakes.get(addr)
+        if connection is None:
+            connection = AsyncQUICProtocol(is_client=False, window_size=self.window_size,
+                                           congestion_control=self.congestion_control,
+                                           max_datagram_size=self.max_datagram_size,
+                                           scheduler=self.scheduler)
+            connection.loop = self.loop
+            connection.transport = self.transport
+            connection.io = self.io
+            connection.endpoint = self
+            connection.address = addr
+            connection.connection_id = self.new_connection_id()
+            if self.tracer_factory is not None:
+                connection.tracer = self.tracer_factory(connection.connection_id)
+            self.connections[connection.connection_id] = connection
+            self.handshakes[addr] = connection
+            self.stats['connections_accepted'] += 1
+            print(f"Generated connection ID: {connection.connection_id} for {addr}")
+            if packet.flags & AsyncQUICProtocol.STREAM_REQUEST_FLAG:
+                self.accept_early_request(connection, packet, size)
+        elif connection.amplification_credit is not None:
+            connection.limit_amplification(size)  # A resent START, the client lost ours
+
+        # Answer with a ticket for the next connection, and tell whether the early request is served.
+        # The START takes a packet number of its own: data may be in flight already when the client
+        # acknowledges it
+        flags = AsyncQUICProtocol.START_CONNECTION_FLAG
+        if connection.early_data_accepted:
+            flags |= AsyncQUICProtocol.STREAM_REQUEST_FLAG
+        connection.packet_number += 1
+        start_packet = QUICPacket(
+            flags=flags,
+            connection_id=connection.connection_id,
+            packet_number=connection.packet_number,
+            frames=[SessionTicketFrame(self.ticket_issuer.lifetime, self.ticket_issuer.issue())]
+        )
+        connection.send_packet(start_packet)
+
+    def accept_early_request(self, connection: AsyncQUICProtocol, packet: QUICPacket, size: int):
+        """Serve the stream request of a client's first datagram if it comes with a ticket not redeemed before.
+
+        Otherwise the request is ignored, the client sends it again once the handshake is done.
+        """
+        ticket = next((frame.ticket for frame in packet.frames if isinstance(frame, SessionTicketFrame)), None)
+        if ticket is None or not self.ticket_issuer.accept_early_data(ticket):
+            self.stats['early_requests_rejected'] += 1
+            print(f"Early stream request of {connection.address} rejected, waiting for the handshake.")
+            return
+
+        if not connection.handle_stream_request(packet):
+            self.stats['early_requests_rejected'] += 1
+            return
+
+        self.stats['early_requests_accepted'] += 1
+        connection.early_data_accepted = True
+        connection.limit_amplification(size)
+        self.start_handler(connection)
+
+    def start_handler(self, connection: AsyncQUICProtocol):
+        task = self.loop.create_task(self.handler(connection))
+        self.handler_tasks.add(task)
+        task.add_done_callback(self.handler_tasks.discard)
+
+    def remove_connection(self, connection: AsyncQUICProtocol):
+        self.connections.pop(connection.connection_id, None)
+        if self.handshakes.get(connection.address) is connection:
+            del self.handshakes[connection.address]
+
+    def schedule_expiry(self):
+        self.expire_timer = self.loop.call_later(self.idle_timeout / 2, self.expire_idle_connections)
+
+    def expire_idle_connections(self):
+        """Drop connections that have not received a packet for idle_timeout seconds."""
+        deadline = time.monotonic() - self.idle_timeout
+        for connection in list(self.connections.values()):
+            if connection.last_activity < deadline:
+                self.stats['connections_expired'] += 1
+                connection.expire()
+        self.schedule_expiry()
+
+    def get_stats(self) -> dict:
+        stats = dict(self.stats, connections_active=len(self.connections))
+        for key, value in self.ticket_issuer.get_stats().items():
+            stats[f'tickets_{key}'] = value
+        return stats
+
+    async def close(self):
+        """Stop the handlers and drop every connection, then close the socket."""
+        if self.expire_timer is not None:
+            self.expire_timer.cancel()
+        tasks = list(self.handler_tasks)
+        for task in tasks:
+            task.cancel()
+        for connection in list(self.connections.values()):
+            connection.abandon()
+        # A handler may be sending until its task is cancelled, the transport goes only once they all returned
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self.io.flush()
+        self.transport.close()
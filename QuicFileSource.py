@@ -0,0 +1,84 @@
+import mmap
+import os
+
+
+class QuicFileSource:
+    """A served file, memory-mapped once and shared by every stream that sends it.
+
+    Streams read through a QuicFileCursor, which only holds an offset: the chunks it
+    returns are memoryview slices of the mapping, so the data is first copied when a
+    packet is encoded. The mapping can only be closed once no frame references it anymore.
+
+    The file is mapped again when a cursor is opened after its size or modification time
+    changed, cursors already open keep reading the mapping they started with. Replace the
+    file with a rename rather than rewriting it in place: reading a page of a mapping whose
+    file was truncated kills the process with SIGBUS.
+    """
+
+    def __init__(self, path: str = None, data=None):
+        self.path = path
+        self.mapping = None
+        self.version = None  # (size, modification time) of the mapped file
+        if path is not None:
+            self.map_file()
+        else:
+            self.view = memoryview(data).cast('B')
+            self.size = len(self.view)
+
+    def map_file(self):
+        with open(self.path, 'rb') as file:
+            stat = os.fstat(file.fileno())
+            mapping = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) if stat.st_size else None
+        # The previous mapping is unmapped once the cursors and frames that reference it are gone
+        self.mapping = mapping
+        self.view = memoryview(mapping if mapping is not None else b"").cast('B')
+        self.size = len(self.view)
+        self.version = (stat.st_size, stat.st_mtime_ns)
+
+    def refresh(self):
+        """Map the file again if it changed since it was mapped."""
+        if self.path is None:
+            return
+        stat = os.stat(self.path)
+        if (stat.st_size, stat.st_mtime_ns) != self.version:
+            self.map_file()
+
+    @classmethod
+    def from_bytes(cls, data) -> 'QuicFileSource':
+        """Serve data that is already in memory, without copying it."""
+        return cls(data=data)
+
+    def __len__(self):
+        return self.size
+
+    def cursor(self, offset: int = 0) -> 'QuicFileCursor':
+        self.refresh()
+        return QuicFileCursor(self, offset)
+
+    def close(self):
+        self.view.release()
+        if self.mapping is not None:
+            self.mapping.close()
+
+
+class QuicFileCursor:
+    """Read position of one stream in a QuicFileSource, on the mapping that was current when it was opened."""
+
+    __slots__ = ('view', 'size', 'offset')
+
+    def __init__(self, source: QuicFileSource, offset: int = 0):
+        self.view = source.view
+        self.size = source.size
+        self.offset = offset
+
+    def remaining(self) -> int:
+        return self.size - self.offset
+
+    def at_end(self) -> bool:
+        return self.offset >= self.size
+
+    def read(self, size: int) -> memoryview:
+        """Return the next size bytes (fewer at the end of the file) as a view of the mapping."""
+        chunk = self.view[self.offset:self.offset + size]
+        self.offset += len(chunk)
+        return chunk
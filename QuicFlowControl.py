@@ -0,0 +1,66 @@
+INITIAL_STREAM_WINDOW = 256 * 1024  # Bytes a peer may send on a new stream before the first MAX_STREAM_DATA
+INITIAL_CONNECTION_WINDOW = 1024 * 1024  # Bytes a peer may send on all streams before the first MAX_DATA
+MAX_STREAM_WINDOW = 16 * 1024 * 1024  # Auto-tuning never grows a stream window past this
+MAX_CONNECTION_WINDOW = 24 * 1024 * 1024  # Or a connection window past this
+CONNECTION_WINDOW_RATIO = 1.5  # The connection window stays this much larger than any stream window
+
+
+class QuicReceiveWindow:
+    """Receiver side flow control of a stream or of the whole connection.
+
+    The limit moves forward as the application consumes data. When a whole window is
+    consumed in less than two RTTs the window is too small for the bandwidth-delay
+    product and doubles, up to max_window.
+    """
+
+    def __init__(self, window: int, max_window: int):
+        self.window = window
+        self.max_window = max_window
+        self.max_data = window  # Highest offset the peer is allowed to send
+        self.received = 0  # Highest offset received so far
+        self.consumed = 0  # Bytes the application has read
+        self.last_update_time = None  # When max_data was last raised
+
+    def allows(self, end: int) -> bool:
+        return end <= self.max_data
+
+    def on_data_received(self, end: int):
+        if end > self.received:
+            self.received = end
+
+    def on_data_consumed(self, size: int, now: float, rtt: float) -> bool:
+        """Account for consumed data, returns True if max_data was raised and should be sent to the peer."""
+        self.consumed += size
+        if self.max_data - self.consumed > self.window / 2:
+            return False  # Still plenty of credit left, don't send an update for every read
+
+        if self.last_update_time is not None and now - self.last_update_time < 2 * rtt:
+            self.window = min(self.window * 2, self.max_window)
+        self.last_update_time = now
+        self.max_data = self.consumed + self.window
+        return True
+
+    def ensure_window(self, window: int):
+        """Grow the window to at least window bytes, used to keep the connection window ahead of a stream's."""
+        self.window = max(self.window, min(window, self.max_window))
+
+
+class QuicSendCredit:
+    """Sender side flow control: how much more data the peer allows."""
+
+    def __init__(self, max_data: int):
+        self.max_data = max_data  # Highest offset the peer allows
+        self.sent = 0  # Bytes handed to the packetizer
+
+    def available(self) -> int:
+        return max(self.max_data - self.sent, 0)
+
+    def on_data_sent(self, size: int):
+        self.sent += size
+
+    def on_max_data(self, max_data: int) -> bool:
+        """Apply a MAX_DATA or MAX_STREAM_DATA limit from the peer, returns True if it raised the credit."""
+        if max_data <= self.max_data:
+            return False  # Reordered or retransmitted update
+        self.max_data = max_data
+        return True
@@ -0,0 +1,151 @@
+import errno
+import socket
+import struct
+import sys
+
+SOL_UDP = getattr(socket, 'SOL_UDP', 17)
+UDP_SEGMENT = getattr(socket, 'UDP_SEGMENT', 103)  # Linux UDP GSO
+UDP_GRO = getattr(socket, 'UDP_GRO', 104)  # Linux UDP GRO
+
+MAX_GSO_SEGMENTS = 64  # Kernel limit on segments per GSO send
+MAX_GSO_BYTES = 65000  # Stay below the 65535 byte IP payload limit
+GRO_SIZE = struct.Struct('=i')
+GSO_SIZE = struct.Struct('=H')
+
+
+class QuicDatagramIO:
+    """Batches datagrams and sends them with plain sendto calls on flush.
+
+    Receiving returns every datagram already waiting on the socket, so the caller handles
+    a whole batch (and queues its ACKs) before the next blocking syscall.
+    """
+
+    def __init__(self, sock: socket.socket, max_batch: int = 32, buffer_size: int = 65535, on_send_error=None):
+        self.socket = sock
+        self.max_batch = max_batch  # Flush automatically once this many datagrams are queued
+        self.buffer_size = buffer_size
+        self.pending = []  # (datagram, address) waiting for the next flush
+        self.on_send_error = on_send_error  # on_send_error(error) for a send the socket refused, None to raise
+        self.on_queued = None  # on_queued() when a datagram is queued with none pending, to schedule the flush
+
+    def queue(self, datagram, address):
+        self.pending.append((bytes(datagram), address))
+        if len(self.pending) >= self.max_batch:
+            self.flush()
+        elif len(self.pending) == 1 and self.on_queued is not None:
+            self.on_queued()
+
+    def flush(self):
+        pending, self.pending = self.pending, []
+        for datagram, address in pending:
+            self.send_to(datagram, address)
+
+    def send_to(self, datagram, address):
+        try:
+            self.socket.sendto(datagram, address)
+        except OSError as e:
+            self.send_failed(e)
+
+    def send_failed(self, error: OSError):
+        """A refused datagram is lost like one the network dropped, the rest of the batch still goes out."""
+        if self.on_send_error is None:
+            raise error
+        self.on_send_error(error)
+
+    def recv_one(self) -> list:
+        data, address = self.socket.recvfrom(self.buffer_size)
+        return [(data, address)]
+
+    def recv(self) -> list:
+        """Wait for a datagram (following the socket timeout), then drain what else is queued."""
+        datagrams = self.recv_one()
+
+        timeout = self.socket.gettimeout()
+        self.socket.settimeout(0.0)
+        try:
+            while len(datagrams) < self.max_batch:
+                datagrams.extend(self.recv_one())
+        except BlockingIOError:
+            pass
+        finally:
+            self.socket.settimeout(timeout)
+        return datagrams
+
+
+class QuicOffloadIO(QuicDatagramIO):
+    """Linux backend: runs of equal-size datagrams go out as one UDP_SEGMENT (GSO) send,
+    and UDP_GRO coalesced receives are split back into datagrams."""
+
+    def __init__(self, sock: socket.socket, max_batch: int = 32, buffer_size: int = 65535, on_send_error=None,
+                 gro: bool = True):
+        super().__init__(sock, max_batch, buffer_size, on_send_error)
+        self.gso = True  # Cleared the first time the kernel rejects a segmented send
+        self.gro = False
+        if gro:
+            try:
+                sock.setsockopt(SOL_UDP, UDP_GRO, 1)
+                self.gro = True
+            except OSError:
+                pass
+        self.ancillary_size = socket.CMSG_SPACE(GRO_SIZE.size)
+
+    def flush(self):
+        pending, self.pending = self.pending, []
+        index = 0
+        while index < len(pending):
+            datagram, address = pending[index]
+            segment_size = len(datagram)
+
+            # Collect a run to the same address where every datagram but the last has segment_size bytes
+            end = index + 1
+            total = segment_size
+            while (end < len(pending) and end - index < MAX_GSO_SEGMENTS and pending[end][1] == address and
+                   len(pending[end][0]) <= segment_size and total + len(pending[end][0]) <= MAX_GSO_BYTES):
+                total += len(pending[end][0])
+                end += 1
+                if len(pending[end - 1][0]) < segment_size:
+                    break  # A shorter datagram can only be the last segment
+
+            if end - index > 1 and self.gso:
+                try:
+                    self.socket.sendmsg([b''.join(datagram for datagram, _ in pending[index:end])],
+                                       [(SOL_UDP, UDP_SEGMENT, GSO_SIZE.pack(segment_size))], 0, address)
+                    index = end
+                    continue
+                except OSError as e:
+                    if e.errno not in (errno.EINVAL, errno.EIO, errno.ENOPROTOOPT, errno.EOPNOTSUPP):
+                        self.send_failed(e)
+                        index = end
+                        continue
+                    self.gso = False  # Not supported here, send the run one datagram at a time
+
+            for datagram, address in pending[index:end]:
+                self.send_to(datagram, address)
+            index = end
+
+    def recv_one(self) -> list:
+        if not self.gro:
+            return super().recv_one()
+
+        data, ancillary, _, address = self.socket.recvmsg(self.buffer_size, self.ancillary_size)
+        segment_size = 0
+        for level, kind, value in ancillary:
+            if level == SOL_UDP and kind == UDP_GRO:
+                segment_size = GRO_SIZE.unpack(value[:GRO_SIZE.size])[0]
+
+        if segment_size <= 0 or segment_size >= len(data):
+            return [(data, address)]
+        view = memoryview(data)
+        return [(view[start:start + segment_size], address) for start in range(0, len(data), segment_size)]
+
+
+def create_datagram_io(sock: socket.socket, max_batch: int = 32, on_send_error=None,
+                       gro: bool = True) -> QuicDatagramIO:
+    """Use the GSO/GRO backend on Linux and batched plain syscalls elsewhere.
+
+    Pass gro=False when something else reads the socket, such as an event loop, that would
+    take coalesced datagrams for one.
+    """
+    if sys.platform.startswith('linux'):
+        return QuicOffloadIO(sock, max_batch, on_send_error=on_send_error, gro=gro)
+    return QuicDatagramIO(sock, max_batch, on_send_error=on_send_error)
@@ -0,0 +1,141 @@
+import asyncio
+import random
+
+
+class LinkProfile:
+    """Impairments applied to one direction of the emulated link."""
+
+    def __init__(self, delay: float = 0.0, jitter: float = 0.0, loss: float = 0.0, reorder: float = 0.0,
+                 bandwidth: float = None, queue_limit: int = 256 * 1024):
+        self.delay = delay  # One-way propagation delay in seconds
+        self.jitter = jitter  # Each datagram gets an extra uniform 0..jitter seconds
+        self.loss = loss  # Probability of dropping a datagram
+        self.reorder = reorder  # Probability of sending a datagram without the delay, ahead of earlier ones
+        self.bandwidth = bandwidth  # Bytes per second, None for unlimited
+        self.queue_limit = queue_limit  # Bytes waiting for the bandwidth limit before tail drop
+
+    def to_dict(self) -> dict:
+        return dict(self.__dict__)
+
+
+class LinkDirection:
+    """Schedules the delivery of the datagrams of one direction according to a LinkProfile."""
+
+    def __init__(self, profile: LinkProfile, rng: random.Random, loop):
+        self.profile = profile
+        self.rng = rng
+        self.loop = loop
+        self.busy_until = 0.0  # When the bandwidth limited link finishes sending what is queued
+        self.stats = {'forwarded': 0, 'dropped_loss': 0, 'dropped_queue': 0, 'reordered': 0, 'bytes': 0}
+
+    def send(self, data: bytes, deliver):
+        """Call deliver(data) once the emulated link would have carried data, or never if it is dropped."""
+        profile = self.profile
+        if profile.loss and self.rng.random() < profile.loss:
+            self.stats['dropped_loss'] += 1
+            return
+
+        now = self.loop.time()
+        departure = now
+        if profile.bandwidth:
+            start = max(now, self.busy_until)
+            if (start - now) * profile.bandwidth > profile.queue_limit:
+                self.stats['dropped_queue'] += 1
+                return
+            departure = self.busy_until = start + len(data) / profile.bandwidth
+
+        if profile.reorder and self.rng.random() < profile.reorder:
+            self.stats['reordered'] += 1  # Like netem, a reordered datagram skips the delay
+            arrival = departure
+        else:
+            arrival = departure + profile.delay + (self.rng.uniform(0, profile.jitter) if profile.jitter else 0.0)
+
+        self.stats['forwarded'] += 1
+        self.stats['bytes'] += len(data)
+        self.loop.call_at(arrival, deliver, data)
+
+
+class UpstreamProtocol(asyncio.DatagramProtocol):
+    """The proxy's socket towards the server for one client, replies go back through the downlink."""
+
+    def __init__(self, emulator, client_address):
+        self.emulator = emulator
+        self.client_address = client_address
+        self.transport = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def send(self, data: bytes):
+        if not self.transport.is_closing():
+            self.transport.sendto(data)
+
+    def datagram_received(self, data, addr):
+        self.emulator.downlink.send(data, lambda data: self.emulator.send_to_client(data, self.client_address))
+
+    def error_received(self, exc):
+        pass  # The server went away, the client will notice the silence
+
+
+class QuicLinkEmulator(asyncio.DatagramProtocol):
+    """UDP proxy that puts an emulated lossy link between clients and a server.
+
+    Clients send to the emulator's address, every client gets its own upstream socket so
+    the server sees distinct addresses. The uplink (client to server) and the downlink
+    impair each direction independently, seed makes the drop and reorder choices repeatable.
+    """
+
+    def __init__(self, server_address, uplink: LinkProfile = None, downlink: LinkProfile = None, seed: int = 0):
+        self.server_address = server_address
+        self.uplink_profile = uplink or LinkProfile()
+        self.downlink_profile = downlink or LinkProfile()
+        self.seed = seed
+        self.transport = None
+        self.loop = None
+        self.uplink = None
+        self.downlink = None
+        self.upstreams = {}  # Client address -> UpstreamProtocol
+        self.pending = {}  # Client address -> datagrams that arrived while its upstream was being created
+
+    async def start(self, host: str = '127.0.0.1', port: int = 0):
+        """Listen on (host, port) and return the address clients should send to."""
+        self.loop = asyncio.get_running_loop()
+        rng = random.Random(self.seed)
+        self.uplink = LinkDirection(self.uplink_profile, random.Random(rng.random()), self.loop)
+        self.downlink = LinkDirection(self.downlink_profile, random.Random(rng.random()), self.loop)
+        await self.loop.create_datagram_endpoint(lambda: self, local_addr=(host, port))
+        return self.transport.get_extra_info('sockname')
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        upstream = self.upstreams.get(addr)
+        if upstream is None:
+            if addr not in self.pending:
+                self.pending[addr] = []
+                self.loop.create_task(self.open_upstream(addr))
+            self.pending[addr].append(data)
+            return
+        self.uplink.send(data, upstream.send)
+
+    async def open_upstream(self, client_address):
+        _, upstream = await self.loop.create_datagram_endpoint(
+            lambda: UpstreamProtocol(self, client_address), remote_addr=self.server_address)
+        self.upstreams[client_address] = upstream
+        for data in self.pending.pop(client_address):
+            self.uplink.send(data, upstream.send)
+
+    def send_to_client(self, data: bytes, client_address):
+        if self.transport is not None and not self.transport.is_closing():
+            self.transport.sendto(data, client_address)
+
+    def get_stats(self) -> dict:
+        return {'uplink': dict(self.uplink.stats), 'downlink': dict(self.downlink.stats)}
+
+    def close(self):
+        for upstream in self.upstreams.values():
+            upstream.transport.close()
+        self.upstreams.clear()
+        if self.transport is not None:
+            self.transport.close()
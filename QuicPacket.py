@@ -1,34 +1,188 @@
 import struct
 
+# Variable-length integers (RFC 9000 section 16): the top two bits of the first byte give the length
+VARINT_16 = struct.Struct('!H')
+VARINT_32 = struct.Struct('!I')
+VARINT_64 = struct.Struct('!Q')
+VARINT_MAX = (1 << 62) - 1
+
+# Packets start with PACKET_FORMAT_VARINT | (packet number length - 1), then the flags byte, the
+# connection ID varint and the truncated packet number. Legacy packets start with the flags byte.
+PACKET_FORMAT_VARINT = 0b10000000
+MAX_PACKET_HEADER_SIZE = 2 + 8 + 4  # Format and flags bytes, largest connection ID, longest packet number
+MAX_CONNECTION_ID = (1 << 30) - 1  # Connection IDs handed out stay within a 4 byte varint
+
+# The fixed-width format used before varints, packets of it only ever held stream frames. It is
+# still decoded so old peers can be recognized and turned away
+LEGACY_PACKET_HEADER = struct.Struct('!BQI')  # flags, connection id, packet number
+LEGACY_STREAM_FRAME_HEADER = struct.Struct('!BQII')  # flags, stream id, offset, length
+
+
+def varint_size(value: int) -> int:
+    if value < 0x40:
+        return 1
+    if value < 0x4000:
+        return 2
+    if value < 0x40000000:
+        return 4
+    if value <= VARINT_MAX:
+        return 8
+    raise ValueError(f"{value} does not fit in a varint.")
+
+
+def pack_varint(buffer, pos: int, value: int) -> int:
+    """Encode value at pos in its shortest form and return the end position."""
+    if value < 0x40:
+        buffer[pos] = value
+        return pos + 1
+    if value < 0x4000:
+        VARINT_16.pack_into(buffer, pos, value | 0x4000)
+        return pos + 2
+    if value < 0x40000000:
+        VARINT_32.pack_into(buffer, pos, value | 0x80000000)
+        return pos + 4
+    if value <= VARINT_MAX:
+        VARINT_64.pack_into(buffer, pos, value | 0xc000000000000000)
+        return pos + 8
+    raise ValueError(f"{value} does not fit in a varint.")
+
+
+def unpack_varint(data, pos: int):
+    """Decode the varint at pos and return it together with the next position."""
+    prefix = data[pos] >> 6
+    if prefix == 0:
+        return data[pos], pos + 1
+    if prefix == 1:
+        return VARINT_16.unpack_from(data, pos)[0] & 0x3fff, pos + 2
+    if prefix == 2:
+        return VARINT_32.unpack_from(data, pos)[0] & 0x3fffffff, pos + 4
+    return VARINT_64.unpack_from(data, pos)[0] & 0x3fffffffffffffff, pos + 8
+
+
+def packet_number_length(packet_number: int, largest_acked: int) -> int:
+    """Bytes needed so the peer can tell packet_number apart from twice the packets in flight (RFC 9000 A.2)."""
+    if largest_acked < 0 or packet_number <= largest_acked:
+        return 4
+    bits = (2 * (packet_number - largest_acked)).bit_length()
+    return min((bits + 7) // 8, 4)
+
+
+def expand_packet_number(truncated: int, length: int, largest_received: int) -> int:
+    """Recover a full packet number from its truncated length bytes (RFC 9000 A.3)."""
+    expected = largest_received + 1
+    window = 1 << (length * 8)
+    half_window = window // 2
+    candidate = (expected & ~(window - 1)) | truncated
+    if candidate <= expected - half_window and candidate < (1 << 62) - window:
+        return candidate + window
+    if candidate > expected + half_window and candidate >= window:
+        return candidate - window
+    return candidate
+
+
 class QUICPacket:
+    __slots__ = ('flags', 'connection_id', 'packet_number', 'frames', 'packet_number_length', 'legacy')
 
     def __init__(self, flags: int, connection_id: int, packet_number: int, frames: list):
         self.flags = flags
         self.connection_id = connection_id
         self.packet_number = packet_number
-        self.frames = frames  # This will hold an instances of StreamFrame
+        self.frames = frames  # This will hold instances of StreamFrame, AckFrame and the flow control frames
+        self.packet_number_length = None  # Bytes of a received, still truncated packet number
+        self.legacy = False  # Received in the fixed-width legacy format
 
-    def serialize(self):
-        header = struct.pack('!BQI', self.flags, self.connection_id, self.packet_number)
-        payload = b''.join(frame.serialize() for frame in self.frames)
-        return header + payload
+    def header_size(self, largest_acked: int = -1):
+        return 2 + varint_size(self.connection_id) + packet_number_length(self.packet_number, largest_acked)
+
+    def encoded_size(self, largest_acked: int = -1):
+        """Return the number of bytes the packet takes on the wire."""
+        return self.header_size(largest_acked) + sum(frame.encoded_size() for frame in self.frames)
+
+    def serialize_into(self, buffer, pos: int = 0, largest_acked: int = -1):
+        """Encode the packet into a preallocated buffer and return the end position.
+
+        The packet number is truncated to what the peer needs given largest_acked.
+        """
+        if pos + self.encoded_size(largest_acked) > len(buffer):
+            raise ValueError("Packet does not fit in the encode buffer.")
+
+        length = packet_number_length(self.packet_number, largest_acked)
+        buffer[pos] = PACKET_FORMAT_VARINT | (length - 1)
+        buffer[pos + 1] = self.flags
+        pos = pack_varint(buffer, pos + 2, self.connection_id)
+        buffer[pos:pos + length] = (self.packet_number & ((1 << (length * 8)) - 1)).to_bytes(length, 'big')
+        pos += length
+        for frame in self.frames:
+            pos = frame.serialize_into(buffer, pos)
+        return pos
+
+    def serialize(self, largest_acked: int = -1):
+        buffer = bytearray(self.encoded_size(largest_acked))
+        self.serialize_into(buffer, 0, largest_acked)
+        return buffer
+
+    def serialize_legacy(self) -> bytes:
+        """Encode a packet without frames in the fixed-width format, only sent to turn old peers away."""
+        return LEGACY_PACKET_HEADER.pack(self.flags, self.connection_id, self.packet_number)
+
+    def expand_packet_number(self, largest_received: int):
+        """Replace a truncated packet number with the full one, largest_received is the highest seen so far."""
+        if self.packet_number_length is not None:
+            self.packet_number = expand_packet_number(self.packet_number, self.packet_number_length, largest_received)
+            self.packet_number_length = None
 
     @staticmethod
     def deserialize(data):
-        flags, connection_id, packet_number = struct.unpack('!BQI', data[:13])
-        payload = data[13:]
+        """Decode a datagram, frames reference slices of the original buffer without copying.
+
+        The packet number stays truncated until expand_packet_number() is called.
+        """
+        view = memoryview(data)
+        if not view[0] & PACKET_FORMAT_VARINT:
+            return QUICPacket.deserialize_legacy(view)
 
+        length = (view[0] & 0b11) + 1
+        flags = view[1]
+        connection_id, pos = unpack_varint(view, 2)
+        if pos + length > len(view):
+            raise ValueError("Truncated packet header.")
+        packet_number = int.from_bytes(view[pos:pos + length], 'big')
+        pos += length
+
+        end = len(view)
         frames = []
-        while payload:
-            frame, payload = StreamFrame.deserialize(payload)
+        while pos < end:
+            frame_class = FRAME_TYPES.get(view[pos], StreamFrame)
+            frame, pos = frame_class.deserialize(view, pos)
             frames.append(frame)
 
-        return QUICPacket(flags, connection_id, packet_number, frames)
+        packet = QUICPacket(flags, connection_id, packet_number, frames)
+        packet.packet_number_length = length
+        return packet
+
+    @staticmethod
+    def deserialize_legacy(view):
+        """Decode a packet of the fixed-width format used before varints, it only carried stream frames."""
+        flags, connection_id, packet_number = LEGACY_PACKET_HEADER.unpack_from(view, 0)
+
+        pos = LEGACY_PACKET_HEADER.size
+        end = len(view)
+        frames = []
+        while pos < end:
+            frame, pos = StreamFrame.deserialize_legacy(view, pos)
+            frames.append(frame)
+
+        packet = QUICPacket(flags, connection_id, packet_number, frames)
+        packet.legacy = True
+        return packet
 
 
 class StreamFrame:
+    __slots__ = ('stream_id', 'offset', 'length', 'stream_data', 'flags')
+
     DATA_FRAME = 0b0001  # Regular data frame
     FIN_DATA_FRAME = 0b0010  # Final (FIN) + data frame
+    ZLIB_FRAME = 0b0100  # Set on every frame of a stream that starts with a zlib stream
 
     def __init__(self, stream_id: int, offset: int, length: int, stream_data: bytes, flags: int = DATA_FRAME):
         self.stream_id = stream_id
@@ -43,17 +197,220 @@ class StreamFrame:
     def is_fin_data_frame(self):
         return self.flags & StreamFrame.FIN_DATA_FRAME
 
+    @staticmethod
+    def header_size(stream_id: int, offset: int, length: int) -> int:
+        return 1 + varint_size(stream_id) + varint_size(offset) + varint_size(length)
+
+    def encoded_size(self):
+        length = len(self.stream_data)
+        return StreamFrame.header_size(self.stream_id, self.offset, length) + length
+
+    def serialize_into(self, buffer, pos: int = 0):
+        """Encode the frame into buffer at pos and return the end position."""
+        length = len(self.stream_data)
+        buffer[pos] = self.flags
+        pos = pack_varint(buffer, pos + 1, self.stream_id)
+        pos = pack_varint(buffer, pos, self.offset)
+        pos = pack_varint(buffer, pos, length)
+        buffer[pos:pos + length] = self.stream_data
+        return pos + length
+
     def serialize(self):
         """Serialize the frame data for transmission."""
-        header = struct.pack('!BQI', self.flags, self.stream_id, self.offset)
-        length = struct.pack('!I', len(self.stream_data))  # Include length in serialization
-        return header + length + self.stream_data
-
-    @classmethod
-    def deserialize(cls, data: bytes):
-        """Deserialize received data into a StreamFrame object."""
-        flags, stream_id, offset = struct.unpack('!BQI', data[:13])
-        length = struct.unpack('!I', data[13:17])[0]  # Extract length
-        stream_data = data[17:17+length]
-        remaining_data = data[17+length:]
-        return cls(stream_id, offset, length, stream_data, flags), remaining_data
+        buffer = bytearray(self.encoded_size())
+        self.serialize_into(buffer)
+        return buffer
+
+    @classmethod
+    def deserialize(cls, data, pos: int = 0):
+        """Decode the frame starting at pos and return it together with the next position."""
+        view = data if isinstance(data, memoryview) else memoryview(data)
+        flags = view[pos]
+        stream_id, pos = unpack_varint(view, pos + 1)
+        offset, pos = unpack_varint(view, pos)
+        length, start = unpack_varint(view, pos)
+        return cls.with_data(view, flags, stream_id, offset, length, start)
+
+    @classmethod
+    def deserialize_legacy(cls, view, pos: int = 0):
+        flags, stream_id, offset, length = LEGACY_STREAM_FRAME_HEADER.unpack_from(view, pos)
+        return cls.with_data(view, flags, stream_id, offset, length, pos + LEGACY_STREAM_FRAME_HEADER.size)
+
+    @classmethod
+    def with_data(cls, view, flags, stream_id, offset, length, start):
+        end = start + length
+        if end > len(view):
+            raise ValueError(f"Truncated stream frame: expected {length} bytes of data.")
+        return cls(stream_id, offset, length, view[start:end], flags), end
+
+
+class AckFrame:
+    """Acknowledges ranges of packet numbers, largest range first.
+
+    On the wire: the largest acknowledged packet number, the ACK delay in microseconds,
+    the number of ranges after the first, the length of the first range and then a
+    (gap, length) pair for every further range, as in RFC 9000.
+    """
+    __slots__ = ('ranges', 'ack_delay')
+
+    FRAME_TYPE = 0b01000000  # Never set in StreamFrame flags
+
+    def __init__(self, ranges: list, ack_delay: float = 0.0):
+        self.ranges = ranges  # [(first, last), ...] inclusive, in descending order
+        self.ack_delay = ack_delay  # Seconds the receiver held the largest packet before acknowledging
+
+    @property
+    def largest_acknowledged(self):
+        return self.ranges[0][1]
+
+    def wire_fields(self):
+        """The integers following the frame type, in wire order."""
+        first, last = self.ranges[0]
+        fields = [last, int(self.ack_delay * 1_000_000), len(self.ranges) - 1, last - first]
+        previous_first = first
+        for first, last in self.ranges[1:]:
+            fields.append(previous_first - last - 2)
+            fields.append(last - first)
+            previous_first = first
+        return fields
+
+    def encoded_size(self):
+        return 1 + sum(varint_size(value) for value in self.wire_fields())
+
+    def serialize_into(self, buffer, pos: int = 0):
+        buffer[pos] = self.FRAME_TYPE
+        pos += 1
+        for value in self.wire_fields():
+            pos = pack_varint(buffer, pos, value)
+        return pos
+
+    @classmethod
+    def deserialize(cls, data, pos: int = 0):
+        view = data if isinstance(data, memoryview) else memoryview(data)
+        last, pos = unpack_varint(view, pos + 1)
+        ack_delay, pos = unpack_varint(view, pos)
+        range_count, pos = unpack_varint(view, pos)
+        length, pos = unpack_varint(view, pos)
+        ranges = [(last - length, last)]
+        for _ in range(range_count):
+            gap, pos = unpack_varint(view, pos)
+            length, pos = unpack_varint(view, pos)
+            last = ranges[-1][0] - gap - 2
+            ranges.append((last - length, last))
+        return cls(ranges, ack_delay / 1_000_000), pos
+
+
+class MaxDataFrame:
+    """Allows the peer to send up to maximum bytes summed over every stream."""
+    __slots__ = ('maximum',)
+
+    FRAME_TYPE = 0b01000001
+
+    def __init__(self, maximum: int):
+        self.maximum = maximum
+
+    def encoded_size(self):
+        return 1 + varint_size(self.maximum)
+
+    def serialize_into(self, buffer, pos: int = 0):
+        buffer[pos] = self.FRAME_TYPE
+        return pack_varint(buffer, pos + 1, self.maximum)
+
+    @classmethod
+    def deserialize(cls, data, pos: int = 0):
+        maximum, pos = unpack_varint(data, pos + 1)
+        return cls(maximum), pos
+
+
+class MaxStreamDataFrame:
+    """Allows the peer to send stream_id data up to offset maximum."""
+    __slots__ = ('stream_id', 'maximum')
+
+    FRAME_TYPE = 0b01000010
+
+    def __init__(self, stream_id: int, maximum: int):
+        self.stream_id = stream_id
+        self.maximum = maximum
+
+    def encoded_size(self):
+        return 1 + varint_size(self.stream_id) + varint_size(self.maximum)
+
+    def serialize_into(self, buffer, pos: int = 0):
+        buffer[pos] = self.FRAME_TYPE
+        pos = pack_varint(buffer, pos + 1, self.stream_id)
+        return pack_varint(buffer, pos, self.maximum)
+
+    @classmethod
+    def deserialize(cls, data, pos: int = 0):
+        stream_id, pos = unpack_varint(data, pos + 1)
+        maximum, pos = unpack_varint(data, pos)
+        return cls(stream_id, maximum), pos
+
+
+class SessionTicketFrame:
+    """A resumption ticket: issued by the server with its lifetime in seconds, presented back by the client with 0."""
+    __slots__ = ('lifetime', 'ticket')
+
+    FRAME_TYPE = 0b01000011
+
+    def __init__(self, lifetime: int, ticket: bytes):
+        self.lifetime = lifetime
+        self.ticket = ticket
+
+    def encoded_size(self):
+        return 1 + varint_size(self.lifetime) + varint_size(len(self.ticket)) + len(self.ticket)
+
+    def serialize_into(self, buffer, pos: int = 0):
+        buffer[pos] = self.FRAME_TYPE
+        pos = pack_varint(buffer, pos + 1, self.lifetime)
+        pos = pack_varint(buffer, pos, len(self.ticket))
+        end = pos + len(self.ticket)
+        buffer[pos:end] = self.ticket
+        return end
+
+    @classmethod
+    def deserialize(cls, data, pos: int = 0):
+        lifetime, pos = unpack_varint(data, pos + 1)
+        length, pos = unpack_varint(data, pos)
+        if pos + length > len(data):
+            raise ValueError(f"Truncated session ticket frame: expected {length} bytes.")
+        return cls(lifetime, data[pos:pos + length]), pos + length
+
+
+class PaddingFrame:
+    """length zero bytes, pads a client's first datagram so the server may answer it with more."""
+    __slots__ = ('length',)
+
+    FRAME_TYPE = 0b01000100
+
+    def __init__(self, length: int):
+        self.length = length
+
+    @classmethod
+    def filling(cls, size: int) -> 'PaddingFrame':
+        """The padding frame that takes size bytes, or size - 1 where the length varint grows, size is at least 2."""
+        return cls(max(size - 1 - varint_size(size), 0))
+
+    def encoded_size(self):
+        return 1 + varint_size(self.length) + self.length
+
+    def serialize_into(self, buffer, pos: int = 0):
+        buffer[pos] = self.FRAME_TYPE
+        pos = pack_varint(buffer, pos + 1, self.length)
+        end = pos + self.length
+        buffer[pos:end] = bytes(self.length)
+        return end
+
+    @classmethod
+    def deserialize(cls, data, pos: int = 0):
+        length, pos = unpack_varint(data, pos + 1)
+        return cls(length), min(pos + length, len(data))
+
+
+FRAME_TYPES = {
+    AckFrame.FRAME_TYPE: AckFrame,
+    MaxDataFrame.FRAME_TYPE: MaxDataFrame,
+    MaxStreamDataFrame.FRAME_TYPE: MaxStreamDataFrame,
+    SessionTicketFrame.FRAME_TYPE: SessionTicketFrame,
+    PaddingFrame.FRAME_TYPE: PaddingFrame,
+}  # First byte -> frame class, anything else is a StreamFrame
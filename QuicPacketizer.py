@@ -0,0 +1,116 @@
+from collections import deque
+from QuicPacket import MAX_PACKET_HEADER_SIZE, StreamFrame
+from QuicScheduler import RoundRobinScheduler
+
+MIN_SPLIT_DATA = 64  # Don't start a frame in the leftover space of a packet for less data than this
+MAX_STREAM_FRAME_HEADER_SIZE = 1 + 3 * 8  # Flags byte, stream ID, offset and length varints
+
+
+class QuicPacketizer:
+    """Packs queued StreamFrames into packets of at most max_datagram_size bytes.
+
+    Retransmitted frames go first, then the scheduler picks which stream's queued data
+    fills the rest of the packet. Frames that don't fit are split at the right offset,
+    the FIN flag stays on the last piece.
+    """
+
+    def __init__(self, max_datagram_size: int = 1200, scheduler=None):
+        if max_datagram_size < MAX_PACKET_HEADER_SIZE + MAX_STREAM_FRAME_HEADER_SIZE + MIN_SPLIT_DATA:
+            raise ValueError(f"max_datagram_size {max_datagram_size} is too small for a stream frame.")
+        self.max_datagram_size = max_datagram_size
+        self.capacity = max_datagram_size - MAX_PACKET_HEADER_SIZE  # Bytes available for frames
+        self.scheduler = scheduler if scheduler is not None else RoundRobinScheduler()
+        self.retransmissions = deque()  # Frames of lost packets, sent before any new data
+        self.stream_queues = {}  # Stream ID -> deque of StreamFrames waiting to be sent
+        self.queued_frames = 0
+        self.queued_bytes = 0  # Encoded size of the queued frames
+
+    def __len__(self):
+        return self.queued_frames
+
+    def push(self, frame: StreamFrame):
+        queue = self.stream_queues.get(frame.stream_id)
+        if queue is None:
+            queue = self.stream_queues[frame.stream_id] = deque()
+            self.scheduler.activate(frame.stream_id)
+        queue.append(frame)
+        self.queued_frames += 1
+        self.queued_bytes += frame.encoded_size()
+
+    def push_front(self, frames: list):
+        """Queue frames ahead of everything else, used for retransmissions."""
+        for frame in reversed(frames):
+            self.retransmissions.appendleft(frame)
+            self.queued_frames += 1
+            self.queued_bytes += frame.encoded_size()
+
+    def drop_retransmissions(self):
+        """Forget the queued retransmissions, the peer will not acknowledge them anymore."""
+        for frame in self.retransmissions:
+            self.queued_frames -= 1
+            self.queued_bytes -= frame.encoded_size()
+        self.retransmissions.clear()
+
+    def has_full_packet(self) -> bool:
+        return self.queued_bytes >= self.capacity
+
+    def next_frames(self, control_frames: list = ()) -> list:
+        """Pop the frames for the next packet, splitting the last frame if needed.
+
+        control_frames (such as an ACK) go first and take their space from the packet, they
+        must fit in capacity bytes.
+        """
+        frames = list(control_frames)
+        space = self.capacity - sum(frame.encoded_size() for frame in frames)
+
+        while self.retransmissions and space > 0:
+            frame = self.take(self.retransmissions, space)
+            if frame is None:
+                return frames
+            frames.append(frame)
+            space -= frame.encoded_size()
+
+        while self.scheduler and space > 0:
+            stream_id = self.scheduler.next_stream()
+            queue = self.stream_queues[stream_id]
+            frame = self.take(queue, space)
+            if frame is None:
+                break
+            frames.append(frame)
+            space -= frame.encoded_size()
+
+            self.scheduler.on_data_sent(stream_id, len(frame.stream_data), bool(queue))
+            if not queue:
+                del self.stream_queues[stream_id]
+                if frame.flags & StreamFrame.FIN_DATA_FRAME:
+                    self.scheduler.forget(stream_id)
+
+        return frames
+
+    def take(self, queue: deque, space: int):
+        """Pop the head frame of queue if it fits in space, or split off as much as fits.
+
+        Returns None when less than MIN_SPLIT_DATA bytes of data would fit.
+        """
+        frame = queue[0]
+        size = frame.encoded_size()
+        if size <= space:
+            queue.popleft()
+            self.queued_frames -= 1
+            self.queued_bytes -= size
+            return frame
+
+        # The length varint of the head is no longer than one holding space
+        data_space = space - StreamFrame.header_size(frame.stream_id, frame.offset, space)
+        if data_space < MIN_SPLIT_DATA:
+            return None
+
+        # Send the head of the frame now and keep the rest queued at its offset
+        data = memoryview(frame.stream_data)
+        head = StreamFrame(frame.stream_id, frame.offset, data_space, data[:data_space],
+                           frame.flags & ~StreamFrame.FIN_DATA_FRAME)
+        tail = StreamFrame(frame.stream_id, frame.offset + data_space, len(data) - data_space,
+                           data[data_space:], frame.flags)
+        queue[0] = tail
+        self.queued_bytes += tail.encoded_size() - size
+        return head
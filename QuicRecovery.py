@@ -0,0 +1,131 @@
+K_PACKET_THRESHOLD = 3  # Packets acknowledged after a missing one before it is declared lost
+K_TIME_THRESHOLD = 9 / 8  # Fraction of an RTT a packet may be late before it is declared lost
+K_GRANULARITY = 0.001  # Timer granularity in seconds
+K_INITIAL_RTT = 0.333  # RTT assumed before the first sample, in seconds
+
+
+class SentPacket:
+    __slots__ = ('packet_number', 'time_sent', 'size')
+
+    def __init__(self, packet_number: int, time_sent: float, size: int):
+        self.packet_number = packet_number
+        self.time_sent = time_sent
+        self.size = size
+
+
+class QuicLossRecovery:
+    """RFC 9002 style RTT estimation, loss detection and probe timeout for one connection."""
+
+    MAX_PTO_COUNT = 8  # Consecutive probe timeouts before the peer is considered gone
+
+    def __init__(self, max_ack_delay: float = 0.025):
+        self.latest_rtt = 0.0
+        self.smoothed_rtt = K_INITIAL_RTT
+        self.rttvar = K_INITIAL_RTT / 2
+        self.min_rtt = None
+        self.max_ack_delay = max_ack_delay
+        self.largest_acked = -1
+        self.pto_count = 0  # Consecutive probe timeouts without an ACK
+        self.loss_time = None  # When the earliest packet becomes lost by the time threshold
+        self.time_of_last_sent = None
+        self.sent_packets = {}  # Packet number -> SentPacket, in sending order
+
+    def on_packet_sent(self, packet_number: int, size: int, now: float):
+        self.sent_packets[packet_number] = SentPacket(packet_number, now, size)
+        self.time_of_last_sent = now
+
+    def on_ack_received(self, ranges, now: float, ack_delay: float = 0.0):
+        """Process acknowledged (first, last) packet number ranges and return the (acked, lost) SentPackets."""
+        acked = []
+        for first, last in ranges:
+            if last - first < len(self.sent_packets):
+                packet_numbers = range(first, last + 1)
+            else:
+                # A wide range covering few outstanding packets, only look at those
+                packet_numbers = [packet_number for packet_number in self.sent_packets
+                                  if first <= packet_number <= last]
+            for packet_number in packet_numbers:
+                sent_packet = self.sent_packets.pop(packet_number, None)
+                if sent_packet is not None:
+                    acked.append(sent_packet)
+
+        if not acked:
+            return [], []
+
+        largest = max(acked, key=lambda sent: sent.packet_number)
+        if largest.packet_number > self.largest_acked:
+            self.largest_acked = largest.packet_number
+            self.update_rtt(now - largest.time_sent, ack_delay)
+
+        self.pto_count = 0
+        return acked, self.detect_lost_packets(now)
+
+    def update_rtt(self, latest_rtt: float, ack_delay: float):
+        self.latest_rtt = latest_rtt
+        if self.min_rtt is None:
+            self.min_rtt = latest_rtt
+            self.smoothed_rtt = latest_rtt
+            self.rttvar = latest_rtt / 2
+            return
+
+        self.min_rtt = min(self.min_rtt, latest_rtt)
+        ack_delay = min(ack_delay, self.max_ack_delay)
+        adjusted_rtt = latest_rtt
+        if latest_rtt >= self.min_rtt + ack_delay:
+            adjusted_rtt = latest_rtt - ack_delay
+
+        self.rttvar = 3 / 4 * self.rttvar + 1 / 4 * abs(self.smoothed_rtt - adjusted_rtt)
+        self.smoothed_rtt = 7 / 8 * self.smoothed_rtt + 1 / 8 * adjusted_rtt
+
+    def detect_lost_packets(self, now: float) -> list:
+        """Declare packets below the largest acknowledged one lost by packet or time threshold."""
+        loss_delay = max(K_TIME_THRESHOLD * max(self.latest_rtt, self.smoothed_rtt), K_GRANULARITY)
+        lost_send_time = now - loss_delay
+
+        lost = []
+        self.loss_time = None
+        for packet_number, sent_packet in list(self.sent_packets.items()):
+            if packet_number > self.largest_acked:
+                break  # Packet numbers only grow, nothing after this can be lost yet
+
+            if sent_packet.time_sent <= lost_send_time or self.largest_acked >= packet_number + K_PACKET_THRESHOLD:
+                lost.append(self.sent_packets.pop(packet_number))
+            else:
+                packet_loss_time = sent_packet.time_sent + loss_delay
+                if self.loss_time is None or packet_loss_time < self.loss_time:
+                    self.loss_time = packet_loss_time
+
+        return lost
+
+    def get_pto(self) -> float:
+        """Probe timeout including the exponential backoff."""
+        pto = self.smoothed_rtt + max(4 * self.rttvar, K_GRANULARITY) + self.max_ack_delay
+        return pto * (2 ** self.pto_count)
+
+    def get_timeout(self):
+        """Return the absolute time the loss detection timer fires, or None if it is not armed."""
+        if self.loss_time is not None:
+            return self.loss_time
+        if not self.sent_packets:
+            return None
+        return self.time_of_last_sent + self.get_pto()
+
+    def on_timeout(self, now: float):
+        """Handle an expired timer and return (lost, probes), the packets whose data must be sent again."""
+        if self.loss_time is not None and now >= self.loss_time:
+            return self.detect_lost_packets(now), []
+
+        if not self.sent_packets:
+            return [], []
+
+        # Probe timeout: resend the oldest outstanding data so the peer acknowledges something
+        self.pto_count += 1
+        self.time_of_last_sent = now
+        oldest = next(iter(self.sent_packets))
+        return [], [self.sent_packets.pop(oldest)]
+
+    def clear(self):
+        """Forget every outstanding packet, used once the peer will not acknowledge anymore."""
+        self.sent_packets.clear()
+        self.loss_time = None
+        self.pto_count = 0
@@ -0,0 +1,141 @@
+import heapq
+import itertools
+from abc import ABC, abstractmethod
+from collections import deque
+
+DEFAULT_URGENCY = 3  # Lower urgency is sent first by the strict priority scheduler
+DEFAULT_WEIGHT = 16  # Share of the bandwidth under the weighted fair scheduler
+
+
+class QuicStreamScheduler(ABC):
+    """Picks the stream whose queued data goes into the packet being built.
+
+    Only streams with queued data are active. The packetizer asks next_stream() for
+    every frame it adds and reports what it took with on_data_sent().
+    """
+
+    def __init__(self):
+        self.urgencies = {}  # Stream ID -> urgency, for streams that don't use the default
+        self.weights = {}  # Stream ID -> weight, for streams that don't use the default
+
+    def set_priority(self, stream_id: int, urgency: int = DEFAULT_URGENCY, weight: int = DEFAULT_WEIGHT):
+        """Set the priority of a stream, applied the next time the stream is (re)queued."""
+        if weight <= 0:
+            raise ValueError("Stream weight must be positive.")
+        self.urgencies[stream_id] = urgency
+        self.weights[stream_id] = weight
+
+    def forget(self, stream_id: int):
+        """Drop the state of a stream that finished sending."""
+        self.urgencies.pop(stream_id, None)
+        self.weights.pop(stream_id, None)
+
+    @abstractmethod
+    def __len__(self):
+        """Return the number of active streams."""
+
+    @abstractmethod
+    def activate(self, stream_id: int):
+        """Mark a stream as having data queued, it must not be active already."""
+
+    @abstractmethod
+    def next_stream(self) -> int:
+        """Return the stream to send from next, only called while a stream is active."""
+
+    @abstractmethod
+    def on_data_sent(self, stream_id: int, size: int, active: bool):
+        """size bytes of next_stream() were packed, active tells whether it still has data queued."""
+
+
+class RoundRobinScheduler(QuicStreamScheduler):
+    """Every active stream sends one frame in turn."""
+
+    def __init__(self):
+        super().__init__()
+        self.active = deque()
+
+    def __len__(self):
+        return len(self.active)
+
+    def activate(self, stream_id: int):
+        self.active.append(stream_id)
+
+    def next_stream(self) -> int:
+        return self.active[0]
+
+    def on_data_sent(self, stream_id: int, size: int, active: bool):
+        self.active.popleft()
+        if active:
+            self.active.append(stream_id)
+
+
+class WeightedFairScheduler(QuicStreamScheduler):
+    """Start time fair queueing: streams share the bandwidth in proportion to their weights.
+
+    Every stream has a virtual finish time that grows by size / weight for the data it
+    sends, the stream with the smallest one goes next.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.heap = []  # (virtual finish time, sequence, stream ID) of the active streams
+        self.finish_times = {}  # Stream ID -> virtual finish time of its last packed data
+        self.virtual_time = 0.0  # Finish time of the data packed last
+        self.sequence = itertools.count()  # Breaks ties in activation order
+
+    def __len__(self):
+        return len(self.heap)
+
+    def activate(self, stream_id: int):
+        # A stream that was idle doesn't get to catch up on the bandwidth it didn't use
+        start = max(self.finish_times.get(stream_id, 0.0), self.virtual_time)
+        heapq.heappush(self.heap, (start, next(self.sequence), stream_id))
+
+    def next_stream(self) -> int:
+        return self.heap[0][2]
+
+    def on_data_sent(self, stream_id: int, size: int, active: bool):
+        start = self.heap[0][0]
+        self.virtual_time = start
+        finish = start + size / self.weights.get(stream_id, DEFAULT_WEIGHT)
+        self.finish_times[stream_id] = finish
+        if active:
+            heapq.heapreplace(self.heap, (finish, next(self.sequence), stream_id))
+        else:
+            heapq.heappop(self.heap)
+
+    def forget(self, stream_id: int):
+        super().forget(stream_id)
+        self.finish_times.pop(stream_id, None)
+
+
+class StrictPriorityScheduler(QuicStreamScheduler):
+    """The lowest urgency sends first, streams of the same urgency take turns frame by frame."""
+
+    def __init__(self):
+        super().__init__()
+        self.heap = []  # (urgency, sequence, stream ID) of the active streams
+        self.sequence = itertools.count()  # Round robin order within an urgency
+
+    def __len__(self):
+        return len(self.heap)
+
+    def activate(self, stream_id: int):
+        heapq.heappush(self.heap, (self.urgencies.get(stream_id, DEFAULT_URGENCY), next(self.sequence), stream_id))
+
+    def next_stream(self) -> int:
+        return self.heap[0][2]
+
+    def on_data_sent(self, stream_id: int, size: int, active: bool):
+        if active:
+            urgency = self.urgencies.get(stream_id, DEFAULT_URGENCY)
+            heapq.heapreplace(self.heap, (urgency, next(self.sequence), stream_id))
+        else:
+            heapq.heappop(self.heap)
+
+
+SCHEDULERS = {
+    'round_robin': RoundRobinScheduler,
+    'weighted_fair': WeightedFairScheduler,
+    'strict_priority': StrictPriorityScheduler,
+}
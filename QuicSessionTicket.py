@@ -0,0 +1,134 @@
+import heapq
+import hmac
+import json
+import os
+import secrets
+import struct
+import time
+from hashlib import sha256
+
+DEFAULT_TICKET_LIFETIME = 3600  # Seconds a ticket can be redeemed for 0-RTT
+TICKET_BODY = struct.Struct('!8sQ')  # ticket ID, issue time in seconds since the epoch
+TICKET_MAC_SIZE = 16  # Truncated HMAC-SHA256 of the body
+TICKET_SIZE = TICKET_BODY.size + TICKET_MAC_SIZE
+MAX_TRACKED_TICKETS = 100_000  # Redeemed tickets the strike register remembers until they expire
+
+
+class QuicTicketIssuer:
+    """Issues resumption tickets and decides whether the stream request that comes with one is taken as 0-RTT.
+
+    A ticket is a random ID and its issue time, signed with a key only the server knows,
+    so tickets need no server state until they are redeemed. Each ticket is accepted once
+    within its lifetime: redeemed IDs stay in a strike register until the ticket expires,
+    so a captured first datagram that is replayed finds its ticket used and gets a full
+    handshake instead. When the register is full, early data is refused rather than
+    forgetting a ticket that could still be replayed.
+
+    Tickets verify with the key of the issuer that signed them, sharded workers are given
+    the same key so a ticket works whichever worker the kernel hands the START to. The
+    register lives in one process: a replay from the client's own address hashes to the
+    same worker and is caught, one sent from elsewhere may reach a worker that never saw
+    the ticket.
+    """
+
+    def __init__(self, key: bytes = None, lifetime: int = DEFAULT_TICKET_LIFETIME,
+                 max_tracked: int = MAX_TRACKED_TICKETS):
+        self.key = key if key is not None else secrets.token_bytes(32)
+        self.lifetime = lifetime
+        self.max_tracked = max_tracked
+        self.redeemed = set()  # IDs of redeemed tickets that have not expired yet
+        self.expiries = []  # Heap of (expiry, ticket ID) of the redeemed tickets
+        self.stats = {'issued': 0, 'accepted': 0, 'invalid': 0, 'expired': 0, 'replayed': 0, 'register_full': 0}
+
+    def sign(self, body: bytes) -> bytes:
+        return hmac.new(self.key, body, sha256).digest()[:TICKET_MAC_SIZE]
+
+    def issue(self) -> bytes:
+        body = TICKET_BODY.pack(secrets.token_bytes(8), int(time.time()))
+        self.stats['issued'] += 1
+        return body + self.sign(body)
+
+    def accept_early_data(self, ticket, now: float = None) -> bool:
+        """Redeem ticket, True if the request it came with may be served before the handshake completes."""
+        now = time.time() if now is None else now
+        ticket = bytes(ticket)
+        if len(ticket) != TICKET_SIZE:
+            self.stats['invalid'] += 1
+            return False
+        body, mac = ticket[:TICKET_BODY.size], ticket[TICKET_BODY.size:]
+        if not hmac.compare_digest(mac, self.sign(body)):
+            self.stats['invalid'] += 1
+            return False
+
+        ticket_id, issued_at = TICKET_BODY.unpack(body)
+        if now - issued_at > self.lifetime:
+            self.stats['expired'] += 1
+            return False
+
+        self.forget_expired(now)
+        if ticket_id in self.redeemed:
+            self.stats['replayed'] += 1
+            return False
+        if len(self.redeemed) >= self.max_tracked:
+            self.stats['register_full'] += 1
+            return False
+
+        self.redeemed.add(ticket_id)
+        heapq.heappush(self.expiries, (issued_at + self.lifetime, ticket_id))
+        self.stats['accepted'] += 1
+        return True
+
+    def forget_expired(self, now: float):
+        """Drop redeemed tickets that are past their lifetime, the age check rejects them by itself."""
+        expiries = self.expiries
+        while expiries and expiries[0][0] < now:
+            self.redeemed.discard(heapq.heappop(expiries)[1])
+
+    def get_stats(self) -> dict:
+        return dict(self.stats, tracked=len(self.redeemed))
+
+
+class QuicTicketCache:
+    """Client side store of the tickets servers handed out, per server address.
+
+    Tickets are single use: take() removes the one it returns. With a path the cache is
+    kept in a JSON file, so the next run of a client can resume too.
+    """
+
+    def __init__(self, path: str = None, max_per_server: int = 4):
+        self.path = path
+        self.max_per_server = max_per_server
+        self.tickets = {}  # 'host:port' -> [[expiry, ticket hex], ...], newest last
+        if path is not None and os.path.exists(path):
+            with open(path) as file:
+                self.tickets = json.load(file)
+
+    @staticmethod
+    def key(address) -> str:
+        return f"{address[0]}:{address[1]}"
+
+    def store(self, address, ticket, lifetime: int):
+        tickets = self.tickets.setdefault(self.key(address), [])
+        tickets.append([time.time() + lifetime, bytes(ticket).hex()])
+        del tickets[:-self.max_per_server]
+        self.save()
+
+    def take(self, address):
+        """Remove and return the newest ticket of address that has not expired, or None."""
+        tickets = self.tickets.get(self.key(address), [])
+        now = time.time()
+        ticket = None
+        while tickets and ticket is None:
+            expiry, ticket_hex = tickets.pop()
+            if expiry > now:
+                ticket = bytes.fromhex(ticket_hex)
+        self.save()
+        return ticket
+
+    def save(self):
+        if self.path is None:
+            return
+        temporary_path = self.path + '.tmp'
+        with open(temporary_path, 'w') as file:
+            json.dump(self.tickets, file)
+        os.replace(temporary_path, self.path)
@@ -1,46 +1,347 @@
+import heapq
+from collections import deque
 from QuicPacket import StreamFrame
+from QuicFlowControl import *
 from Events import *
 
 class QuicStreamSender:
     def __init__(self, stream_id: int):
         self.stream_id = stream_id
         self.offset = 0
+        self.credit = QuicSendCredit(INITIAL_STREAM_WINDOW)  # Raised by the peer's MAX_STREAM_DATA frames
+        self.compressor = None  # QuicStreamCompressor of a compressed stream, the data it is given is already encoded
 
     def send_data(self, data: bytes, end_of_stream: bool = False) -> StreamFrame:
         flags = StreamFrame.DATA_FRAME
         if end_of_stream:
             flags |= StreamFrame.FIN_DATA_FRAME
+        if self.compressor is not None:
+            flags |= StreamFrame.ZLIB_FRAME
         frame = StreamFrame(self.stream_id, self.offset, len(data), data, flags)
         self.offset += len(data)
+        self.credit.on_data_sent(len(data))
         return frame
 
 
+class QuicReassemblyBuffer:
+    """Reorders stream data by offset and releases the contiguous prefix to the application.
+
+    Buffered chunks sit in a heap by start offset, so every chunk is pushed and popped in
+    O(log n) however much the frames are reordered. Overlaps between buffered chunks are
+    trimmed when they are released, the part before read_offset was already delivered, or
+    all at once when retransmissions have doubled the buffer.
+    """
+
+    def __init__(self, max_buffered: int = 16 * 1024 * 1024):
+        self.read_offset = 0  # Everything before this offset was already released
+        self.starts = []  # Heap of the start offsets of the buffered chunks
+        self.chunks = {}  # Start offset -> buffered chunk, the longest one pushed at that offset
+        self.buffered_bytes = 0  # Bytes held waiting for a gap to be filled
+        self.max_buffered = max_buffered  # Data further than this past read_offset is dropped
+
+    def push(self, offset: int, data) -> list:
+        """Insert data at offset and return the chunks that became contiguous, in order."""
+        end = offset + len(data)
+        if end <= self.read_offset:
+            return []  # Duplicate of data that was already released
+
+        if offset < self.read_offset:
+            data = data[self.read_offset - offset:]
+            offset = self.read_offset
+
+        if end > self.read_offset + self.max_buffered:
+            return []  # Beyond the receive window, the sender will have to resend it
+
+        if offset > self.read_offset:
+            self._insert(offset, data)
+            return []
+
+        # In-order data is released right away, buffered chunks it overlaps are trimmed when they are popped
+        self.read_offset = end
+        released = [data]
+        released.extend(self._pop_contiguous())
+        return released
+
+    def _insert(self, offset: int, data):
+        """Buffer data at offset, unless as much is already buffered there."""
+        buffered = self.chunks.get(offset)
+        if buffered is not None:
+            if len(buffered) >= len(data):
+                return  # A retransmission of a buffered chunk
+            self.buffered_bytes -= len(buffered)
+        else:
+            heapq.heappush(self.starts, offset)
+        self.chunks[offset] = bytes(data)
+        self.buffered_bytes += len(data)
+        if self.buffered_bytes > 2 * self.max_buffered:
+            self._trim_overlaps()
+
+    def _trim_overlaps(self):
+        """Cut the overlaps out of the buffered chunks.
+
+        Distinct buffered bytes never exceed max_buffered, so retransmissions that were split
+        at other offsets can at most double the buffer before it is trimmed back.
+        """
+        chunks = {}
+        buffered_bytes = 0
+        covered = self.read_offset
+        for start in sorted(self.starts):
+            chunk = self.chunks[start]
+            chunk_end = start + len(chunk)
+            if chunk_end <= covered:
+                continue
+            if start < covered:
+                chunk, start = chunk[covered - start:], covered
+            chunks[start] = chunk
+            buffered_bytes += len(chunk)
+            covered = chunk_end
+        self.starts = list(chunks)  # Sorted, so already a heap
+        self.chunks = chunks
+        self.buffered_bytes = buffered_bytes
+
+    def _pop_contiguous(self) -> list:
+        released = []
+        starts = self.starts
+        while starts and starts[0] <= self.read_offset:
+            start = heapq.heappop(starts)
+            chunk = self.chunks.pop(start)
+            self.buffered_bytes -= len(chunk)
+            chunk_end = start + len(chunk)
+            if chunk_end > self.read_offset:
+                released.append(chunk[self.read_offset - start:])
+                self.read_offset = chunk_end
+        return released
+
+
 class QuicStreamReceiver:
     def __init__(self, stream_id: int):
         self.stream_id = stream_id
-        self.received_data = b""  # Buffer to store received data
+        self.buffer = QuicReassemblyBuffer()  # Reorders frames by their offset
+        self.window = QuicReceiveWindow(INITIAL_STREAM_WINDOW, MAX_STREAM_WINDOW)  # Limits what the peer may send
+        self.fin_offset = None  # Final size of the stream, known once the FIN frame arrives
+        self.ended = False  # The end of the stream was reported, retransmissions arriving after it are ignored
+        self.decoder = None  # QuicStreamDecompressor once a frame tells the stream is compressed
+        self.wire_ended = False  # All of a compressed stream was received, what is left is in the decoder
+        self.decoded_event_queued = False  # An event of the compressed stream waits to be consumed
+        self.decoded_end_queued = False  # Its last event, which carries end_of_stream, was queued
+
+    @property
+    def buffered_bytes(self):
+        return self.buffer.buffered_bytes
+
+    def receive_chunks(self, stream_frame: StreamFrame):
+        """Receive a StreamFrame and return (chunks that became contiguous, whether the stream ended)."""
+        if stream_frame.flags & StreamFrame.FIN_DATA_FRAME:
+            self.fin_offset = stream_frame.offset + len(stream_frame.stream_data)
+
+        released = self.buffer.push(stream_frame.offset, stream_frame.stream_data)
+        end_of_stream = (not self.ended and self.fin_offset is not None and
+                         self.buffer.read_offset >= self.fin_offset)
+        if end_of_stream:
+            self.ended = True
+        return released, end_of_stream
 
     def receive_stream_frame(self, stream_frame: StreamFrame):
-        """Receive a StreamFrame and generate a StreamDataReceived event."""
+        """Receive a StreamFrame and generate a StreamDataReceived event for newly contiguous data."""
+        released, end_of_stream = self.receive_chunks(stream_frame)
 
-        # Process the received data
-        self.received_data += stream_frame.stream_data
-        
-        end_of_stream = False
+        if not released and not end_of_stream:
+            return None
 
-        if stream_frame.flags & StreamFrame.FIN_DATA_FRAME:
-            end_of_stream = True
+        if self.decoder is not None:
+            self.decoder.feed(released)
+            self.wire_ended = end_of_stream
+            return None if self.decoded_event_queued else self.next_decoded_event()
 
         # Create a StreamDataReceived event
+        data = released[0] if len(released) == 1 else b"".join(released)
         event = StreamDataReceived(
             stream_id=self.stream_id,
-            data=stream_frame.stream_data,
+            data=data,
             end_of_stream=end_of_stream
         )
 
         # Return the event
         return event
 
+    def next_decoded_event(self):
+        """Decode the next chunk of a compressed stream into an event, None if there is nothing to deliver.
+
+        Only one such event is queued at a time, the next is decoded once it was consumed.
+        """
+        decoder = self.decoder
+        wire_start = decoder.wire_bytes
+        data = decoder.decode()
+        wire_size = decoder.wire_bytes - wire_start
+        end_of_stream = self.wire_ended and not decoder.has_pending()
+        if not data and not wire_size and (not end_of_stream or self.decoded_end_queued):
+            self.decoded_event_queued = False
+            return None
+        self.decoded_event_queued = True
+        self.decoded_end_queued = end_of_stream
+        return StreamDataReceived(self.stream_id, data, end_of_stream, wire_size)
+
+
+class QuicStreamReader:
+    """Application side of a received stream, an alternative to StreamDataReceived events.
+
+    Contiguous data is queued as the chunks the reassembly buffer released, without an
+    event object per chunk, and given back to the peer as stream credit only once it is
+    read: a reader that falls behind stalls its own stream and no other. read(n),
+    readinto() and iteration receive packets until data is available. With a callback
+    every chunk is handed to callback(chunk, end_of_stream) as it arrives instead.
+    """
+
+    def __init__(self, connection, stream_id: int, callback=None):
+        self.connection = connection
+        self.stream_id = stream_id
+        self.callback = callback
+        self.chunks = deque()  # Contiguous data not read yet, bytes or memoryviews of received datagrams
+        self.buffered_bytes = 0
+        self.end_of_stream = False  # The FIN arrived, once chunks is empty the stream is at EOF
+        self.decoder = None  # QuicStreamDecompressor of a compressed stream, maps what is read to wire bytes
+        self.wire_ended = False  # All of a compressed stream was received, some may not be decoded yet
+
+    def __len__(self):
+        return self.buffered_bytes
+
+    def at_eof(self) -> bool:
+        return self.end_of_stream and not self.chunks
+
+    def feed(self, chunks: list, end_of_stream: bool):
+        """Called by the connection with newly contiguous data.
+
+        The received bytes of a compressed stream go to the decoder, and are decoded a chunk
+        at a time as the decoded data is read.
+        """
+        if self.decoder is not None:
+            self.decoder.feed(chunks)
+            self.wire_ended = end_of_stream
+            self.decode_more()
+            return
+        self.deliver(chunks, end_of_stream)
+
+    def decode_more(self):
+        """Decode the next chunks of a compressed stream while less than a chunk of decoded data is buffered."""
+        decoder = self.decoder
+        while decoder.has_pending() and self.buffered_bytes < decoder.max_chunk:
+            chunk = decoder.decode_chunk()
+            self.deliver([chunk] if chunk else [], self.wire_ended and not decoder.has_pending())
+        if self.wire_ended and not self.end_of_stream and not decoder.has_pending():
+            self.deliver([], True)
+
+    def deliver(self, chunks: list, end_of_stream: bool):
+        """Queue data for reading, or hand it to the callback."""
+        self.end_of_stream = end_of_stream
+        if self.callback is not None:
+            size = 0
+            last = len(chunks) - 1
+            for index, chunk in enumerate(chunks):
+                self.callback(chunk, end_of_stream and index == last)
+                size += len(chunk)
+            if end_of_stream and not chunks:
+                self.callback(b"", True)
+            self.consumed(size)
+            return
+
+        for chunk in chunks:
+            if chunk:
+                self.chunks.append(chunk)
+                self.buffered_bytes += len(chunk)
+        self.wake()
+
+    def wake(self):
+        pass  # Blocking reads receive the packets themselves
+
+    def consumed(self, size: int):
+        if self.decoder is not None:
+            size = self.decoder.wire_consumed(size)
+            if self.callback is None:
+                self.decode_more()  # A callback is fed every chunk in turn by decode_more() itself
+        if size:
+            self.connection.on_stream_data_consumed(self.stream_id, size)
+
+    def wait_readable(self):
+        """Receive packets until data is buffered or the stream ended."""
+        connection = self.connection
+        while not self.chunks and not self.end_of_stream and not connection.peer_closed:
+            connection.recv()
+
+    def read_nowait(self, size: int = -1) -> bytes:
+        """Return up to size bytes (all buffered bytes if size is negative) without receiving."""
+        if size < 0 or size >= self.buffered_bytes:
+            data = b"".join(self.chunks)
+            self.chunks.clear()
+        else:
+            parts = []
+            remaining = size
+            while remaining:
+                chunk = self.chunks[0]
+                if len(chunk) <= remaining:
+                    parts.append(self.chunks.popleft())
+                    remaining -= len(chunk)
+                else:
+                    view = memoryview(chunk)
+                    parts.append(view[:remaining])
+                    self.chunks[0] = view[remaining:]
+                    remaining = 0
+            data = b"".join(parts)
+        self.buffered_bytes -= len(data)
+        self.consumed(len(data))
+        return data
+
+    def readinto_nowait(self, buffer) -> int:
+        """Copy buffered data into buffer without receiving, returns the number of bytes copied."""
+        target = memoryview(buffer).cast('B')
+        pos = 0
+        while self.chunks and pos < len(target):
+            chunk = self.chunks[0]
+            size = min(len(chunk), len(target) - pos)
+            target[pos:pos + size] = memoryview(chunk)[:size]
+            pos += size
+            if size == len(chunk):
+                self.chunks.popleft()
+            else:
+                self.chunks[0] = memoryview(chunk)[size:]
+        self.buffered_bytes -= pos
+        self.consumed(pos)
+        return pos
+
+    def next_chunk(self):
+        """Pop the oldest buffered chunk, without copying it."""
+        chunk = self.chunks.popleft()
+        self.buffered_bytes -= len(chunk)
+        self.consumed(len(chunk))
+        return chunk
+
+    def read(self, size: int = -1) -> bytes:
+        """Read up to size bytes, blocking until at least one is available. Returns b"" at EOF.
+
+        A negative size reads until the end of the stream.
+        """
+        if size < 0:
+            parts = []
+            self.wait_readable()
+            while self.chunks:
+                parts.append(self.read_nowait())
+                self.wait_readable()
+            return b"".join(parts)
+        self.wait_readable()
+        return self.read_nowait(size)
+
+    def readinto(self, buffer) -> int:
+        """Read into buffer, blocking until at least one byte is available. Returns 0 at EOF."""
+        self.wait_readable()
+        return self.readinto_nowait(buffer)
+
+    def __iter__(self):
+        """Yield the received chunks as they arrive until the end of the stream."""
+        while True:
+            self.wait_readable()
+            if not self.chunks:
+                return
+            yield self.next_chunk()
+
 
 class QUICStream:
     def __init__(self, stream_id: int):
@@ -0,0 +1,313 @@
+import json
+import os
+import threading
+import time
+from collections import deque
+from QuicPacket import StreamFrame, AckFrame, MaxDataFrame, MaxStreamDataFrame, SessionTicketFrame, PaddingFrame
+from QuicPacket import varint_size, expand_packet_number
+
+QLOG_VERSION = '0.3'
+RECORD_SEPARATOR = '\x1e'  # Starts every record of a JSON-SEQ qlog file
+
+
+class QuicHistogram:
+    """Distribution of samples in power of two buckets, cheap enough to record on every packet.
+
+    Samples are multiplied by scale and truncated to integers first, so seconds can be
+    recorded with a scale of 1e6 to bucket them in microseconds.
+    """
+
+    __slots__ = ('scale', 'buckets', 'count', 'total', 'minimum', 'maximum')
+
+    def __init__(self, scale: float = 1):
+        self.scale = scale
+        self.buckets = {}  # Bit length of the scaled sample -> count, bucket n holds samples below 2^n
+        self.count = 0
+        self.total = 0.0
+        self.minimum = None
+        self.maximum = None
+
+    def record(self, value: float):
+        bucket = int(value * self.scale).bit_length()
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+        self.count += 1
+        self.total += value
+        if self.minimum is None or value < self.minimum:
+            self.minimum = value
+        if self.maximum is None or value > self.maximum:
+            self.maximum = value
+
+    def to_dict(self) -> dict:
+        return {
+            'count': self.count,
+            'mean': self.total / self.count if self.count else None,
+            'min': self.minimum,
+            'max': self.maximum,
+            # Upper bound of every bucket, in the unit of the recorded values
+            'buckets': {(1 << bucket) / self.scale: count for bucket, count in sorted(self.buckets.items())},
+        }
+
+
+class QuicMetrics:
+    """Counters, histograms and per stream byte counts of one connection."""
+
+    def __init__(self):
+        self.counters = {}
+        self.histograms = {
+            'rtt': QuicHistogram(1e6),  # Seconds, bucketed in microseconds
+            'congestion_window': QuicHistogram(),
+            'bytes_in_flight': QuicHistogram(),
+            'send_queue_bytes': QuicHistogram(),  # Bytes waiting in the packetizer when a packet is sent
+            'event_queue_depth': QuicHistogram(),  # Events the application hasn't consumed yet
+        }
+        self.streams = {}  # Stream ID -> [bytes sent, bytes received, first activity, last activity]
+
+    def increment(self, name: str, amount: int = 1):
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    def record(self, name: str, value: float):
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms[name] = QuicHistogram()
+        histogram.record(value)
+
+    def on_stream_data(self, stream_id: int, sent: int, received: int, now: float):
+        stream = self.streams.get(stream_id)
+        if stream is None:
+            stream = self.streams[stream_id] = [0, 0, now, now]
+        stream[0] += sent
+        stream[1] += received
+        stream[3] = now
+
+    def snapshot(self) -> dict:
+        streams = {}
+        for stream_id, (sent, received, first, last) in self.streams.items():
+            duration = last - first
+            streams[stream_id] = {
+                'bytes_sent': sent,
+                'bytes_received': received,
+                'duration': duration,
+                'throughput': (sent + received) / duration if duration > 0 else None,
+            }
+        return {
+            'counters': dict(self.counters),
+            'histograms': {name: histogram.to_dict() for name, histogram in self.histograms.items()
+                           if histogram.count},
+            'streams': streams,
+        }
+
+
+def frame_to_qlog(frame) -> dict:
+    if isinstance(frame, StreamFrame):
+        return {'frame_type': 'stream', 'stream_id': frame.stream_id, 'offset': frame.offset,
+                'length': len(frame.stream_data), 'fin': bool(frame.flags & StreamFrame.FIN_DATA_FRAME)}
+    if isinstance(frame, AckFrame):
+        return {'frame_type': 'ack', 'ack_delay': frame.ack_delay * 1000,
+                'acked_ranges': [[first, last] for first, last in frame.ranges]}
+    if isinstance(frame, MaxDataFrame):
+        return {'frame_type': 'max_data', 'maximum': frame.maximum}
+    if isinstance(frame, MaxStreamDataFrame):
+        return {'frame_type': 'max_stream_data', 'stream_id': frame.stream_id, 'maximum': frame.maximum}
+    if isinstance(frame, SessionTicketFrame):
+        return {'frame_type': 'new_token', 'token': {'length': len(frame.ticket)}, 'lifetime': frame.lifetime}
+    if isinstance(frame, PaddingFrame):
+        return {'frame_type': 'padding', 'length': frame.length}
+    return {'frame_type': 'unknown'}
+
+
+class QuicTracer:
+    """Metrics and qlog events of one connection.
+
+    A connection without a tracer (tracer=None) skips all of this behind a single
+    attribute check. Events go into a ring buffer of the last capacity events, appending
+    and draining a deque needs no lock, so flush() can run on another thread, see
+    QuicTraceFlusher. Without a path the events are only kept in the ring buffer.
+    """
+
+    def __init__(self, vantage_point: str, path: str = None, capacity: int = 4096, title: str = None):
+        self.vantage_point = vantage_point  # 'client' or 'server'
+        self.path = path  # JSON-SEQ qlog file the events are flushed to
+        self.title = title
+        self.metrics = QuicMetrics()
+        self.events = deque(maxlen=capacity)  # (time, name, data), the oldest are overwritten when full
+        self.events_dropped = 0  # Overwritten before they were flushed
+        self.start_time = time.monotonic()  # qlog times are relative to this
+        self.reference_time = time.time() * 1000  # Wall clock of start_time in milliseconds
+        self.file = None
+        self.flusher = None  # QuicTraceFlusher writing the events in the background, if any
+        self.closed = False
+
+    def log(self, name: str, data: dict):
+        events = self.events
+        if len(events) == events.maxlen:
+            self.events_dropped += 1
+        events.append((time.monotonic(), name, data))
+
+    def packet_sent(self, packet, size: int, queued_bytes: int):
+        metrics = self.metrics
+        metrics.increment('packets_sent')
+        metrics.increment('bytes_sent', size)
+        metrics.record('send_queue_bytes', queued_bytes)
+        self.log('transport:packet_sent', {
+            'header': {'packet_type': '1RTT', 'packet_number': packet.packet_number, 'flags': packet.flags},
+            'raw': {'length': size},
+            'frames': [frame_to_qlog(frame) for frame in packet.frames],
+        })
+
+    def packet_received(self, packet, largest_received: int):
+        """Count a received packet, called before its packet number is expanded."""
+        length = packet.packet_number_length
+        packet_number = packet.packet_number
+        if length is not None:
+            packet_number = expand_packet_number(packet_number, length, largest_received)
+        size = 2 + varint_size(packet.connection_id) + (length or 4) + sum(frame.encoded_size()
+                                                                            for frame in packet.frames)
+        self.metrics.increment('packets_received')
+        self.metrics.increment('bytes_received', size)
+        self.log('transport:packet_received', {
+            'header': {'packet_type': '1RTT', 'packet_number': packet_number, 'flags': packet.flags},
+            'raw': {'length': size},
+            'frames': [frame_to_qlog(frame) for frame in packet.frames],
+        })
+
+    def packet_dropped(self, trigger: str, **details):
+        self.metrics.increment('packets_dropped')
+        self.log('transport:packet_dropped', dict(details, trigger=trigger))
+
+    def packets_acked(self, count: int):
+        self.metrics.increment('packets_acked', count)
+
+    def packet_lost(self, packet_number: int, trigger: str):
+        self.metrics.increment('packets_lost')
+        self.log('recovery:packet_lost', {'header': {'packet_number': packet_number}, 'trigger': trigger})
+
+    def data_retransmitted(self, size: int):
+        self.metrics.increment('bytes_retransmitted', size)
+
+    def metrics_updated(self, recovery, congestion):
+        metrics = self.metrics
+        metrics.record('rtt', recovery.latest_rtt)
+        metrics.record('congestion_window', congestion.congestion_window)
+        metrics.record('bytes_in_flight', congestion.bytes_in_flight)
+        self.log('recovery:metrics_updated', {
+            'min_rtt': recovery.min_rtt * 1000 if recovery.min_rtt is not None else None,
+            'smoothed_rtt': recovery.smoothed_rtt * 1000,
+            'latest_rtt': recovery.latest_rtt * 1000,
+            'rtt_variance': recovery.rttvar * 1000,
+            'congestion_window': int(congestion.congestion_window),
+            'bytes_in_flight': congestion.bytes_in_flight,
+            'ssthresh': congestion.ssthresh if congestion.ssthresh != float('inf') else None,
+        })
+
+    def stream_data_sent(self, stream_id: int, size: int, end_of_stream: bool):
+        now = time.monotonic()
+        self.metrics.on_stream_data(stream_id, size, 0, now)
+        if end_of_stream:
+            self.log('transport:stream_state_updated', {'stream_id': stream_id, 'new': 'data_sent'})
+
+    def stream_data_received(self, stream_id: int, size: int, end_of_stream: bool, queue_depth: int):
+        now = time.monotonic()
+        self.metrics.on_stream_data(stream_id, 0, size, now)
+        self.metrics.record('event_queue_depth', queue_depth)
+        if end_of_stream:
+            self.log('transport:stream_state_updated', {'stream_id': stream_id, 'new': 'data_received'})
+
+    def drain(self) -> list:
+        """Remove and return the buffered events, oldest first."""
+        events = self.events
+        drained = []
+        try:
+            while True:
+                drained.append(events.popleft())
+        except IndexError:
+            return drained
+
+    def flush(self):
+        """Write the buffered events to path, starting the file with the qlog header."""
+        events = self.drain()
+        if self.path is None:
+            return
+        if self.file is None:
+            self.file = open(self.path, 'w')
+            self.write_record({
+                'qlog_version': QLOG_VERSION,
+                'qlog_format': 'JSON-SEQ',
+                'title': self.title,
+                'trace': {
+                    'vantage_point': {'type': self.vantage_point},
+                    'common_fields': {'time_format': 'relative', 'reference_time': self.reference_time},
+                },
+            })
+        for event_time, name, data in events:
+            self.write_record({'time': (event_time - self.start_time) * 1000, 'name': name, 'data': data})
+        self.file.flush()
+
+    def write_record(self, record: dict):
+        self.file.write(RECORD_SEPARATOR)
+        self.file.write(json.dumps(record))
+        self.file.write('\n')
+
+    def close(self):
+        """The connection is done: write what is left, on the flusher's thread if there is one."""
+        self.closed = True
+        if self.flusher is None:
+            self.finish()
+
+    def finish(self):
+        self.flush()  # Makes room, so the closing records don't overwrite events that are still buffered
+        if self.events_dropped:
+            self.log('loglevel:warning', {'message': f"{self.events_dropped} events were overwritten "
+                                                     f"before they were flushed"})
+        self.log('generic:metrics', self.metrics.snapshot())
+        self.flush()
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+class QuicTraceFlusher:
+    """Writes the events of many tracers to their files from a background thread, every interval seconds.
+
+    Keeps file I/O off the thread that sends and receives packets.
+    """
+
+    def __init__(self, interval: float = 1.0):
+        self.interval = interval
+        self.tracers = []
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, name='QuicTraceFlusher', daemon=True)
+        self.thread.start()
+
+    def add(self, tracer: QuicTracer) -> QuicTracer:
+        tracer.flusher = self
+        self.tracers.append(tracer)
+        return tracer
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.flush_all()
+        self.flush_all()
+
+    def flush_all(self):
+        for tracer in list(self.tracers):
+            if tracer.closed:
+                self.tracers.remove(tracer)
+                tracer.finish()
+            else:
+                tracer.flush()
+
+    def stop(self):
+        """Flush everything and wait for the thread, tracers still open are finished as if closed."""
+        for tracer in list(self.tracers):
+            tracer.closed = True
+        self.stopped.set()
+        self.thread.join()
+
+
+def qlog_path(qlog_dir: str, connection_id: int) -> str:
+    return os.path.join(qlog_dir, f"server-{connection_id}.sqlog")
+
+
+def qlog_tracer_factory(flusher: QuicTraceFlusher, qlog_dir: str):
+    """tracer_factory of a QUICServerEndpoint that writes a qlog file per connection into qlog_dir."""
+    return lambda connection_id: flusher.add(QuicTracer('server', qlog_path(qlog_dir, connection_id)))
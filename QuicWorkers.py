@@ -0,0 +1,196 @@
+import asyncio
+import ctypes
+import multiprocessing
+import multiprocessing.connection
+import secrets
+import socket
+import struct
+import time
+from QuicEndpoint import QUICServerEndpoint
+from QuicPacket import PACKET_FORMAT_VARINT
+from QuicSessionTicket import QuicTicketIssuer
+from QuicTrace import QuicTraceFlusher, qlog_tracer_factory
+
+SO_ATTACH_REUSEPORT_CBPF = getattr(socket, 'SO_ATTACH_REUSEPORT_CBPF', 51)
+
+# Classic BPF instruction opcodes used by the steering program
+BPF_LD_B_ABS = 0x30
+BPF_RSH_K = 0x74
+BPF_SUB_K = 0x14
+BPF_JA = 0x05
+BPF_JEQ_K = 0x15
+BPF_JSET_K = 0x45
+BPF_RET_A = 0x16
+BPF_RET_K = 0x06
+
+# The connection ID varint follows the format and flags bytes, its lowest byte holds the worker
+CONNECTION_ID_OFFSET = 2
+
+
+def reuseport_steering_program():
+    """Classic BPF that sends a datagram to socket (worker byte - 1), or to the kernel hash for new connections."""
+    first, two, four, eight = (CONNECTION_ID_OFFSET + length - 1 for length in (1, 2, 4, 8))
+    instructions = [
+        (BPF_LD_B_ABS, 0, 0, 0),  # 0: A = first byte
+        (BPF_JSET_K, 0, 13, PACKET_FORMAT_VARINT),  # 1: Legacy format: fall back to hashing
+        (BPF_LD_B_ABS, 0, 0, first),  # 2: A = first byte of the connection ID
+        (BPF_RSH_K, 0, 0, 6),  # 3: A = varint length prefix
+        (BPF_JEQ_K, 2, 0, 1),  # 4: 2 byte connection ID
+        (BPF_JEQ_K, 3, 0, 2),  # 5: 4 byte connection ID
+        (BPF_JEQ_K, 4, 8, 3),  # 6: 8 byte connection ID, a 1 byte one has no worker byte
+        (BPF_LD_B_ABS, 0, 0, two),  # 7: A = worker byte of a 2 byte connection ID
+        (BPF_JA, 0, 0, 3),
+        (BPF_LD_B_ABS, 0, 0, four),  # 9: A = worker byte of a 4 byte connection ID
+        (BPF_JA, 0, 0, 1),
+        (BPF_LD_B_ABS, 0, 0, eight),  # 11: A = worker byte of an 8 byte connection ID
+        (BPF_JEQ_K, 2, 0, 0),  # 12: No connection ID yet (START packet): fall back to hashing
+        (BPF_SUB_K, 0, 0, 1),  # 13: A = worker index
+        (BPF_RET_A, 0, 0, 0),
+        (BPF_RET_K, 0, 0, 0xffffffff),  # 15: Out of range index, the kernel picks a socket by hash
+    ]
+    return b''.join(struct.pack('HBBI', *instruction) for instruction in instructions), len(instructions)
+
+
+def attach_steering_program(sock: socket.socket) -> bool:
+    """Attach the steering program to the SO_REUSEPORT group of sock, returns False where unsupported."""
+    program, length = reuseport_steering_program()
+    filters = ctypes.create_string_buffer(program)
+    fprog = struct.pack('HP', length, ctypes.addressof(filters))
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, SO_ATTACH_REUSEPORT_CBPF, fprog)
+        return True
+    except OSError as e:
+        print(f"Connection ID steering unavailable ({e}), relying on the kernel address hash.")
+        return False
+
+
+def run_worker(worker_index: int, sock: socket.socket, handler_factory, stats_pipe, stats_interval: float,
+               congestion_control: str, scheduler: str, qlog_dir: str, ticket_key: bytes):
+    """Process entry point: serve connections on this worker's socket and report stats."""
+    asyncio.run(serve_worker(worker_index, sock, handler_factory, stats_pipe, stats_interval, congestion_control,
+                             scheduler, qlog_dir, ticket_key))
+
+
+async def serve_worker(worker_index, sock, handler_factory, stats_pipe, stats_interval, congestion_control,
+                       scheduler, qlog_dir, ticket_key):
+    # The flusher thread is started here, a thread of the supervisor would not survive the fork
+    flusher = QuicTraceFlusher() if qlog_dir else None
+    tracer_factory = qlog_tracer_factory(flusher, qlog_dir) if flusher is not None else None
+    endpoint = QUICServerEndpoint(handler_factory(), congestion_control=congestion_control, worker_index=worker_index,
+                                  scheduler=scheduler, tracer_factory=tracer_factory,
+                                  ticket_issuer=QuicTicketIssuer(ticket_key))
+    await endpoint.listen(sock=sock)
+    try:
+        while True:
+            await asyncio.sleep(stats_interval)
+            stats_pipe.send(endpoint.get_stats())
+    finally:
+        await endpoint.close()
+        if flusher is not None:
+            flusher.stop()
+
+
+class QuicWorkerSupervisor:
+    """Runs one QUICServerEndpoint per worker process, all sharing a port through SO_REUSEPORT.
+
+    The supervisor binds every worker socket itself and keeps them open, so a socket keeps
+    its index in the reuseport group across worker restarts and connection IDs that encode
+    the worker index keep being steered to the right process. The resumption ticket key is
+    created here too, so every worker, restarted ones included, accepts every worker's tickets.
+    """
+
+    def __init__(self, host: str, port: int, num_workers: int, handler_factory, stats_interval: float = 5.0,
+                 congestion_control: str = 'newreno', scheduler: str = 'round_robin', qlog_dir: str = None):
+        if num_workers > 255:
+            raise ValueError("At most 255 workers fit in the connection ID worker byte.")
+        self.host = host
+        self.port = port
+        self.num_workers = num_workers
+        self.handler_factory = handler_factory  # Called in each worker, returns the connection handler
+        self.stats_interval = stats_interval
+        self.congestion_control = congestion_control
+        self.scheduler = scheduler  # Stream scheduler policy of every connection
+        self.qlog_dir = qlog_dir  # Each worker writes a qlog file per connection here, None to skip tracing
+        self.ticket_key = secrets.token_bytes(32)  # Shared by the ticket issuers of all workers
+        self.context = multiprocessing.get_context('fork')  # Workers inherit the bound sockets
+        self.sockets = []
+        self.workers = {}  # Worker index -> Process
+        self.stats_pipes = {}  # Worker index -> receiving end of the worker's stats pipe
+        self.worker_stats = {}  # Worker index -> latest stats reported by that worker
+        self.restarts = 0
+
+    def create_sockets(self):
+        for _ in range(self.num_workers):
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+            sock.bind((self.host, self.port))
+            sock.setblocking(False)
+            self.sockets.append(sock)
+        attach_steering_program(self.sockets[0])
+
+    def start_worker(self, worker_index: int):
+        stats_reader, stats_writer = self.context.Pipe(duplex=False)
+        process = self.context.Process(
+            target=run_worker,
+            args=(worker_index, self.sockets[worker_index], self.handler_factory, stats_writer,
+                  self.stats_interval, self.congestion_control, self.scheduler, self.qlog_dir, self.ticket_key),
+            daemon=True
+        )
+        process.start()
+        stats_writer.close()  # Only the worker writes, so the reader sees EOF once it exits
+        self.workers[worker_index] = process
+        self.stats_pipes[worker_index] = stats_reader
+        print(f"Started worker {worker_index} (pid {process.pid})")
+
+    def collect_stats(self, worker_index: int):
+        stats_reader = self.stats_pipes[worker_index]
+        try:
+            while stats_reader.poll():
+                self.worker_stats[worker_index] = stats_reader.recv()
+        except EOFError:
+            pass  # The worker exited, its sentinel triggers the restart
+
+    def aggregate_stats(self) -> dict:
+        total = {'workers': len(self.workers), 'restarts': self.restarts}
+        for stats in self.worker_stats.values():
+            for key, value in stats.items():
+                total[key] = total.get(key, 0) + value
+        return total
+
+    def run(self, duration: float = None):
+        """Start the workers, restart any that exit and report aggregate stats until duration elapses."""
+        self.create_sockets()
+        for worker_index in range(self.num_workers):
+            self.start_worker(worker_index)
+
+        deadline = None if duration is None else time.monotonic() + duration
+        next_report = time.monotonic() + self.stats_interval
+        try:
+            while deadline is None or time.monotonic() < deadline:
+                sentinels = {process.sentinel: worker_index for worker_index, process in self.workers.items()}
+                multiprocessing.connection.wait(list(sentinels) + list(self.stats_pipes.values()), timeout=1.0)
+
+                for worker_index in list(self.workers):
+                    self.collect_stats(worker_index)
+                    process = self.workers[worker_index]
+                    if not process.is_alive():
+                        print(f"Worker {worker_index} exited with code {process.exitcode}, restarting it.")
+                        self.stats_pipes.pop(worker_index).close()
+                        self.restarts += 1
+                        self.start_worker(worker_index)
+
+                if time.monotonic() >= next_report:
+                    print(f"Server stats: {self.aggregate_stats()}")
+                    next_report = time.monotonic() + self.stats_interval
+        finally:
+            self.stop()
+
+    def stop(self):
+        for process in self.workers.values():
+            process.terminate()
+        for process in self.workers.values():
+            process.join()
+        for stats_reader in self.stats_pipes.values():
+            stats_reader.close()
+        for sock in self.sockets:
+            sock.close()
@@ -1,71 +1,198 @@
-import time
+import asyncio
+import os
 import random
+import sys
+from collections import deque
 from Quic import QUICProtocol
+from QuicAsync import AsyncQUICProtocol
+from QuicEndpoint import QUICServerEndpoint
+from QuicWorkers import QuicWorkerSupervisor
+from QuicTrace import QuicTracer, QuicTraceFlusher, qlog_path, qlog_tracer_factory
+from QuicFileSource import QuicFileSource
 from Events import *
 
 
-def run_server(host='127.0.0.1', port=4433):
-    server = QUICProtocol(is_client=False)
+def print_compression_stats(server, num_streams: int):
+    for stream_id in range(1, num_streams + 1):
+        stream = server.streams.get(stream_id)
+        compressor = stream.sender.compressor if stream is not None else None
+        if compressor is not None:
+            stats = compressor.get_stats()
+            switched_off = stats['switched_off_at']
+            print(f"Stream {stream_id} sent {stats['bytes_in']} bytes as {stats['bytes_out']}"
+                  f"{'' if switched_off is None else f', compression switched off after {switched_off}'}.")
+
+
+def run_server(host='127.0.0.1', port=4433, congestion_control='newreno', scheduler='round_robin', qlog_dir=None,
+               compress=False):
+    server = QUICProtocol(is_client=False, congestion_control=congestion_control, scheduler=scheduler)
     server.bind(host, port)
     print(f"Server listening on {host}:{port}")
 
     server.accept_connection()
+    flusher = QuicTraceFlusher() if qlog_dir else None
+    if flusher is not None:
+        server.tracer = flusher.add(QuicTracer('server', qlog_path(qlog_dir, server.connection_id)))
 
-    # Load the content of the file to send
-    with open('toSend.txt', 'rb') as file:
-        file_data = file.read()
+    # Map the file to send, every stream only keeps its offset in it
+    source = QuicFileSource('toSend.txt')
 
-    # Create dictionaries to track the remaining data and chunk size for each stream
-    remaining_data_per_stream = {}
+    # Create dictionaries to track the read position and chunk size for each stream
+    cursor_per_stream = {}
     chunk_size_per_stream = {}
-    streams_remaining = set()
+    streams_remaining = deque()
 
     while True:
-        server.recv()  # Process incoming packets
-
+        # The handshake may have received the request already
         while not server.events.empty():
-            event = server.events.get()
+            event = server.next_event()
             if isinstance(event, StreamRequestEvent):
                 num_streams = event.num_streams
                 print(f"Preparing to send {num_streams} streams to client.")
 
                 # Initialize dictionaries for each stream
                 for stream_id in range(1, num_streams + 1):
-                    remaining_data_per_stream[stream_id] = file_data[:]
+                    if compress:
+                        server.set_stream_compression(stream_id)
+                    cursor_per_stream[stream_id] = source.cursor()
                     chunk_size_per_stream[stream_id] = random.randint(1000, 2000)
                     print(f"Stream {stream_id} using chunk size: {chunk_size_per_stream[stream_id]}")
 
-                # Continue sending data until all streams are done
-                streams_remaining = set(range(1, num_streams + 1))
+                # Continue sending data until all streams are done, taking turns to queue a chunk each,
+                # the protocol's scheduler decides which stream goes into each packet
+                streams_remaining = deque(range(1, num_streams + 1))
 
                 while streams_remaining:
-                    stream_id = random.choice(list(streams_remaining))
-                    data_chunk = remaining_data_per_stream[stream_id]
-
-                    if data_chunk:
-                        # Use the pre-sampled chunk size for this stream
-                        chunk_size = chunk_size_per_stream[stream_id]
+                    stream_id = streams_remaining.popleft()
+                    cursor = cursor_per_stream[stream_id]
 
-                        chunk = data_chunk[:chunk_size]
-                        remaining_data_per_stream[stream_id] = data_chunk[chunk_size:]
+                    # Use the pre-sampled chunk size for this stream
+                    chunk = cursor.read(chunk_size_per_stream[stream_id])
 
-                        end_of_stream = len(remaining_data_per_stream[stream_id]) == 0
-                        server.send(stream_id, chunk, end_of_stream=end_of_stream)
+                    end_of_stream = cursor.at_end()
+                    server.send(stream_id, chunk, end_of_stream=end_of_stream)
 
-                        if end_of_stream:
-                            print(f"Stream {stream_id} has finished sending.")
-                            streams_remaining.remove(stream_id)
-                    else:
-                        streams_remaining.remove(stream_id)
+                    if not end_of_stream:
+                        streams_remaining.append(stream_id)
 
-        if not streams_remaining:
+        if server.stream_request_received and not streams_remaining:
+            print_compression_stats(server, len(cursor_per_stream))
             print("All streams have been sent. Closing server.")
             break
+        if server.peer_closed:
+            print("The connection closed before a stream request arrived.")
+            break
 
-        time.sleep(0.1)  # Slight delay to avoid CPU overload
+        server.recv()  # Process incoming packets
 
     server.close()
+    if flusher is not None:
+        flusher.stop()
+
+
+async def run_server_async(host='127.0.0.1', port=4433, congestion_control='newreno', scheduler='round_robin',
+                           qlog_dir=None, compress=False):
+    server = AsyncQUICProtocol(is_client=False, congestion_control=congestion_control, scheduler=scheduler)
+    await server.bind(host, port)
+    print(f"Server listening on {host}:{port}")
+
+    await server.accept_connection()
+    flusher = QuicTraceFlusher() if qlog_dir else None
+    if flusher is not None:
+        server.tracer = flusher.add(QuicTracer('server', qlog_path(qlog_dir, server.connection_id)))
+
+    await serve_file(server, QuicFileSource('toSend.txt'), compress=compress)
+    if flusher is not None:
+        flusher.stop()
+
+
+async def serve_file(server, source: QuicFileSource, chunk_size: int = None, compress: bool = False):
+    """Answer the stream request of one connection by sending the file of source on every stream.
+
+    Every stream sends chunks of chunk_size bytes, or of a random size between 1000 and 2000.
+    Each stream is sent by its own task, so a stream whose reader is slow only holds back itself.
+    With compress, streams are compressed when the client offered zlib.
+    """
+    event = await server.recv()
+    while not isinstance(event, StreamRequestEvent):
+        if isinstance(event, ConnectionClosed):
+            print("The connection closed before a stream request arrived.")
+            await server.close()
+            return
+        event = await server.recv()
+
+    num_streams = event.num_streams
+    print(f"Preparing to send {num_streams} streams to client.")
+
+    senders = []
+    for stream_id in range(1, num_streams + 1):
+        if compress:
+            server.set_stream_compression(stream_id)
+        stream_chunk_size = chunk_size or random.randint(1000, 2000)
+        print(f"Stream {stream_id} using chunk size: {stream_chunk_size}")
+        senders.append(send_stream(server, stream_id, source, stream_chunk_size))
+    await asyncio.gather(*senders)
+
+    print_compression_stats(server, num_streams)
+    print("All streams have been sent. Closing server.")
+    await server.close()
+
+
+async def send_stream(server, stream_id: int, source: QuicFileSource, chunk_size: int):
+    """Send source on one stream, the chunks are views of the mapped file."""
+    cursor = source.cursor()
+    while True:
+        chunk = cursor.read(chunk_size)
+        end_of_stream = cursor.at_end()
+        await server.send(stream_id, chunk, end_of_stream=end_of_stream)
+        if end_of_stream:
+            return
+
+
+async def run_multi_server(host='127.0.0.1', port=4433, congestion_control='newreno', scheduler='round_robin',
+                           qlog_dir=None, compress=False):
+    """Serve any number of concurrent clients from one UDP port, with a qlog file per connection in qlog_dir."""
+    source = QuicFileSource('toSend.txt')  # Mapped once, shared by every connection
+
+    flusher = QuicTraceFlusher() if qlog_dir else None
+    tracer_factory = qlog_tracer_factory(flusher, qlog_dir) if flusher is not None else None
+
+    endpoint = QUICServerEndpoint(lambda connection: serve_file(connection, source, compress=compress),
+                                  congestion_control=congestion_control, scheduler=scheduler,
+                                  tracer_factory=tracer_factory)
+    await endpoint.listen(host, port)
+    print(f"Server listening on {host}:{port}")
+
+    try:
+        await asyncio.get_running_loop().create_future()  # Serve until cancelled
+    finally:
+        await endpoint.close()
+        if flusher is not None:
+            flusher.stop()
+
+
+def run_sharded_server(host='127.0.0.1', port=4433, num_workers=None, congestion_control='newreno', duration=None,
+                       compress=False, scheduler='round_robin', qlog_dir=None):
+    """Serve clients from num_workers processes sharing the port, one event loop per CPU core."""
+    source = QuicFileSource('toSend.txt')  # Mapped once, the forked workers share the pages
+
+    supervisor = QuicWorkerSupervisor(host, port, num_workers or os.cpu_count(),
+                                      lambda: (lambda connection: serve_file(connection, source, compress=compress)),
+                                      congestion_control=congestion_control, scheduler=scheduler, qlog_dir=qlog_dir)
+    print(f"Server listening on {host}:{port} with {supervisor.num_workers} workers")
+    supervisor.run(duration)
 
 
 if __name__ == '__main__':
-    run_server()
+    scheduler = sys.argv[sys.argv.index('--scheduler') + 1] if '--scheduler' in sys.argv else 'round_robin'
+    qlog_dir = sys.argv[sys.argv.index('--qlog') + 1] if '--qlog' in sys.argv else None
+    compress = '--compression' in sys.argv
+    if '--workers' in sys.argv:
+        run_sharded_server(num_workers=int(sys.argv[sys.argv.index('--workers') + 1]), compress=compress,
+                           scheduler=scheduler, qlog_dir=qlog_dir)
+    elif '--multi' in sys.argv:
+        asyncio.run(run_multi_server(scheduler=scheduler, qlog_dir=qlog_dir, compress=compress))
+    elif '--async' in sys.argv:
+        asyncio.run(run_server_async(scheduler=scheduler, qlog_dir=qlog_dir, compress=compress))
+    else:
+        run_server(scheduler=scheduler, qlog_dir=qlog_dir, compress=compress)
@@ -0,0 +1,12 @@
+import pytest
+from Quic import QUICProtocol
+
+
+@pytest.fixture
+def connection():
+    """A connection that is never connected, the packets it sends go to a closed local port."""
+    protocol = QUICProtocol(is_client=True)
+    protocol.address = ('127.0.0.1', 9)
+    protocol.connection_id = 1
+    yield protocol
+    protocol.socket.close()
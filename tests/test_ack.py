@@ -0,0 +1,69 @@
+from QuicAck import QuicAckTracker
+from QuicPacket import AckFrame
+
+
+def round_trip(frame):
+    buffer = bytearray(frame.encoded_size())
+    assert frame.serialize_into(buffer) == len(buffer)
+    received, pos = AckFrame.deserialize(buffer)
+    assert pos == len(buffer)
+    return received
+
+
+def test_single_range():
+    received = round_trip(AckFrame([(0, 10)], 0.0))
+    assert received.ranges == [(0, 10)]
+    assert received.largest_acknowledged == 10
+
+
+def test_several_ranges():
+    ranges = [(300, 16500), (100, 200), (98, 98), (0, 5)]  # Gaps of one packet and more, varints of all sizes
+    assert round_trip(AckFrame(ranges, 0.0)).ranges == ranges
+
+
+def test_ack_delay_in_microseconds():
+    assert round_trip(AckFrame([(1, 1)], 0.012345)).ack_delay == 0.012345
+    assert round_trip(AckFrame([(1, 1)], 0.0000004)).ack_delay == 0.0  # Below a microsecond
+
+
+def test_in_order_packets_are_acked_every_ack_frequency():
+    tracker = QuicAckTracker(ack_frequency=2, max_ack_delay=0.025)
+    assert not tracker.on_packet_received(0, now=1.0)
+    assert tracker.ack_deadline == 1.025
+    assert tracker.on_packet_received(1, now=1.001)
+    frame = tracker.build_frame(now=1.003)
+    assert frame.ranges == [(0, 1)]
+    assert abs(frame.ack_delay - 0.002) < 1e-9
+    assert not tracker.has_pending() and tracker.ack_deadline is None
+
+
+def test_out_of_order_packet_is_acked_at_once():
+    tracker = QuicAckTracker(ack_frequency=10)
+    assert not tracker.on_packet_received(0, now=0.0)
+    assert tracker.on_packet_received(2, now=0.0)  # Packet 1 is missing
+    assert tracker.build_frame(now=0.0).ranges == [(2, 2), (0, 0)]
+    assert tracker.on_packet_received(1, now=0.0)  # Fills the gap, still out of order
+    assert tracker.build_frame(now=0.0).ranges == [(0, 2)]
+
+
+def test_ack_only_packets_are_not_acked_on_their_own():
+    tracker = QuicAckTracker(ack_frequency=1)
+    assert not tracker.on_packet_received(0, now=0.0, ack_eliciting=False)
+    assert not tracker.has_pending()
+    assert tracker.largest_received == 0
+
+
+def test_ack_delay_counts_from_the_largest_packet():
+    tracker = QuicAckTracker(ack_frequency=10)
+    tracker.on_packet_received(5, now=1.0)
+    tracker.on_packet_received(3, now=1.5)  # Older packet, the largest is still 5
+    assert abs(tracker.build_frame(now=2.0).ack_delay - 1.0) < 1e-9
+
+
+def test_oldest_ranges_are_forgotten():
+    tracker = QuicAckTracker()
+    for packet_number in range(0, 2 * (QuicAckTracker.MAX_RANGES + 5), 2):
+        tracker.on_packet_received(packet_number, now=0.0)
+    ranges = tracker.build_frame(now=0.0).ranges
+    assert len(ranges) == QuicAckTracker.MAX_RANGES
+    assert ranges[0] == (packet_number, packet_number)
@@ -0,0 +1,19 @@
+from Benchmark import percentiles
+
+
+def test_percentiles_take_the_nearest_rank():
+    assert percentiles(list(range(1, 11))) == {'p50': 5, 'p90': 9, 'p99': 10, 'max': 10}
+    assert percentiles(list(range(1, 101))) == {'p50': 50, 'p90': 90, 'p99': 99, 'max': 100}
+
+
+def test_percentiles_of_unsorted_samples():
+    # 63 of the 70 samples are at or below the 63rd smallest, so it is the 90th percentile
+    samples = list(range(70, 0, -1))
+    assert percentiles(samples)['p90'] == 63
+    assert percentiles(samples)['p50'] == 35
+
+
+def test_percentiles_of_few_samples():
+    assert percentiles([]) is None
+    assert percentiles([0.25]) == {'p50': 0.25, 'p90': 0.25, 'p99': 0.25, 'max': 0.25}
+    assert percentiles([2, 1]) == {'p50': 1, 'p90': 2, 'p99': 2, 'max': 2}
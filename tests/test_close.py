@@ -0,0 +1,68 @@
+import socket
+from Quic import QUICProtocol
+from QuicPacket import QUICPacket, AckFrame, StreamFrame
+
+
+def connected_pair():
+    """A connection with ID 1 and the socket of its peer, both on loopback."""
+    peer = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    peer.bind(('127.0.0.1', 0))
+    peer.settimeout(1.0)
+    connection = QUICProtocol(is_client=True)
+    connection.socket.bind(('127.0.0.1', 0))
+    connection.address = peer.getsockname()
+    connection.connection_id = 1
+    return connection, peer
+
+
+def test_late_packets_do_not_use_up_the_fin_retries():
+    connection, peer = connected_pair()
+
+    # More late packets than there are FIN retries are waiting in front of the FIN_ACK
+    for packet_number in range(2 * connection.recovery.MAX_PTO_COUNT):
+        late = QUICPacket(QUICProtocol.ACK_FLAG, 1, packet_number, [])
+        peer.sendto(late.serialize(), connection.socket.getsockname())
+    fin_ack = QUICPacket(QUICProtocol.FIN_ACK_FLAG, 1, 100, [])
+    peer.sendto(fin_ack.serialize(), connection.socket.getsockname())
+
+    connection.close_connection()
+
+    # One FIN, then the ACK of the FIN_ACK
+    fin = QUICPacket.deserialize(peer.recv(2048))
+    assert fin.flags == QUICProtocol.FIN_FLAG
+    assert QUICPacket.deserialize(peer.recv(2048)).flags == QUICProtocol.ACK_FLAG
+    connection.socket.close()
+    peer.close()
+
+
+def test_late_data_and_ack_frames_do_not_end_or_retry_the_fin_ack():
+    connection, peer = connected_pair()
+
+    # Late stream data and ACK frames, more of each than there are retries, then the ACK of the FIN_ACK
+    for packet_number in range(2 * connection.recovery.MAX_PTO_COUNT):
+        data = StreamFrame(1, packet_number * 10, 10, bytes(10))
+        peer.sendto(QUICPacket(QUICProtocol.STREAM_DATA_FLAG, 1, packet_number, [data]).serialize(),
+                    connection.socket.getsockname())
+        ack = AckFrame([(0, packet_number)])
+        peer.sendto(QUICPacket(QUICProtocol.ACK_FLAG, 1, 100 + packet_number, [ack]).serialize(),
+                    connection.socket.getsockname())
+    peer.sendto(QUICPacket(QUICProtocol.ACK_FLAG, 1, 200, []).serialize(), connection.socket.getsockname())
+
+    connection.recv_fin()
+
+    # Only the ACK ended the exchange, after a single FIN_ACK
+    assert QUICPacket.deserialize(peer.recv(2048)).flags == QUICProtocol.FIN_ACK_FLAG
+    peer.settimeout(0.0)
+    try:
+        extra = peer.recv(2048)
+    except BlockingIOError:
+        extra = None
+    assert extra is None
+    connection.socket.settimeout(0.0)
+    try:
+        unread = connection.socket.recv(2048)
+    except BlockingIOError:
+        unread = None
+    assert unread is None and not connection.received_datagrams
+    connection.socket.close()
+    peer.close()
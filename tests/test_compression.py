@@ -0,0 +1,79 @@
+import zlib
+from Quic import QUICProtocol
+from QuicCompression import MAX_DECODED_CHUNK, QuicStreamCompressor, QuicStreamDecompressor
+
+
+def test_round_trip():
+    data = b"The quick brown fox jumps over the lazy dog. " * 5000
+    compressor = QuicStreamCompressor()
+    wire = [compressor.compress(data[i:i + 4096], i + 4096 >= len(data)) for i in range(0, len(data), 4096)]
+    assert sum(map(len, wire)) < len(data)
+
+    decompressor = QuicStreamDecompressor()
+    decompressor.feed(wire)
+    decoded = b""
+    while decompressor.has_pending():
+        decoded += decompressor.decode()
+    assert decoded == data
+    assert decompressor.wire_bytes == sum(map(len, wire))
+
+
+def test_output_is_bounded_on_a_zlib_bomb():
+    bomb = zlib.compress(bytes(50 * 1024 * 1024), 9)  # About 50 KB that decode to 50 MB
+    decompressor = QuicStreamDecompressor()
+    decompressor.feed([bomb])
+    total = 0
+    while decompressor.has_pending():
+        chunk = decompressor.decode()
+        assert len(chunk) <= MAX_DECODED_CHUNK
+        total += len(chunk)
+    assert total == 50 * 1024 * 1024
+
+
+def test_decode_honours_max_length():
+    decompressor = QuicStreamDecompressor()
+    decompressor.feed([zlib.compress(bytes(10000))])
+    assert len(decompressor.decode(1000)) == 1000
+    assert decompressor.has_pending()
+
+
+def test_bytes_after_the_zlib_stream_pass_through():
+    # A sender that turned compression off finishes the zlib stream and sends the rest as is
+    wire = zlib.compress(b"compressed part ") + b"stored part"
+    decompressor = QuicStreamDecompressor()
+    decompressor.feed([wire[:7], wire[7:]])
+    decoded = b""
+    while decompressor.has_pending():
+        decoded += decompressor.decode()
+    assert decoded == b"compressed part stored part"
+    assert decompressor.wire_bytes == len(wire)
+
+
+def test_consumed_decoded_bytes_map_back_to_wire_bytes():
+    wire = zlib.compress(bytes(3 * MAX_DECODED_CHUNK))
+    decompressor = QuicStreamDecompressor()
+    decompressor.feed([wire])
+    chunks = []
+    while decompressor.has_pending():
+        chunk = decompressor.decode_chunk()
+        if chunk:
+            chunks.append(chunk)
+    credited = sum(decompressor.wire_consumed(len(chunk)) for chunk in chunks)
+    assert credited == len(wire)
+
+
+def test_compressed_send_without_an_rtt_sample():
+    # A coarse monotonic clock can take the first RTT sample as 0
+    protocol = QUICProtocol(is_client=False)
+    protocol.peer_codecs = ('store', 'zlib')
+    assert protocol.set_stream_compression(1)
+    protocol.recovery.update_rtt(0.0, 0.0)
+    protocol.congestion.on_packet_sent(1200)
+    data = b"abc" * 20000
+    decompressor = QuicStreamDecompressor()
+    decompressor.feed([protocol.encode_stream_data(1, data, True)])
+    decoded = b""
+    while decompressor.has_pending():
+        decoded += decompressor.decode()
+    assert decoded == data
+    protocol.socket.close()
@@ -0,0 +1,112 @@
+import pytest
+from QuicCongestion import (QuicCongestionController, NewRenoCongestionController, CubicCongestionController,
+                            TokenBucketPacer, K_CUBIC_BETA)
+from QuicRecovery import SentPacket
+
+SIZE = 1200
+
+
+def send(controller, count: int, now: float) -> list:
+    packets = [SentPacket(number, now, SIZE) for number in range(count)]
+    for _ in packets:
+        controller.on_packet_sent(SIZE)
+    return packets
+
+
+def test_the_base_class_is_abstract():
+    with pytest.raises(TypeError):
+        QuicCongestionController()
+
+
+@pytest.mark.parametrize('controller_class', [NewRenoCongestionController, CubicCongestionController])
+def test_slow_start_grows_by_the_acknowledged_bytes(controller_class):
+    controller = controller_class(SIZE)
+    initial = controller.congestion_window
+    controller.on_packets_acked(send(controller, 10, 0.0), 0.1)
+    assert controller.congestion_window == initial + 10 * SIZE
+    assert controller.bytes_in_flight == 0
+
+
+def test_newreno_halves_on_loss_and_grows_a_datagram_per_window():
+    controller = NewRenoCongestionController(SIZE)
+    packets = send(controller, 10, 0.0)
+    window = controller.congestion_window
+    controller.on_packets_lost(packets[:1], 0.1)
+    assert controller.congestion_window == window / 2
+    assert controller.ssthresh == window / 2
+    assert not controller.in_slow_start()
+
+    # Packets sent before the loss don't grow the window, they belong to the recovery period
+    controller.on_packets_acked(packets[1:], 0.2)
+    assert controller.congestion_window == window / 2
+
+    # After it, acknowledging a whole window adds about one datagram
+    window = controller.congestion_window
+    controller.on_packets_acked(send(controller, int(window // SIZE), 0.3), 0.4)
+    assert window + 0.9 * SIZE < controller.congestion_window <= window + SIZE
+
+
+@pytest.mark.parametrize('controller_class', [NewRenoCongestionController, CubicCongestionController])
+def test_one_reduction_per_recovery_period(controller_class):
+    controller = controller_class(SIZE)
+    packets = send(controller, 10, 0.0)
+    controller.on_packets_lost(packets[:1], 0.1)
+    reduced = controller.congestion_window
+
+    # More losses of packets sent before the recovery started don't reduce the window again
+    controller.on_packets_lost(packets[1:3], 0.15)
+    assert controller.congestion_window == reduced
+
+    # A loss of a packet sent after it starts a new period
+    later = [SentPacket(20, 0.2, SIZE)]
+    controller.on_packet_sent(SIZE)
+    controller.on_packets_lost(later, 0.3)
+    assert controller.congestion_window < reduced
+
+
+def test_the_window_never_goes_below_the_minimum():
+    controller = NewRenoCongestionController(SIZE)
+    for step in range(10):
+        now = float(step)
+        controller.on_packets_lost(send(controller, 1, now), now + 0.5)
+    assert controller.congestion_window == controller.minimum_window
+
+
+def test_cubic_reduces_by_beta_and_grows_back_past_w_max():
+    controller = CubicCongestionController(SIZE)
+    controller.congestion_window = 100 * SIZE
+    controller.ssthresh = 100 * SIZE
+    controller.on_packets_lost(send(controller, 1, 0.0), 1.0)
+    assert controller.congestion_window == pytest.approx(100 * SIZE * K_CUBIC_BETA)
+    assert controller.w_max == 100 * SIZE
+
+    # Acknowledge a window every 100 ms: the window approaches w_max around K seconds, then goes past it
+    now = 1.0
+    windows = []
+    while now < 1.0 + 2 * controller.k:
+        now += 0.1
+        controller.on_packets_acked(send(controller, int(controller.congestion_window // SIZE), now), now)
+        windows.append(controller.congestion_window)
+    assert windows == sorted(windows)
+    assert windows[-1] > 100 * SIZE
+
+
+def test_cubic_fast_convergence():
+    controller = CubicCongestionController(SIZE)
+    controller.congestion_window = 100 * SIZE
+    controller.on_packets_lost(send(controller, 1, 0.0), 1.0)
+    window = controller.congestion_window
+
+    # A loss before the window got back to w_max lowers w_max below the window it had
+    controller.on_packets_lost([SentPacket(1, 1.5, SIZE)], 2.0)
+    assert controller.w_max == pytest.approx(window * (1 + K_CUBIC_BETA) / 2)
+
+
+def test_pacer_spreads_the_window_over_the_rtt():
+    pacer = TokenBucketPacer(burst=2 * SIZE)
+    pacer.update_rate(10 * SIZE, 0.1)  # 125 KB/s with the pacing gain
+    assert pacer.time_until_send(SIZE, 0.0) == 0.0
+    pacer.on_packet_sent(SIZE, 0.0)
+    pacer.on_packet_sent(SIZE, 0.0)
+    assert pacer.time_until_send(SIZE, 0.0) == pytest.approx(SIZE / pacer.rate)
+    assert pacer.time_until_send(SIZE, SIZE / pacer.rate) == pytest.approx(0.0)
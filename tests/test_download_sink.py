@@ -0,0 +1,72 @@
+import os
+import pytest
+from QuicDownloadSink import QuicDownloadSink
+
+BLOCK = 1024
+DATA = os.urandom(10 * BLOCK + 300)  # A short last block
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / 'download')
+
+
+def test_out_of_order_writes_land_at_their_offsets(path):
+    sink = QuicDownloadSink(path, block_size=BLOCK)
+    pieces = [(start, DATA[start:start + 700]) for start in range(0, len(DATA), 700)]
+    for offset, data in reversed(pieces):
+        assert sink.write(offset, data) == len(data)
+    assert sink.write(700, DATA[700:1400]) == 0  # A retransmission
+    assert sink.write(600, DATA[600:1500]) == 0
+    sink.set_final_size(len(DATA))
+    assert sink.is_complete()
+    sink.finish()
+    sink.close()
+
+    with open(path, 'rb') as file:
+        assert file.read() == DATA
+    assert not os.path.exists(path + '.blocks')
+
+
+def test_missing_ranges(path):
+    sink = QuicDownloadSink(path, block_size=BLOCK)
+    sink.write(1000, DATA[1000:2000])
+    sink.write(3000, DATA[3000:3500])
+    assert sink.missing_ranges() == [(0, 1000), (2000, 3000), (3500, None)]
+    sink.set_final_size(len(DATA))
+    assert sink.missing_ranges() == [(0, 1000), (2000, 3000), (3500, len(DATA))]
+    sink.close()
+
+
+def test_an_interrupted_download_resumes_from_the_bitmap(path):
+    sink = QuicDownloadSink(path, block_size=BLOCK)
+    sink.write(0, DATA[:2 * BLOCK + 100])  # Blocks 0 and 1, and part of block 2
+    sink.write(5 * BLOCK, DATA[5 * BLOCK:])  # Blocks 5 up to the end
+    sink.set_final_size(len(DATA))
+    sink.close()
+    assert os.path.exists(path + '.blocks')
+
+    # Only whole blocks are recorded, the part of block 2 is written again
+    sink = QuicDownloadSink(path, block_size=BLOCK)
+    assert sink.final_size == len(DATA)
+    assert sink.missing_ranges() == [(2 * BLOCK, 5 * BLOCK)]
+    assert sink.bytes_written == len(DATA) - 3 * BLOCK
+
+    # The server sends the whole stream again, what is on disk already is not written
+    for offset in range(0, len(DATA), 500):
+        sink.write(offset, DATA[offset:offset + 500])
+    assert sink.writes == 7  # The pieces at 2000 up to 5000, which overlap the missing blocks
+    assert sink.is_complete()
+    sink.finish()
+    sink.close()
+    with open(path, 'rb') as file:
+        assert file.read() == DATA
+
+
+def test_a_bitmap_of_another_block_size_is_ignored(path):
+    sink = QuicDownloadSink(path, block_size=BLOCK)
+    sink.write(0, DATA[:4 * BLOCK])
+    sink.close()
+    sink = QuicDownloadSink(path, block_size=2 * BLOCK)
+    assert sink.missing_ranges() == [(0, None)]
+    sink.close()
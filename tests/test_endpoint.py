@@ -0,0 +1,153 @@
+import asyncio
+import socket
+import time
+from Events import ConnectionClosed
+from Quic import QUICProtocol
+from QuicEndpoint import QUICServerEndpoint
+from QuicPacket import QUICPacket
+
+
+class Client:
+    """A bare UDP socket that speaks just enough of the handshake to open a connection on the endpoint."""
+
+    def __init__(self, server_address):
+        self.server_address = server_address
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.socket.bind(('127.0.0.1', 0))
+        self.socket.setblocking(False)
+        self.address = self.socket.getsockname()
+
+    def send(self, flags: int, connection_id: int, packet_number: int):
+        self.socket.sendto(QUICPacket(flags, connection_id, packet_number, []).serialize(), self.server_address)
+
+    async def receive(self) -> QUICPacket:
+        data = await asyncio.wait_for(asyncio.get_running_loop().sock_recv(self.socket, 2048), 1.0)
+        return QUICPacket.deserialize(data)
+
+    async def start(self) -> QUICPacket:
+        self.send(QUICProtocol.START_CONNECTION_FLAG, 0, 0)
+        return await self.receive()
+
+    async def connect(self) -> int:
+        start = await self.start()
+        self.send(QUICProtocol.ACK_FLAG, start.connection_id, start.packet_number)
+        return start.connection_id
+
+
+async def open_endpoint(handler, **kwargs) -> QUICServerEndpoint:
+    endpoint = QUICServerEndpoint(handler, **kwargs)
+    await endpoint.listen('127.0.0.1', 0)
+    return endpoint
+
+
+def server_address(endpoint: QUICServerEndpoint):
+    return endpoint.transport.get_extra_info('sockname')
+
+
+async def wait_until(condition):
+    for _ in range(100):
+        if condition():
+            return
+        await asyncio.sleep(0.01)
+    raise AssertionError("Condition not reached")
+
+
+def test_packets_are_routed_by_connection_id():
+    async def run():
+        events = {}  # Client address -> first event of its connection
+
+        async def handler(connection):
+            events[connection.address] = await connection.recv()
+
+        endpoint = await open_endpoint(handler)
+        first, second = Client(server_address(endpoint)), Client(server_address(endpoint))
+        first_id = await first.connect()
+        second_id = await second.connect()
+        await wait_until(lambda: len(endpoint.handler_tasks) == 2)
+        assert first_id != second_id
+
+        # Only the connection the FIN names is closed
+        second.send(QUICProtocol.FIN_FLAG, second_id, 1)
+        assert (await second.receive()).flags & QUICProtocol.FIN_ACK_FLAG
+        await wait_until(lambda: second.address in events)
+        assert isinstance(events[second.address], ConnectionClosed)
+        assert first.address not in events
+
+        # A connection ID the endpoint never handed out is counted and dropped
+        first.send(QUICProtocol.ACK_FLAG, first_id ^ second_id ^ 0x1234, 1)
+        await wait_until(lambda: endpoint.stats['packets_unknown_connection'] == 1)
+        assert first.address not in events
+
+        await endpoint.close()
+        first.socket.close()
+        second.socket.close()
+
+    asyncio.run(run())
+
+
+def test_a_repeated_start_gets_the_same_connection_id():
+    async def run():
+        endpoint = await open_endpoint(None)
+        client = Client(server_address(endpoint))
+
+        first = await client.start()
+        again = await client.start()
+        assert again.connection_id == first.connection_id
+        assert again.packet_number > first.packet_number
+        assert endpoint.stats['connections_accepted'] == 1 and len(endpoint.connections) == 1
+
+        await endpoint.close()
+        client.socket.close()
+
+    asyncio.run(run())
+
+
+def test_an_idle_connection_expires_and_wakes_its_handler():
+    async def run():
+        events = []
+
+        async def handler(connection):
+            events.append(await connection.recv())
+
+        endpoint = await open_endpoint(handler)
+        client = Client(server_address(endpoint))
+        connection_id = await client.connect()
+        await wait_until(lambda: endpoint.handler_tasks)
+
+        connection = endpoint.connections[connection_id]
+        connection.last_activity = time.monotonic() - 2 * endpoint.idle_timeout
+        endpoint.expire_idle_connections()
+
+        await asyncio.wait_for(asyncio.gather(*endpoint.handler_tasks), 1.0)
+        assert len(events) == 1 and isinstance(events[0], ConnectionClosed)
+        assert not endpoint.connections and endpoint.stats['connections_expired'] == 1
+
+        await endpoint.close()
+        client.socket.close()
+
+    asyncio.run(run())
+
+
+def test_close_cancels_the_handlers_before_closing_the_socket():
+    async def run():
+        transport_closing = []
+
+        async def handler(connection):
+            try:
+                await asyncio.Event().wait()
+            finally:
+                transport_closing.append(connection.transport.is_closing())
+
+        endpoint = await open_endpoint(handler)
+        client = Client(server_address(endpoint))
+        await client.connect()
+        await wait_until(lambda: endpoint.handler_tasks)
+        task, = endpoint.handler_tasks
+
+        await endpoint.close()
+        assert task.cancelled()
+        assert transport_closing == [False]
+        assert endpoint.transport.is_closing() and not endpoint.connections
+        client.socket.close()
+
+    asyncio.run(run())
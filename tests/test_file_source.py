@@ -0,0 +1,94 @@
+import pytest
+from QuicFileSource import QuicFileSource
+
+CONTENT = bytes(range(256)) * 40  # 10240 bytes
+
+
+@pytest.fixture
+def source(tmp_path):
+    path = tmp_path / 'toSend.txt'
+    path.write_bytes(CONTENT)
+    source = QuicFileSource(str(path))
+    yield source
+    source.close()
+
+
+def test_cursors_read_the_mapped_file_in_chunks(source):
+    assert len(source) == len(CONTENT)
+    cursor = source.cursor()
+    chunks = []
+    while not cursor.at_end():
+        chunk = cursor.read(4096)
+        assert isinstance(chunk, memoryview)
+        chunks.append(bytes(chunk))
+        chunk.release()
+
+    assert [len(chunk) for chunk in chunks] == [4096, 4096, 2048]
+    assert b''.join(chunks) == CONTENT
+
+
+def test_reads_are_clamped_at_the_end_of_the_file(source):
+    cursor = source.cursor(len(CONTENT) - 100)
+    assert cursor.remaining() == 100
+
+    with cursor.read(1000) as chunk:
+        assert bytes(chunk) == CONTENT[-100:]
+    assert cursor.offset == len(CONTENT) and cursor.at_end() and cursor.remaining() == 0
+    with cursor.read(1000) as chunk:
+        assert len(chunk) == 0
+    assert cursor.offset == len(CONTENT)
+
+
+def test_a_cursor_past_the_end_reads_nothing(source):
+    cursor = source.cursor(len(CONTENT) + 10)
+    assert cursor.at_end()
+    with cursor.read(10) as chunk:
+        assert len(chunk) == 0
+
+
+def test_cursors_of_one_source_are_independent(source):
+    first, second = source.cursor(), source.cursor(1000)
+    with first.read(10) as chunk:
+        assert bytes(chunk) == CONTENT[:10]
+    with second.read(10) as chunk:
+        assert bytes(chunk) == CONTENT[1000:1010]
+    assert first.offset == 10 and second.offset == 1010
+
+
+def test_an_empty_file_is_at_its_end(tmp_path):
+    path = tmp_path / 'empty.txt'
+    path.write_bytes(b"")
+    source = QuicFileSource(str(path))
+    assert len(source) == 0 and source.cursor().at_end()
+    source.close()
+
+
+def test_bytes_in_memory_are_served_without_a_file():
+    source = QuicFileSource.from_bytes(bytearray(CONTENT))
+    with source.cursor(10).read(20) as chunk:
+        assert bytes(chunk) == CONTENT[10:30]
+    source.close()
+
+
+def test_a_replaced_file_is_mapped_again_for_new_cursors(tmp_path):
+    path = tmp_path / 'toSend.txt'
+    path.write_bytes(CONTENT)
+    source = QuicFileSource(str(path))
+    old_cursor = source.cursor()
+    view = source.view
+    assert source.cursor().view is view  # Unchanged, the mapping is reused
+
+    replacement = tmp_path / 'toSend.txt.new'
+    replacement.write_bytes(b"new content")
+    replacement.replace(path)
+
+    new_cursor = source.cursor()
+    assert len(source) == len(b"new content")
+    with new_cursor.read(100) as chunk:
+        assert bytes(chunk) == b"new content"
+
+    # A stream that was open already keeps reading the file it started with
+    assert old_cursor.remaining() == len(CONTENT)
+    with old_cursor.read(len(CONTENT) + 1) as chunk:
+        assert bytes(chunk) == CONTENT
+    source.close()
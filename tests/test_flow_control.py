@@ -0,0 +1,82 @@
+from Quic import QUICProtocol
+from QuicFlowControl import QuicReceiveWindow, QuicSendCredit
+from QuicPacket import QUICPacket, MaxStreamDataFrame
+from QuicStream import QUICStream
+
+
+def test_max_data_is_raised_once_half_the_window_is_consumed():
+    window = QuicReceiveWindow(1000, 8000)
+    window.on_data_received(1000)
+    assert not window.allows(1001)
+    assert not window.on_data_consumed(499, now=0.0, rtt=0.1)
+    assert window.max_data == 1000
+    assert window.on_data_consumed(1, now=0.0, rtt=0.1)
+    assert window.max_data == 1500
+    assert window.allows(1500) and not window.allows(1501)
+
+
+def test_the_window_doubles_when_it_is_consumed_within_two_rtts():
+    window = QuicReceiveWindow(1000, 3000)
+    window.on_data_consumed(500, now=0.0, rtt=0.1)
+    assert window.window == 1000  # The first update has nothing to compare with
+    window.on_data_consumed(500, now=0.1, rtt=0.1)
+    assert window.window == 2000
+    assert window.max_data == 3000
+    window.on_data_consumed(1000, now=0.2, rtt=0.1)
+    assert window.window == 3000  # Capped at max_window
+    window.on_data_consumed(1500, now=10.0, rtt=0.1)
+    assert window.window == 3000  # A slow reader doesn't grow it
+
+
+def test_send_credit_blocks_at_the_limit():
+    credit = QuicSendCredit(1000)
+    credit.on_data_sent(1000)
+    assert credit.available() == 0
+    assert not credit.on_max_data(900)  # A reordered update
+    assert credit.available() == 0
+    assert credit.on_max_data(1500)
+    assert credit.available() == 500
+
+
+def test_send_credit_is_the_smaller_of_the_stream_and_connection_credit(connection):
+    connection.streams[1] = QUICStream(1)
+    connection.streams[1].sender.credit = QuicSendCredit(100)
+    assert connection.get_send_credit(1) == 100
+    connection.send_credit = QuicSendCredit(40)
+    assert connection.get_send_credit(1) == 40
+    connection.send_credit.on_data_sent(40)
+    assert connection.get_send_credit(1) == 0
+
+
+def test_flow_control_updates_are_split_across_packets(connection):
+    for stream_id in range(1, 201):
+        connection.streams[stream_id] = QUICStream(stream_id)
+        connection.max_stream_data_pending.add(stream_id)
+    connection.max_data_pending = True
+
+    frames = connection.control_frames(connection.packetizer.capacity)
+    assert sum(frame.encoded_size() for frame in frames) <= connection.packetizer.capacity
+    assert connection.max_stream_data_pending  # Carried over to the next packet
+    assert not connection.max_data_pending
+
+    connection.max_stream_data_pending.update(range(1, 201))
+    connection.send_flow_control_updates()
+    assert not connection.max_stream_data_pending
+    packets = list(connection.packets_to_ack.values())
+    assert len(packets) > 1
+    announced = [frame.stream_id for packet in packets for frame in packet.frames
+                 if isinstance(frame, MaxStreamDataFrame)]
+    assert sorted(announced) == list(range(1, 201))
+    for packet in packets:
+        assert packet.encoded_size() <= connection.packetizer.max_datagram_size
+
+
+def test_control_frames_leave_room_for_the_ack(connection):
+    connection.acks.on_packet_received(1, 0.0)
+    for stream_id in range(1, 201):
+        connection.streams[stream_id] = QUICStream(stream_id)
+        connection.max_stream_data_pending.add(stream_id)
+    connection.packetizer.push(connection.streams[1].sender.send_data(b"x" * 5000))
+    frames = connection.packetizer.next_frames(connection.control_frames(connection.packetizer.capacity))
+    packet = QUICPacket(QUICProtocol.STREAM_DATA_FLAG, 2 ** 29, 2 ** 32 - 1, frames)
+    assert len(packet.serialize()) <= connection.packetizer.max_datagram_size
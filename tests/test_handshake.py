@@ -0,0 +1,71 @@
+import asyncio
+import socket
+from Quic import QUICProtocol
+from QuicAsync import AsyncQUICProtocol
+from QuicPacket import QUICPacket, StreamFrame
+
+GARBAGE = b"\x08\xff"  # A START flag byte cut off in the middle of the header
+
+
+def test_the_client_drops_garbage_while_waiting_for_the_start():
+    peer = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    peer.bind(('127.0.0.1', 0))
+    client = QUICProtocol(is_client=True)
+    client.socket.bind(('127.0.0.1', 0))
+    client.address = peer.getsockname()
+
+    peer.sendto(GARBAGE, client.socket.getsockname())
+    peer.sendto(QUICPacket(QUICProtocol.START_CONNECTION_FLAG, 7, 1, []).serialize(), client.socket.getsockname())
+
+    start = client.wait_for_start_response(1.0)
+    assert start is not None and start.connection_id == 7
+    client.socket.close()
+    peer.close()
+
+
+def test_the_server_drops_garbage_while_waiting_for_a_client():
+    server = QUICProtocol(is_client=False)
+    server.socket.bind(('127.0.0.1', 0))
+    peer = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    # Garbage first, then a packet that is not a START, which ends the wait
+    peer.sendto(GARBAGE, server.socket.getsockname())
+    peer.sendto(QUICPacket(QUICProtocol.ACK_FLAG, 0, 1, []).serialize(), server.socket.getsockname())
+
+    server.accept_connection()
+    assert server.address is None
+    server.socket.close()
+    peer.close()
+
+
+def test_a_resent_early_request_does_not_complete_the_handshake():
+    async def run():
+        server = AsyncQUICProtocol(is_client=False)
+        await server.bind('127.0.0.1', 0)
+        server_address = server.io.socket.getsockname()
+        loop = asyncio.get_running_loop()
+        client = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        client.bind(('127.0.0.1', 0))
+        client.setblocking(False)
+
+        request = StreamFrame(0, 0, 4, (1).to_bytes(4, 'big'), StreamFrame.FIN_DATA_FRAME)
+        early_start = QUICPacket(QUICProtocol.START_CONNECTION_FLAG | QUICProtocol.STREAM_REQUEST_FLAG, 0, 0,
+                                 [request]).serialize()
+        accept = asyncio.create_task(server.accept_connection())
+        await asyncio.sleep(0)
+        client.sendto(early_start, server_address)
+        start = QUICPacket.deserialize(await loop.sock_recv(client, 2048))
+        assert start.connection_id == server.connection_id
+
+        # The START was lost on its way to the client, which sends its first datagram again
+        client.sendto(early_start, server_address)
+        await asyncio.sleep(0.05)
+        assert not accept.done()
+
+        client.sendto(QUICPacket(QUICProtocol.ACK_FLAG, start.connection_id, start.packet_number, []).serialize(),
+                      server_address)
+        await asyncio.wait_for(accept, 1.0)
+        server.release()
+        client.close()
+
+    asyncio.run(run())
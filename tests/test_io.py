@@ -0,0 +1,139 @@
+import errno
+import os
+import pytest
+from QuicIO import *
+
+CLIENT = ('127.0.0.1', 4433)
+OTHER_CLIENT = ('127.0.0.1', 4434)
+
+
+class FakeSocket:
+    """Records what QuicOffloadIO sends and hands out prepared receives."""
+
+    def __init__(self, sendmsg_error: int = None):
+        self.sendmsg_error = sendmsg_error  # errno every sendmsg fails with, None to succeed
+        self.segmented = []  # (segment size, segments, address) of every GSO send
+        self.sent = []  # (datagram, address) of every plain send
+        self.received = []  # (data, ancillary, flags, address) returned by recvmsg in order
+
+    def setsockopt(self, level, option, value):
+        pass
+
+    def sendmsg(self, buffers, ancillary, flags, address):
+        if self.sendmsg_error is not None:
+            raise OSError(self.sendmsg_error, os.strerror(self.sendmsg_error))
+        (level, kind, value), = ancillary
+        assert (level, kind) == (SOL_UDP, UDP_SEGMENT)
+        segment_size = GSO_SIZE.unpack(value)[0]
+        data = b''.join(buffers)
+        self.segmented.append((segment_size, [data[start:start + segment_size]
+                                              for start in range(0, len(data), segment_size)], address))
+
+    def sendto(self, datagram, address):
+        self.sent.append((datagram, address))
+
+    def recvmsg(self, buffer_size, ancillary_size):
+        return self.received.pop(0)
+
+
+def flush(io, sizes, address=CLIENT):
+    for index, size in enumerate(sizes):
+        io.queue(bytes([index]) * size, address)
+    io.flush()
+
+
+def test_a_shorter_datagram_ends_the_run():
+    sock = FakeSocket()
+    io = QuicOffloadIO(sock, max_batch=100)
+    flush(io, [1200, 1200, 800, 1200])
+
+    (segment_size, segments, address), = sock.segmented
+    assert segment_size == 1200 and [len(segment) for segment in segments] == [1200, 1200, 800]
+    assert [len(datagram) for datagram, _ in sock.sent] == [1200]
+
+
+def test_a_change_of_address_splits_the_run():
+    sock = FakeSocket()
+    io = QuicOffloadIO(sock, max_batch=100)
+    for address in (CLIENT, CLIENT, OTHER_CLIENT, OTHER_CLIENT):
+        io.queue(bytes(1200), address)
+    io.flush()
+
+    assert [(len(segments), address) for _, segments, address in sock.segmented] == [(2, CLIENT), (2, OTHER_CLIENT)]
+    assert not sock.sent
+
+
+def test_runs_stop_at_the_segment_limit():
+    sock = FakeSocket()
+    io = QuicOffloadIO(sock, max_batch=1000)
+    flush(io, [1000] * (MAX_GSO_SEGMENTS + 6))
+
+    assert [len(segments) for _, segments, _ in sock.segmented] == [MAX_GSO_SEGMENTS, 6]
+
+
+def test_runs_stop_at_the_byte_limit():
+    sock = FakeSocket()
+    io = QuicOffloadIO(sock, max_batch=1000)
+    flush(io, [1200] * 60)
+
+    runs = [len(segments) for _, segments, _ in sock.segmented]
+    assert runs == [MAX_GSO_BYTES // 1200, 60 - MAX_GSO_BYTES // 1200]
+    assert all(sum(map(len, segments)) <= MAX_GSO_BYTES for _, segments, _ in sock.segmented)
+
+
+@pytest.mark.parametrize('error', [errno.EINVAL, errno.EOPNOTSUPP])
+def test_a_rejected_segmented_send_falls_back_to_plain_sends(error):
+    sock = FakeSocket(sendmsg_error=error)
+    io = QuicOffloadIO(sock, max_batch=100, on_send_error=lambda e: pytest.fail(f"Unexpected send error {e}"))
+    flush(io, [1200, 1200, 1200])
+
+    assert not io.gso
+    assert [len(datagram) for datagram, _ in sock.sent] == [1200, 1200, 1200]
+
+    # Later runs go out one datagram at a time without trying GSO again
+    sock.sendmsg_error = None
+    flush(io, [1200, 1200])
+    assert not sock.segmented and len(sock.sent) == 5
+
+
+def test_other_send_errors_drop_the_run_and_keep_gso():
+    sock = FakeSocket(sendmsg_error=errno.ENOBUFS)
+    errors = []
+    io = QuicOffloadIO(sock, max_batch=100, on_send_error=errors.append)
+    for address in (CLIENT, CLIENT, OTHER_CLIENT):
+        io.queue(bytes(1200), address)
+    io.flush()
+
+    assert [e.errno for e in errors] == [errno.ENOBUFS]
+    assert io.gso
+    assert sock.sent == [(bytes(1200), OTHER_CLIENT)]  # The run after the failed one still goes out
+
+
+def test_other_send_errors_raise_without_a_handler():
+    io = QuicOffloadIO(FakeSocket(sendmsg_error=errno.ENOBUFS), max_batch=100)
+    with pytest.raises(OSError):
+        flush(io, [1200, 1200])
+
+
+def gro_receive(data, segment_size):
+    return data, [(SOL_UDP, UDP_GRO, GRO_SIZE.pack(segment_size))], 0, CLIENT
+
+
+def test_a_coalesced_receive_is_split_into_datagrams():
+    sock = FakeSocket()
+    io = QuicOffloadIO(sock)
+    data = bytes(range(250)) * 12
+    sock.received.append(gro_receive(data, 1200))
+
+    datagrams = io.recv_one()
+    assert [bytes(datagram) for datagram, _ in datagrams] == [data[:1200], data[1200:2400], data[2400:]]
+    assert all(address == CLIENT for _, address in datagrams)
+
+
+@pytest.mark.parametrize('segment_size', [1200, 1500, 0])
+def test_a_receive_of_one_segment_is_returned_whole(segment_size):
+    sock = FakeSocket()
+    io = QuicOffloadIO(sock)
+    sock.received.append(gro_receive(bytes(1200), segment_size))
+
+    assert io.recv_one() == [(bytes(1200), CLIENT)]
@@ -0,0 +1,96 @@
+import pytest
+from Quic import QUICProtocol
+from QuicPacket import *
+
+
+VARINT_BOUNDARIES = [
+    (0, 1), (63, 1),
+    (64, 2), (16383, 2),
+    (16384, 4), (2 ** 30 - 1, 4),
+    (2 ** 30, 8), (2 ** 62 - 1, 8),
+]
+
+
+@pytest.mark.parametrize('value, size', VARINT_BOUNDARIES)
+def test_varint_round_trip(value, size):
+    buffer = bytearray(9)
+    assert varint_size(value) == size
+    assert pack_varint(buffer, 1, value) == 1 + size
+    assert unpack_varint(buffer, 1) == (value, 1 + size)
+
+
+def test_varint_too_large():
+    with pytest.raises(ValueError):
+        varint_size(2 ** 62)
+    with pytest.raises(ValueError):
+        pack_varint(bytearray(9), 0, 2 ** 62)
+
+
+@pytest.mark.parametrize('largest_acked, packet_number, length', [
+    (-1, 0, 4),  # Nothing acknowledged yet
+    (0, 1, 1),
+    (0, 63, 1),
+    (0, 127, 1),
+    (0, 128, 2),
+    (1000, 1000 + 2 ** 15 - 1, 2),
+    (1000, 1000 + 2 ** 15, 3),
+    (0, 2 ** 31, 4),  # Further ahead than 4 bytes can tell, capped
+])
+def test_packet_number_length(largest_acked, packet_number, length):
+    assert packet_number_length(packet_number, largest_acked) == length
+
+
+@pytest.mark.parametrize('largest_received, packet_number', [
+    (0, 1),
+    (254, 255),
+    (255, 256),  # First packet past a 1 byte wrap
+    (250, 260),
+    (0xffff, 0x10000),
+    (0x12345678, 0x12345680),
+    (2 ** 32 - 2, 2 ** 32 + 5),  # Past the wrap of the longest encoding
+])
+def test_packet_number_truncation_round_trip(largest_received, packet_number):
+    length = packet_number_length(packet_number, largest_received)
+    truncated = packet_number & ((1 << (length * 8)) - 1)
+    assert expand_packet_number(truncated, length, largest_received) == packet_number
+
+
+def test_expand_packet_number_rfc_example():
+    # RFC 9000 A.3: 0x9b32 received after 0xa82f30ea is 0xa82f9b32
+    assert expand_packet_number(0x9b32, 2, 0xa82f30ea) == 0xa82f9b32
+
+
+def test_packet_round_trip():
+    frame = StreamFrame(5, 70000, 5, b"hello", StreamFrame.DATA_FRAME | StreamFrame.FIN_DATA_FRAME)
+    packet = QUICPacket(0x02, 1234, 300, [frame])
+    data = packet.serialize(largest_acked=290)
+
+    received = QUICPacket.deserialize(data)
+    assert received.flags == 0x02
+    assert received.connection_id == 1234
+    received.expand_packet_number(299)
+    assert received.packet_number == 300
+    [received_frame] = received.frames
+    assert (received_frame.stream_id, received_frame.offset) == (5, 70000)
+    assert bytes(received_frame.stream_data) == b"hello"
+    assert received_frame.flags & StreamFrame.FIN_DATA_FRAME
+
+
+def test_legacy_packet_of_the_fixed_width_format():
+    # The header and stream frame layout from before varints
+    datagram = (LEGACY_PACKET_HEADER.pack(0b000010, 7, 3) + LEGACY_STREAM_FRAME_HEADER.pack(0b0001, 1, 100, 5) +
+                b"hello")
+    packet = QUICPacket.deserialize(datagram)
+    assert packet.legacy
+    assert (packet.flags, packet.connection_id, packet.packet_number) == (0b000010, 7, 3)
+    frame, = packet.frames
+    assert (frame.stream_id, frame.offset, bytes(frame.stream_data)) == (1, 100, b"hello")
+
+
+def test_a_legacy_start_is_answered_with_a_legacy_fin():
+    start = QUICPacket.deserialize(LEGACY_PACKET_HEADER.pack(QUICProtocol.START_CONNECTION_FLAG, 0, 0))
+    answer = QUICPacket.deserialize(QUICProtocol.legacy_rejection(start))
+    assert answer.legacy and answer.flags == QUICProtocol.FIN_FLAG and not answer.frames
+
+    ack = QUICPacket.deserialize(LEGACY_PACKET_HEADER.pack(QUICProtocol.ACK_FLAG, 5, 1))
+    assert QUICProtocol.legacy_rejection(ack) is None
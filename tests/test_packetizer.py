@@ -0,0 +1,53 @@
+import pytest
+from QuicPacket import QUICPacket, StreamFrame
+from QuicPacketizer import QuicPacketizer
+
+MAX_PACKET_NUMBER = 2 ** 32 - 1  # Encoded with the longest packet number and a large connection ID
+
+
+def drain(packetizer):
+    packets = []
+    while len(packetizer):
+        frames = packetizer.next_frames()
+        assert frames
+        packet = QUICPacket(0x02, 2 ** 29, MAX_PACKET_NUMBER, frames)
+        assert len(packet.serialize()) <= packetizer.max_datagram_size
+        packets.append(frames)
+    return packets
+
+
+@pytest.mark.parametrize('max_datagram_size', [200, 1200, 1452])
+def test_packets_fit_the_datagram_size(max_datagram_size):
+    packetizer = QuicPacketizer(max_datagram_size)
+    for stream_id in range(1, 4):
+        packetizer.push(StreamFrame(stream_id, 2 ** 40, 5000, b"x" * 5000, StreamFrame.DATA_FRAME))
+        packetizer.push(StreamFrame(stream_id, 2 ** 40 + 5000, 10, b"y" * 10, StreamFrame.DATA_FRAME))
+    drain(packetizer)
+
+
+def test_split_frame_keeps_the_offsets_and_the_fin_on_the_last_piece():
+    data = bytes(range(256)) * 20
+    packetizer = QuicPacketizer(1200)
+    packetizer.push(StreamFrame(1, 1000, len(data), data, StreamFrame.DATA_FRAME | StreamFrame.FIN_DATA_FRAME))
+    pieces = [frame for frames in drain(packetizer) for frame in frames]
+    assert len(pieces) > 1
+
+    offset = 1000
+    for piece in pieces:
+        assert piece.offset == offset
+        offset += len(piece.stream_data)
+    assert b"".join(bytes(piece.stream_data) for piece in pieces) == data
+    assert [bool(piece.flags & StreamFrame.FIN_DATA_FRAME) for piece in pieces] == [False] * (len(pieces) - 1) + [True]
+
+
+def test_retransmissions_go_first():
+    packetizer = QuicPacketizer(1200)
+    packetizer.push(StreamFrame(1, 0, 100, b"n" * 100))
+    packetizer.push_front([StreamFrame(3, 0, 100, b"r" * 100)])
+    assert [frame.stream_id for frame in packetizer.next_frames()] == [3, 1]
+    assert len(packetizer) == 0 and packetizer.queued_bytes == 0
+
+
+def test_too_small_datagram_size():
+    with pytest.raises(ValueError):
+        QuicPacketizer(64)
@@ -0,0 +1,112 @@
+import pytest
+from QuicRecovery import QuicLossRecovery, K_GRANULARITY, K_INITIAL_RTT, K_PACKET_THRESHOLD, K_TIME_THRESHOLD
+
+
+def sent(recovery, packet_numbers, now: float = 0.0):
+    for packet_number in packet_numbers:
+        recovery.on_packet_sent(packet_number, 1200, now)
+
+
+def numbers(packets) -> list:
+    return [packet.packet_number for packet in packets]
+
+
+def test_the_first_sample_sets_the_rtt():
+    recovery = QuicLossRecovery()
+    assert recovery.smoothed_rtt == K_INITIAL_RTT
+    sent(recovery, [1])
+    recovery.on_ack_received([(1, 1)], 0.1)
+    assert recovery.smoothed_rtt == pytest.approx(0.1)
+    assert recovery.rttvar == pytest.approx(0.05)
+    assert recovery.min_rtt == pytest.approx(0.1)
+
+
+def test_rtt_smoothing_and_ack_delay():
+    recovery = QuicLossRecovery(max_ack_delay=0.025)
+    recovery.update_rtt(0.1, 0.0)
+    recovery.update_rtt(0.2, 0.02)  # 0.18 once the peer's ACK delay is taken out
+    assert recovery.smoothed_rtt == pytest.approx(7 / 8 * 0.1 + 1 / 8 * 0.18)
+    assert recovery.rttvar == pytest.approx(3 / 4 * 0.05 + 1 / 4 * 0.08)
+
+    # The ACK delay is capped at max_ack_delay, and never taken below min_rtt
+    recovery.update_rtt(0.2, 1.0)
+    assert recovery.latest_rtt == 0.2
+    smoothed = recovery.smoothed_rtt
+    recovery.update_rtt(0.105, 0.025)
+    assert recovery.smoothed_rtt == pytest.approx(7 / 8 * smoothed + 1 / 8 * 0.105)
+    assert recovery.min_rtt == pytest.approx(0.1)
+
+
+def test_only_a_new_largest_packet_takes_an_rtt_sample():
+    recovery = QuicLossRecovery()
+    sent(recovery, [1, 2])
+    recovery.on_ack_received([(2, 2)], 0.1)
+    recovery.on_ack_received([(1, 1)], 5.0)
+    assert recovery.smoothed_rtt == pytest.approx(0.1)
+
+
+def test_packet_threshold_loss():
+    recovery = QuicLossRecovery()
+    sent(recovery, range(1, 6))
+    acked, lost = recovery.on_ack_received([(2, 1 + K_PACKET_THRESHOLD - 1)], 0.01)
+    assert numbers(acked) == [2, 3]
+    assert lost == []  # Only two packets were acknowledged after packet 1
+    acked, lost = recovery.on_ack_received([(1 + K_PACKET_THRESHOLD, 1 + K_PACKET_THRESHOLD)], 0.01)
+    assert numbers(lost) == [1]
+    assert 5 in recovery.sent_packets  # Past the largest acknowledged packet, nothing is known of it yet
+
+
+def test_time_threshold_loss():
+    recovery = QuicLossRecovery()
+    recovery.on_packet_sent(1, 1200, 0.095)
+    recovery.on_packet_sent(2, 1200, 0.1)
+    acked, lost = recovery.on_ack_received([(2, 2)], 0.2)  # An RTT of 0.1
+    assert lost == []
+    loss_time = 0.095 + K_TIME_THRESHOLD * 0.1
+    assert recovery.loss_time == pytest.approx(loss_time)
+    assert recovery.get_timeout() == recovery.loss_time
+
+    # The timer declares packet 1 lost once it is late by the time threshold
+    lost, probes = recovery.on_timeout(loss_time)
+    assert numbers(lost) == [1]
+    assert probes == []
+    assert recovery.loss_time is None
+
+
+def test_the_loss_delay_is_at_least_the_timer_granularity():
+    recovery = QuicLossRecovery()
+    recovery.on_packet_sent(1, 1200, 0.0)
+    recovery.on_packet_sent(2, 1200, 0.0)
+    recovery.on_ack_received([(2, 2)], 0.0)  # An RTT of 0
+    assert recovery.loss_time == pytest.approx(K_GRANULARITY)
+
+
+def test_probe_timeout_backs_off():
+    recovery = QuicLossRecovery(max_ack_delay=0.025)
+    sent(recovery, [1, 2, 3])
+    recovery.on_ack_received([(1, 1)], 0.1)
+    pto = recovery.get_pto()
+    assert pto == pytest.approx(0.1 + 4 * 0.05 + 0.025)
+    assert recovery.get_timeout() == pytest.approx(0.0 + pto)
+
+    # Every probe timeout doubles the next one and sends the oldest packet as a probe
+    lost, probes = recovery.on_timeout(0.1 + pto)
+    assert lost == [] and numbers(probes) == [2]
+    assert recovery.get_pto() == pytest.approx(2 * pto)
+    lost, probes = recovery.on_timeout(0.1 + 3 * pto)
+    assert numbers(probes) == [3]
+    assert recovery.get_pto() == pytest.approx(4 * pto)
+    assert recovery.get_timeout() is None  # Nothing left in flight
+
+    # An ACK resets the backoff
+    sent(recovery, [4], 1.0)
+    recovery.on_ack_received([(4, 4)], 1.1)
+    assert recovery.pto_count == 0
+
+
+def test_wide_ranges_only_look_at_outstanding_packets():
+    recovery = QuicLossRecovery()
+    sent(recovery, [5, 1000])
+    acked, _ = recovery.on_ack_received([(0, 10 ** 9)], 0.1)
+    assert numbers(acked) == [5, 1000]
+    assert recovery.sent_packets == {}
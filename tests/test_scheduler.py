@@ -0,0 +1,88 @@
+import pytest
+from QuicScheduler import QuicStreamScheduler, RoundRobinScheduler, StrictPriorityScheduler, WeightedFairScheduler
+
+
+def drain(scheduler, backlog: dict, frame_size: int = 100, frames: int = None) -> list:
+    """Pack frames of frame_size bytes from the streams of backlog (stream ID -> bytes queued), return the order."""
+    for stream_id in backlog:
+        scheduler.activate(stream_id)
+    order = []
+    while scheduler and (frames is None or len(order) < frames):
+        stream_id = scheduler.next_stream()
+        size = min(frame_size, backlog[stream_id])
+        backlog[stream_id] -= size
+        scheduler.on_data_sent(stream_id, size, backlog[stream_id] > 0)
+        order.append(stream_id)
+    return order
+
+
+def test_the_base_class_is_abstract():
+    with pytest.raises(TypeError):
+        QuicStreamScheduler()
+
+
+def test_round_robin_takes_turns():
+    order = drain(RoundRobinScheduler(), {1: 300, 2: 100, 3: 200})
+    assert order == [1, 2, 3, 1, 3, 1]
+
+
+def test_round_robin_appends_a_stream_that_becomes_active():
+    scheduler = RoundRobinScheduler()
+    scheduler.activate(1)
+    scheduler.activate(2)
+    scheduler.on_data_sent(scheduler.next_stream(), 100, True)
+    scheduler.activate(3)
+    assert scheduler.next_stream() == 2
+    scheduler.on_data_sent(2, 100, True)
+    assert scheduler.next_stream() == 1
+    scheduler.on_data_sent(1, 100, False)
+    assert scheduler.next_stream() == 3
+
+
+@pytest.mark.parametrize('weights', [(1, 1), (1, 3), (2, 5, 9)])
+def test_weighted_fair_shares_follow_the_weights(weights):
+    scheduler = WeightedFairScheduler()
+    for stream_id, weight in enumerate(weights, 1):
+        scheduler.set_priority(stream_id, weight=weight)
+    backlog = {stream_id: 10 ** 9 for stream_id in range(1, len(weights) + 1)}
+    order = drain(scheduler, backlog, frame_size=100, frames=100 * sum(weights))
+
+    # Every stream is backlogged, so each gets its weight's share of the frames, give or take one
+    for stream_id, weight in enumerate(weights, 1):
+        assert abs(order.count(stream_id) - 100 * weight) <= 1
+
+
+def test_weighted_fair_idle_stream_does_not_catch_up():
+    scheduler = WeightedFairScheduler()
+    drain(scheduler, {1: 10 ** 9}, frames=50)
+
+    # Stream 2 starts now, it shares equally from here on instead of owning the link for 50 frames
+    scheduler.activate(2)
+    order = []
+    for _ in range(20):
+        stream_id = scheduler.next_stream()
+        scheduler.on_data_sent(stream_id, 100, True)
+        order.append(stream_id)
+    assert abs(order.count(1) - order.count(2)) <= 1
+
+
+def test_strict_priority_starves_lower_urgencies():
+    scheduler = StrictPriorityScheduler()
+    scheduler.set_priority(1, urgency=5)
+    scheduler.set_priority(2, urgency=0)
+    scheduler.set_priority(3, urgency=0)
+    order = drain(scheduler, {1: 300, 2: 200, 3: 400})
+
+    # The urgent streams take turns, the other one only sends once both are done
+    assert order == [2, 3, 2, 3, 3, 3, 1, 1, 1]
+
+
+def test_strict_priority_preempts_when_an_urgent_stream_becomes_active():
+    scheduler = StrictPriorityScheduler()
+    scheduler.set_priority(2, urgency=0)
+    scheduler.activate(1)
+    scheduler.on_data_sent(scheduler.next_stream(), 100, True)
+    scheduler.activate(2)
+    assert scheduler.next_stream() == 2
+    scheduler.on_data_sent(2, 100, False)
+    assert scheduler.next_stream() == 1
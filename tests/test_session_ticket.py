@@ -0,0 +1,80 @@
+import secrets
+import time
+from QuicEndpoint import QUICServerEndpoint
+from QuicSessionTicket import QuicTicketCache, QuicTicketIssuer, TICKET_BODY
+
+
+def test_a_valid_ticket_is_accepted():
+    issuer = QuicTicketIssuer()
+    assert issuer.accept_early_data(issuer.issue())
+    assert issuer.get_stats()['accepted'] == 1
+
+
+def test_a_tampered_ticket_is_rejected():
+    issuer = QuicTicketIssuer()
+    ticket = bytearray(issuer.issue())
+    ticket[-1] ^= 1  # Flip a bit of the HMAC
+    assert not issuer.accept_early_data(ticket)
+
+    # A ticket whose body was changed, to move its issue time, fails the HMAC check too
+    ticket = bytearray(issuer.issue())
+    ticket[TICKET_BODY.size - 1] ^= 1
+    assert not issuer.accept_early_data(ticket)
+    assert not issuer.accept_early_data(issuer.issue()[:-1])
+    assert issuer.get_stats()['invalid'] == 3
+
+
+def test_a_ticket_of_another_issuer_is_rejected():
+    assert not QuicTicketIssuer().accept_early_data(QuicTicketIssuer().issue())
+
+
+def test_an_expired_ticket_is_rejected():
+    issuer = QuicTicketIssuer(lifetime=60)
+    ticket = issuer.issue()
+    assert not issuer.accept_early_data(ticket, now=time.time() + 61)
+    assert issuer.get_stats()['expired'] == 1
+
+
+def test_a_replayed_ticket_is_refused():
+    issuer = QuicTicketIssuer()
+    ticket = issuer.issue()
+    assert issuer.accept_early_data(ticket)
+    assert not issuer.accept_early_data(ticket)
+    assert issuer.get_stats()['replayed'] == 1
+
+
+def test_the_strike_register_forgets_expired_tickets():
+    issuer = QuicTicketIssuer(lifetime=60)
+    assert issuer.accept_early_data(issuer.issue())
+    assert issuer.get_stats()['tracked'] == 1
+    issuer.forget_expired(time.time() + 61)
+    assert issuer.get_stats()['tracked'] == 0
+
+
+def test_early_data_is_refused_when_the_register_is_full():
+    issuer = QuicTicketIssuer(max_tracked=1)
+    assert issuer.accept_early_data(issuer.issue())
+    assert not issuer.accept_early_data(issuer.issue())
+    assert issuer.get_stats()['register_full'] == 1
+
+
+def test_cached_tickets_are_single_use(tmp_path):
+    path = str(tmp_path / 'tickets.json')
+    cache = QuicTicketCache(path)
+    cache.store(('127.0.0.1', 4433), b'old', 60)
+    cache.store(('127.0.0.1', 4433), b'new', 60)
+
+    # A client started later finds the tickets in the file, newest first
+    cache = QuicTicketCache(path)
+    assert cache.take(('127.0.0.1', 4433)) == b'new'
+    assert QuicTicketCache(path).take(('127.0.0.1', 4433)) == b'old'
+    assert QuicTicketCache(path).take(('127.0.0.1', 4433)) is None
+
+
+def test_an_endpoint_sharing_the_key_accepts_the_ticket():
+    key = secrets.token_bytes(32)
+    issuing = QUICServerEndpoint(None, ticket_issuer=QuicTicketIssuer(key))
+    redeeming = QUICServerEndpoint(None, ticket_issuer=QuicTicketIssuer(key))
+    ticket = issuing.ticket_issuer.issue()
+    assert redeeming.ticket_issuer.accept_early_data(ticket)
+    assert not QUICServerEndpoint(None).ticket_issuer.accept_early_data(issuing.ticket_issuer.issue())
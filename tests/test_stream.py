@@ -0,0 +1,154 @@
+from QuicFlowControl import INITIAL_STREAM_WINDOW
+from QuicPacket import StreamFrame, MaxStreamDataFrame
+from QuicStream import QuicReassemblyBuffer, QuicStreamReceiver
+
+DATA = bytes(range(256)) * 4
+
+
+def frame(start, end, fin=False):
+    flags = StreamFrame.DATA_FRAME | (StreamFrame.FIN_DATA_FRAME if fin else 0)
+    return StreamFrame(1, start, end - start, DATA[start:end], flags)
+
+
+def receive(frames):
+    """Feed frames to a receiver, return the delivered bytes and whether the end of the stream was seen."""
+    receiver = QuicStreamReceiver(1)
+    delivered = b""
+    ended = False
+    for stream_frame in frames:
+        event = receiver.receive_stream_frame(stream_frame)
+        if event is not None:
+            assert not ended
+            delivered += event.data
+            ended = event.end_of_stream
+    return delivered, ended, receiver
+
+
+def test_in_order():
+    delivered, ended, _ = receive([frame(0, 100), frame(100, 200), frame(200, 300, fin=True)])
+    assert delivered == DATA[:300] and ended
+
+
+def test_out_of_order():
+    delivered, ended, receiver = receive([frame(200, 300, fin=True), frame(100, 200), frame(0, 100)])
+    assert delivered == DATA[:300] and ended
+    assert receiver.buffered_bytes == 0
+
+
+def test_nothing_is_delivered_before_the_gap_is_filled():
+    receiver = QuicStreamReceiver(1)
+    assert receiver.receive_stream_frame(frame(100, 200)) is None
+    assert receiver.buffered_bytes == 100
+    event = receiver.receive_stream_frame(frame(0, 100))
+    assert event.data == DATA[:200] and not event.end_of_stream
+
+
+def test_duplicates():
+    delivered, ended, receiver = receive([
+        frame(0, 100), frame(0, 100), frame(200, 300, fin=True), frame(200, 300, fin=True),
+        frame(100, 200), frame(100, 200), frame(0, 300),
+    ])
+    assert delivered == DATA[:300] and ended
+    assert receiver.buffered_bytes == 0
+
+
+def test_overlapping_retransmissions():
+    # Retransmissions split at other offsets than the original frames
+    delivered, ended, receiver = receive([
+        frame(0, 50), frame(120, 180), frame(100, 160), frame(150, 300, fin=True), frame(40, 130),
+    ])
+    assert delivered == DATA[:300] and ended
+    assert receiver.buffered_bytes == 0
+
+
+def test_overlap_trimming_keeps_the_data():
+    buffer = QuicReassemblyBuffer(max_buffered=200)
+    released = buffer.push(10, DATA[10:200])
+    for start in range(20, 160, 10):  # Overlapping chunks more than double the buffer and get trimmed
+        released += buffer.push(start, DATA[start:start + 50])
+    assert buffer.buffered_bytes <= 2 * 200
+    released += buffer.push(0, DATA[:10])
+    assert b"".join(released) == DATA[:200]
+    assert buffer.buffered_bytes == 0
+
+
+def test_data_beyond_the_window_is_dropped():
+    buffer = QuicReassemblyBuffer(max_buffered=100)
+    assert buffer.push(50, DATA[50:150]) == []
+    assert buffer.buffered_bytes == 0
+    assert buffer.push(0, DATA[:100]) == [DATA[:100]]
+
+
+def stream_frame(stream_id, offset, data, fin=False):
+    flags = StreamFrame.DATA_FRAME | (StreamFrame.FIN_DATA_FRAME if fin else 0)
+    return StreamFrame(stream_id, offset, len(data), data, flags)
+
+
+def max_stream_data_sent(connection, stream_id):
+    """The limits of stream_id announced in the packets sent so far."""
+    return [frame.maximum for packet in connection.packets_to_ack.values() for frame in packet.frames
+            if isinstance(frame, MaxStreamDataFrame) and frame.stream_id == stream_id]
+
+
+def test_reader_read(connection):
+    reader = connection.get_reader(1)
+    connection.recv_stream_data(stream_frame(1, 100, DATA[100:300], fin=True))
+    assert len(reader) == 0  # Nothing before the gap is filled
+    connection.recv_stream_data(stream_frame(1, 0, DATA[:100]))
+    assert len(reader) == 300
+    assert reader.read(50) == DATA[:50]
+    assert reader.read(120) == DATA[50:170]
+    assert not reader.at_eof()
+    assert reader.read() == DATA[170:300]
+    assert reader.at_eof()
+    assert reader.read(10) == b""
+
+
+def test_reader_readinto(connection):
+    reader = connection.get_reader(1)
+    connection.recv_stream_data(stream_frame(1, 0, DATA[:100]))
+    connection.recv_stream_data(stream_frame(1, 100, DATA[100:250], fin=True))
+    buffer = bytearray(120)
+    assert reader.readinto(buffer) == 120
+    assert buffer == DATA[:120]
+    assert reader.readinto(buffer) == 120
+    assert buffer == DATA[120:240]
+    assert reader.readinto(buffer) == 10
+    assert buffer[:10] == DATA[240:250]
+    assert reader.readinto(buffer) == 0
+
+
+def test_reader_iteration(connection):
+    reader = connection.get_reader(1)
+    for start in range(0, 1000, 250):
+        connection.recv_stream_data(stream_frame(1, start, DATA[start:start + 250], fin=start == 750))
+    chunks = list(reader)
+    assert b"".join(chunks) == DATA[:1000]
+    assert len(chunks) == 4
+
+
+def test_reader_callback(connection):
+    received = []
+    connection.set_stream_callback(1, lambda chunk, end_of_stream: received.append((bytes(chunk), end_of_stream)))
+    connection.recv_stream_data(stream_frame(1, 0, DATA[:100]))
+    connection.recv_stream_data(stream_frame(1, 100, DATA[100:200], fin=True))
+    assert received == [(DATA[:100], False), (DATA[100:200], True)]
+
+
+def test_stream_credit_follows_what_the_reader_consumed(connection):
+    reader = connection.get_reader(1)
+    data = bytes(INITIAL_STREAM_WINDOW)
+    connection.recv_stream_data(stream_frame(1, 0, data))
+
+    # The whole window arrived but none of it was read, the peer gets no more credit
+    assert max_stream_data_sent(connection, 1) == []
+    assert connection.streams[1].receiver.window.max_data == INITIAL_STREAM_WINDOW
+
+    # Data past the limit is dropped
+    connection.recv_stream_data(stream_frame(1, INITIAL_STREAM_WINDOW, b"x"))
+    assert len(reader) == INITIAL_STREAM_WINDOW
+
+    reader.read(INITIAL_STREAM_WINDOW // 4)
+    assert max_stream_data_sent(connection, 1) == []  # Three quarters of the window is still open
+    reader.read(INITIAL_STREAM_WINDOW // 4)
+    assert max_stream_data_sent(connection, 1) == [INITIAL_STREAM_WINDOW // 2 + INITIAL_STREAM_WINDOW]
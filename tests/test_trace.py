@@ -0,0 +1,89 @@
+import json
+import pytest
+from QuicTrace import *
+
+
+def read_records(path) -> list:
+    with open(path) as file:
+        content = file.read()
+    assert content.startswith(RECORD_SEPARATOR)
+    return [json.loads(record) for record in content.split(RECORD_SEPARATOR)[1:]]
+
+
+def test_histogram_buckets_by_bit_length():
+    histogram = QuicHistogram()
+    for value in (0, 1, 3, 4, 7, 1000):
+        histogram.record(value)
+
+    summary = histogram.to_dict()
+    assert summary['buckets'] == {1: 1, 2: 1, 4: 1, 8: 2, 1024: 1}
+    assert summary['count'] == 6 and summary['min'] == 0 and summary['max'] == 1000
+    assert summary['mean'] == pytest.approx(1015 / 6)
+
+
+def test_histogram_scales_samples_before_bucketing():
+    histogram = QuicHistogram(1e6)
+    histogram.record(0.0015)  # 1500 microseconds
+    histogram.record(0.0000005)  # Below a microsecond
+
+    assert histogram.to_dict()['buckets'] == {1 / 1e6: 1, 2048 / 1e6: 1}
+
+
+def test_an_empty_histogram_has_no_mean():
+    summary = QuicHistogram().to_dict()
+    assert summary['count'] == 0 and summary['mean'] is None and summary['buckets'] == {}
+
+
+def test_flush_starts_the_file_with_the_qlog_header(tmp_path):
+    path = tmp_path / 'trace.sqlog'
+    tracer = QuicTracer('client', str(path), title='test')
+    tracer.packet_dropped('invalid_packet', error='truncated')
+    tracer.flush()
+
+    header, event = read_records(path)
+    assert header['qlog_version'] == QLOG_VERSION and header['qlog_format'] == 'JSON-SEQ'
+    assert header['title'] == 'test'
+    assert header['trace']['vantage_point'] == {'type': 'client'}
+    assert header['trace']['common_fields']['reference_time'] == tracer.reference_time
+    assert event['name'] == 'transport:packet_dropped'
+    assert event['data'] == {'trigger': 'invalid_packet', 'error': 'truncated'}
+    assert event['time'] >= 0
+
+    # A second flush appends events without repeating the header
+    tracer.packet_lost(7, 'time_threshold')
+    tracer.flush()
+    records = read_records(path)
+    assert len(records) == 3 and records[2]['name'] == 'recovery:packet_lost'
+    tracer.close()
+
+
+def test_the_ring_buffer_overwrites_the_oldest_events_and_warns(tmp_path):
+    path = tmp_path / 'trace.sqlog'
+    tracer = QuicTracer('server', str(path), capacity=3)
+    for packet_number in range(5):
+        tracer.packet_lost(packet_number, 'reordering_threshold')
+
+    assert tracer.events_dropped == 2
+    assert [data['header']['packet_number'] for _, _, data in tracer.events] == [2, 3, 4]
+
+    tracer.close()
+    records = read_records(path)
+    assert [record['data']['header']['packet_number'] for record in records[1:4]] == [2, 3, 4]
+    warning, metrics = records[4:]
+    assert warning['name'] == 'loglevel:warning' and '2 events were overwritten' in warning['data']['message']
+    assert metrics['name'] == 'generic:metrics' and metrics['data']['counters'] == {'packets_lost': 5}
+    assert tracer.file is None
+
+
+def test_stopping_the_flusher_finishes_open_tracers(tmp_path):
+    flusher = QuicTraceFlusher(interval=60)  # Only stop() flushes
+    tracer = qlog_tracer_factory(flusher, str(tmp_path))(42)
+    tracer.packet_dropped('unknown_connection_id', connection_id=43)
+
+    flusher.stop()
+    assert not flusher.thread.is_alive() and not flusher.tracers
+    assert tracer.closed and tracer.file is None
+
+    records = read_records(qlog_path(str(tmp_path), 42))
+    assert records[0]['trace']['vantage_point'] == {'type': 'server'}
+    assert [record['name'] for record in records[1:]] == ['transport:packet_dropped', 'generic:metrics']
@@ -0,0 +1,104 @@
+import random
+import struct
+import pytest
+from Quic import QUICProtocol
+from QuicEndpoint import QUICServerEndpoint
+from QuicPacket import MAX_CONNECTION_ID, QUICPacket
+from QuicWorkers import *
+
+HASH_FALLBACK = 0xffffffff
+
+
+def load_program():
+    program, length = reuseport_steering_program()
+    return [struct.unpack_from('HBBI', program, index * 8) for index in range(length)]
+
+
+def run_program(instructions, datagram: bytes) -> int:
+    """Interpret the steering program the way the kernel does and return the socket index it picks."""
+    accumulator, pc = 0, 0
+    while True:
+        assert 0 <= pc < len(instructions), "Jumped out of the program"
+        code, jt, jf, k = instructions[pc]
+        pc += 1
+        if code == BPF_LD_B_ABS:
+            if k >= len(datagram):
+                return 0  # The kernel aborts a load past the end of the datagram
+            accumulator = datagram[k]
+        elif code == BPF_RSH_K:
+            accumulator >>= k
+        elif code == BPF_SUB_K:
+            accumulator = (accumulator - k) & 0xffffffff
+        elif code == BPF_JA:
+            pc += k
+        elif code == BPF_JEQ_K:
+            pc += jt if accumulator == k else jf
+        elif code == BPF_JSET_K:
+            pc += jt if accumulator & k else jf
+        elif code == BPF_RET_A:
+            return accumulator
+        elif code == BPF_RET_K:
+            return k
+        else:
+            pytest.fail(f"Unexpected opcode {code:#x}")
+
+
+def test_the_steering_program_has_16_instructions_and_jumps_within_it():
+    program, length = reuseport_steering_program()
+    assert length == 16 and len(program) == 16 * 8
+
+    instructions = load_program()
+    for pc, (code, jt, jf, k) in enumerate(instructions):
+        if code in (BPF_JEQ_K, BPF_JSET_K):
+            assert pc + 1 + jt < length and pc + 1 + jf < length
+        elif code == BPF_JA:
+            assert pc + 1 + k < length
+    assert instructions[-1] == (BPF_RET_K, 0, 0, HASH_FALLBACK)
+
+
+@pytest.mark.parametrize('worker_index', [0, 1, 7, 254])
+def test_the_steering_program_picks_the_worker_of_the_connection_id(worker_index):
+    instructions = load_program()
+    endpoint = QUICServerEndpoint(None, worker_index=worker_index)
+    for _ in range(100):
+        packet = QUICPacket(QUICProtocol.ACK_FLAG, endpoint.new_connection_id(), 1, [])
+        assert run_program(instructions, bytes(packet.serialize())) == worker_index
+
+    # Connection IDs of every varint length that carries a worker byte
+    for connection_id in (0x100, 0x10000, 1 << 40):
+        packet = QUICPacket(QUICProtocol.ACK_FLAG, connection_id | (worker_index + 1), 1, [])
+        assert run_program(instructions, bytes(packet.serialize())) == worker_index
+
+
+def test_the_steering_program_hashes_starts_and_legacy_packets():
+    instructions = load_program()
+    start = QUICPacket(QUICProtocol.START_CONNECTION_FLAG, 0, 0, [])
+    assert run_program(instructions, bytes(start.serialize())) == HASH_FALLBACK
+    short_id = QUICPacket(QUICProtocol.ACK_FLAG, 5, 0, [])
+    assert run_program(instructions, bytes(short_id.serialize())) == HASH_FALLBACK
+    no_worker = QUICPacket(QUICProtocol.ACK_FLAG, 0x1200, 0, [])
+    assert run_program(instructions, bytes(no_worker.serialize())) == HASH_FALLBACK
+    legacy = QUICPacket(QUICProtocol.START_CONNECTION_FLAG, 0x1201, 0, []).serialize_legacy()
+    assert run_program(instructions, legacy) == HASH_FALLBACK
+
+
+@pytest.mark.parametrize('worker_index', [0, 1, 254])
+def test_new_connection_id_holds_the_worker_byte(worker_index, monkeypatch):
+    endpoint = QUICServerEndpoint(None, worker_index=worker_index)
+    for _ in range(1000):
+        connection_id = endpoint.new_connection_id()
+        assert connection_id & 0xff == worker_index + 1
+        assert 0 < connection_id <= MAX_CONNECTION_ID
+
+    # The extremes of the random range
+    for pick in (min, max):
+        monkeypatch.setattr(random, 'randint', lambda low, high: pick(low, high))
+        connection_id = endpoint.new_connection_id()
+        assert connection_id & 0xff == worker_index + 1
+        assert 0 < connection_id <= MAX_CONNECTION_ID
+
+
+def test_new_connection_id_is_never_zero_unsharded(monkeypatch):
+    endpoint = QUICServerEndpoint(None)
+    monkeypatch.setattr(random, 'randint', lambda low, high: low)
+    assert endpoint.new_connection_id() != 0